@@ -0,0 +1,63 @@
+"""Measures exporting a process in several formats with one walk (exporters.walk_process), compared with
+one walk per format
+
+For every set of formats the combined walk should cost about the sum of the single formats minus the
+walk itself, so each additional format only adds the time of its own output.
+Usage (from parser/yaml_combine):
+    python -m benchmarks.export_benchmark [--sizes 1000 10000 50000] [--repeat 3]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser
+from yaml2bpmn_converter.exporters import ModelVisitor, create_exporter, walk_process
+from yaml2bpmn_converter.layout import layout_process
+from benchmarks.xml_writer_benchmark import synthetic_playbook
+
+FORMAT_SETS = [["bpmn"], ["mermaid"], ["dot"], ["bpmn", "mermaid"], ["bpmn", "mermaid", "dot"]]
+
+def best_time(function, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+def measure(task_count: int, repeat: int) -> list[dict]:
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(synthetic_playbook(task_count))
+    layout = layout_process(bpmn_process)
+
+    def walk(formats):
+        walk_process(bpmn_process, [create_exporter(export_format, io.StringIO(), layout) for export_format in formats])
+
+    walk_seconds = best_time(lambda: walk_process(bpmn_process, [ModelVisitor()]), repeat)
+    single = {export_format: best_time(lambda: walk([export_format]), repeat)
+              for export_format in {export_format for formats in FORMAT_SETS for export_format in formats}}
+    results = []
+    for formats in FORMAT_SETS:
+        results.append({"formats": "+".join(formats), "tasks": task_count, "walk": walk_seconds,
+                        "combined": best_time(lambda: walk(formats), repeat),
+                        "separate": sum(single[export_format] for export_format in formats)})
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="number of tasks per process")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per measurement, the fastest one is kept")
+    arguments = parser.parse_args(argv)
+
+    print(f"{'formats':>18} {'tasks':>8} {'walk':>8} {'combined':>9} {'separate':>9}")
+    for task_count in arguments.sizes:
+        for result in measure(task_count, arguments.repeat):
+            print(f"{result['formats']:>18} {result['tasks']:>8} {result['walk']:>8.3f} {result['combined']:>9.3f} "
+                  f"{result['separate']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
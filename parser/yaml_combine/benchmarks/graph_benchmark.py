@@ -0,0 +1,70 @@
+"""Measures building the adjacency index (process_graph.ProcessGraph) and running all graph queries on it
+
+"nested" processes group the tasks into subprocesses of 50 tasks, "flat" processes put all tasks
+into one subprocess, so a single graph has all elements. "branched" processes are flat, with gateways
+every 10 tasks whose second branch jumps ahead, so the post-dominators have to join branches.
+Usage (from parser/yaml_combine):
+    python -m benchmarks.graph_benchmark [--sizes 1000 10000 50000] [--repeat 3]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser
+from yaml2bpmn_converter.bpmn_object_models import BPMNSubProcess
+from yaml2bpmn_converter.process_graph import GRAPH_ISSUE_KINDS, find_graph_issues
+from benchmarks.xml_writer_benchmark import synthetic_playbook
+
+SHAPES = ["nested", "flat", "branched"]
+
+def branched_playbook(task_count: int) -> dict:
+    '''One subprocess with a chain of tasks, every 10th activity is a gateway which can skip the next 5 tasks'''
+    activities = {}
+    for number in range(task_count):
+        following = f"task_{number + 1}" if number < task_count - 1 else None
+        if number % 10 == 9 and number + 6 < task_count:
+            activities[f"task_{number}"] = {"type": "xgw", "goto": [{"if": "skip", "then": f"task_{number + 6}"},
+                                                                    {"if": "continue", "then": following}]}
+        else:
+            activities[f"task_{number}"] = {"type": "manual", **({"goto": following} if following else {})}
+    return {"process": f"branched_{task_count}",
+            "activities": {"subprocess": {"type": "sub", "activities": activities}}}
+
+def measure(shape: str, task_count: int, repeat: int) -> dict:
+    if shape == "branched":
+        playbook = branched_playbook(task_count)
+    else:
+        playbook = synthetic_playbook(task_count, 50 if shape == "nested" else task_count)
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(playbook)
+    containers = [bpmn_process] + [element for element in bpmn_process.flow_elements if isinstance(element, BPMNSubProcess)]
+    best = None
+    for _ in range(repeat):
+        for container in containers:
+            container.invalidate_graph()
+        start = time.perf_counter()
+        issues = find_graph_issues(bpmn_process, "benchmark", kinds=GRAPH_ISSUE_KINDS)
+        depth = max(container.graph().longest_path_depth() for container in containers)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    elements = sum(len(container.flow_elements) for container in containers)
+    return {"shape": shape, "tasks": task_count, "elements": elements, "issues": len(issues), "depth": depth,
+            "seconds": best}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="number of tasks per process")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per size, the fastest one is kept")
+    arguments = parser.parse_args(argv)
+
+    print(f"{'shape':>8} {'tasks':>8} {'elements':>9} {'issues':>7} {'depth':>7} {'seconds':>9}")
+    for shape in SHAPES:
+        for task_count in arguments.sizes:
+            result = measure(shape, task_count, arguments.repeat)
+            print(f"{shape:>8} {task_count:>8} {result['elements']:>9} {result['issues']:>7} {result['depth']:>7} "
+                  f"{result['seconds']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
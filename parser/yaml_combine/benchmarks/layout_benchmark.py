@@ -0,0 +1,45 @@
+"""Measures the time of the diagram layout (layout.layout_process)
+
+"nested" processes group the tasks into subprocesses of 50 tasks, "flat" processes put all tasks
+into one subprocess, so a single container has to be laid out with all its elements.
+Usage (from parser/yaml_combine):
+    python -m benchmarks.layout_benchmark [--sizes 1000 5000 20000] [--repeat 3]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser
+from yaml2bpmn_converter.layout import layout_process
+from benchmarks.xml_writer_benchmark import synthetic_playbook
+
+SHAPES = ["nested", "flat"]
+
+def measure(shape: str, task_count: int, repeat: int) -> dict:
+    tasks_per_subprocess = 50 if shape == "nested" else task_count
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(synthetic_playbook(task_count, tasks_per_subprocess))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        diagram = layout_process(bpmn_process)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return {"shape": shape, "tasks": task_count, "shapes": len(diagram.shapes), "edges": len(diagram.edges), "seconds": best}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000], help="number of tasks per process")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per size, the fastest one is kept")
+    arguments = parser.parse_args(argv)
+
+    print(f"{'shape':>7} {'tasks':>8} {'shapes':>8} {'edges':>8} {'seconds':>9}")
+    for shape in SHAPES:
+        for task_count in arguments.sizes:
+            result = measure(shape, task_count, arguments.repeat)
+            print(f"{shape:>7} {task_count:>8} {result['shapes']:>8} {result['edges']:>8} {result['seconds']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
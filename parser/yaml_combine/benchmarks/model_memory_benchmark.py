@@ -0,0 +1,58 @@
+"""Measures the memory used by the BPMN model graph with tracemalloc
+
+Builds synthetic processes with yaml_parser and reports the traced bytes per flow element
+(including its share of the sequence flows). Run it on two versions of the model to compare them.
+Usage (from parser/yaml_combine):
+    python -m benchmarks.model_memory_benchmark [--sizes 1000 10000 50000]
+"""
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser
+from yaml2bpmn_converter.bpmn_object_models import BPMNSubProcess
+from benchmarks.xml_writer_benchmark import synthetic_playbook
+
+def count_elements(container) -> tuple[int, int]:
+    flow_elements, sequence_flows = 0, 0
+    containers = [container]
+    while containers:
+        container = containers.pop()
+        flow_elements += len(container.flow_elements)
+        sequence_flows += len(container.sequence_flows)
+        containers.extend(x for x in container.flow_elements if isinstance(x, BPMNSubProcess))
+    return flow_elements, sequence_flows
+
+def measure(task_count: int) -> dict:
+    playbook = synthetic_playbook(task_count)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(playbook)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    model_bytes = sum(x.size_diff for x in after.compare_to(before, "filename"))
+    flow_elements, sequence_flows = count_elements(bpmn_process)
+    return {
+        "tasks": task_count,
+        "flow_elements": flow_elements,
+        "sequence_flows": sequence_flows,
+        "model_kib": model_bytes // 1024,
+        "bytes_per_element": model_bytes / flow_elements
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="number of tasks per process")
+    arguments = parser.parse_args(argv)
+
+    print(f"{'tasks':>8} {'elements':>9} {'flows':>8} {'model KiB':>10} {'bytes/element':>14}")
+    for task_count in arguments.sizes:
+        result = measure(task_count)
+        print(f"{result['tasks']:>8} {result['flow_elements']:>9} {result['sequence_flows']:>8} "
+              f"{result['model_kib']:>10} {result['bytes_per_element']:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Generates synthetic playbook trees for benchmarks
+
+The generated tree has the same layout as the playbooks directory:
+    <directory>/<playbook>/<phase>/<playbook file>.yml
+    <directory>/<playbook>/<phase>/modules/<module>.yml
+    <directory>/05_documentation/modules/<module>.yml
+Usage (from parser/yaml_combine):
+    python -m benchmarks.playbook_generator OUTPUT_DIRECTORY [--depth 3 --width 6 ...]
+"""
+import os
+import sys
+import random
+import argparse
+
+import yaml
+
+SHARED_MODULE_DIRECTORY = os.path.join("05_documentation", "modules")
+
+class GeneratorConfig:
+    """Shape of the generated playbooks"""
+    def __init__(self, playbooks: int = 2, phases: int = 2, depth: int = 2, width: int = 5,
+                 gateway_density: float = 0.2, intimer_ratio: float = 0.1, send_ratio: float = 0.2,
+                 module_ratio: float = 0.5, module_count: int = 10, module_size: int = 5,
+                 shared_module_ratio: float = 0.5, seed: int = 0):
+        '''
+        :param playbooks: number of playbook directories
+        :param phases: number of phases (each with one playbook file) per playbook directory
+        :param depth: nesting depth of subprocesses below the top level
+        :param width: number of activities per activities block
+        :param gateway_density: probability that an activity is an exclusive gateway branching to its siblings
+        :param intimer_ratio: probability that a task is a timer event
+        :param send_ratio: probability that a task is a send task
+        :param module_ratio: probability that a leaf task references a module (module fan-out)
+        :param module_count: number of distinct modules. Fewer modules mean more reuse of each module
+        :param module_size: number of activities per module
+        :param shared_module_ratio: share of the modules placed in 05_documentation instead of the phase directory
+        :param seed: seed of the random generator, the same config always generates the same tree
+        '''
+        self.playbooks = playbooks
+        self.phases = phases
+        self.depth = depth
+        self.width = width
+        self.gateway_density = gateway_density
+        self.intimer_ratio = intimer_ratio
+        self.send_ratio = send_ratio
+        self.module_ratio = module_ratio
+        self.module_count = module_count
+        self.module_size = module_size
+        self.shared_module_ratio = shared_module_ratio
+        self.seed = seed
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+def _task_type(config: GeneratorConfig, rng: random.Random) -> str:
+    value = rng.random()
+    if value < config.intimer_ratio:
+        return "intimer"
+    if value < config.intimer_ratio + config.send_ratio:
+        return "send"
+    return rng.choice(["manual", "human"])
+
+def generate_activities(config: GeneratorConfig, rng: random.Random, depth: int, width: int,
+                        module_names: list[str], prefix: str) -> dict:
+    '''
+    Generates one activities block. Activities are chained by goto, gateways branch to
+    later siblings, and activities above the lowest level become subprocesses.
+    '''
+    names = [f"{prefix}_{number}" for number in range(width)]
+    activities = {}
+    for number, name in enumerate(names):
+        if depth > 0 and rng.random() >= config.gateway_density:
+            activities[name] = {
+                "type": "sub",
+                "activities": generate_activities(config, rng, depth - 1, width, module_names, name)
+            }
+        elif number < width - 2 and rng.random() < config.gateway_density:
+            activities[name] = {
+                "type": "xgw",
+                "goto": [
+                    {"if": f"{name} = true", "then": names[number + 1]},
+                    {"if": f"{name} = false", "then": names[rng.randint(number + 1, width - 1)]},
+                    {"if": f"{name} = undefined"}
+                ]
+            }
+            continue
+        else:
+            unused_module_names = [x for x in module_names if x not in activities]
+            if unused_module_names and rng.random() < config.module_ratio:
+                # the task name references a module, it becomes a subprocess when the modules are inlined
+                name = rng.choice(unused_module_names)
+            activities[name] = {"type": _task_type(config, rng)}
+        if number < width - 1 and rng.random() < 0.5:
+            activities[name]["goto"] = names[number + 1]
+    # module names replace generated names, drop gotos pointing to names that don't exist
+    for activity in activities.values():
+        if isinstance(activity.get("goto"), str) and activity["goto"] not in activities:
+            del activity["goto"]
+        elif isinstance(activity.get("goto"), list):
+            activity["goto"] = [x for x in activity["goto"] if "then" not in x or x["then"] in activities]
+    return activities
+
+def generate_module(config: GeneratorConfig, rng: random.Random, name: str) -> dict:
+    return {"activities": generate_activities(config, rng, 0, config.module_size, [], name)}
+
+def generate_playbook_tree(directory: str, config: GeneratorConfig = None) -> list[tuple[str, str]]:
+    '''
+    Writes a synthetic playbook tree
+
+    :param directory: target directory, takes the role of the playbooks directory
+    :param config: shape of the playbooks
+    :return: list of (playbook_phase, playbook_file) tuples of the generated playbooks
+    '''
+    config = config or GeneratorConfig()
+    rng = random.Random(config.seed)
+    module_names = [f"module_{number}" for number in range(config.module_count)]
+    shared_module_count = int(len(module_names) * config.shared_module_ratio)
+
+    shared_module_directory = os.path.join(directory, SHARED_MODULE_DIRECTORY)
+    os.makedirs(shared_module_directory, exist_ok=True)
+    for name in module_names[:shared_module_count]:
+        _write_yaml(os.path.join(shared_module_directory, name + ".yml"), generate_module(config, rng, name))
+
+    playbooks = []
+    for playbook_number in range(config.playbooks):
+        for phase_number in range(config.phases):
+            playbook_phase = os.path.join(directory, f"playbook_{playbook_number}", f"{phase_number + 1}_phase")
+            os.makedirs(os.path.join(playbook_phase, "modules"), exist_ok=True)
+            for name in module_names[shared_module_count:]:
+                _write_yaml(os.path.join(playbook_phase, "modules", name + ".yml"), generate_module(config, rng, name))
+
+            process_name = f"playbook_{playbook_number}_phase_{phase_number + 1}"
+            playbook_file = os.path.join(playbook_phase, process_name + ".yml")
+            _write_yaml(playbook_file, {
+                "process": process_name,
+                "activities": generate_activities(config, rng, config.depth, config.width, module_names, "activity")
+            })
+            playbooks.append((playbook_phase, playbook_file))
+    return playbooks
+
+def _write_yaml(path: str, data: dict):
+    with open(path, "w") as f:
+        yaml.safe_dump(data, f, default_flow_style=False, sort_keys=False)
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    defaults = GeneratorConfig()
+    for name, value in defaults.to_dict().items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value, dest=name)
+
+def config_from_arguments(arguments: argparse.Namespace) -> GeneratorConfig:
+    return GeneratorConfig(**{name: getattr(arguments, name) for name in GeneratorConfig().to_dict()})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="output directory")
+    add_config_arguments(parser)
+    arguments = parser.parse_args(argv)
+    playbooks = generate_playbook_tree(arguments.directory, config_from_arguments(arguments))
+    print(f"generated {len(playbooks)} playbook files in {arguments.directory}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
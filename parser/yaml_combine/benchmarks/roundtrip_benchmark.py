@@ -0,0 +1,91 @@
+"""Round trip of BPMN files through the importer (bpmn_importer) and the converter
+
+Every BPMN file is imported into a playbook, which is converted into BPMN again. The result has to be
+identical to the original file. Files written by the converter contain numbered activity names, these
+numbers are stripped by the importer and added again by the conversion.
+The synthetic processes (see xml_writer_benchmark) also measure the import time and memory.
+Usage (from parser/yaml_combine):
+    python -m benchmarks.roundtrip_benchmark [--sizes 1000 10000 50000] [--file BPMN_FILE ...]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser, xml_generator, bpmn_importer
+from yaml2bpmn_converter.combiner import add_counter_to_activities
+from yaml2bpmn_converter.layout import layout_process
+from benchmarks.xml_writer_benchmark import synthetic_playbook
+
+BUNDLED_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "output", "bpmn", "investigate_malware.bpmn")
+
+def convert(playbook: dict, numbered: bool, layout: bool) -> str:
+    '''Converts a playbook like the combiner does, numbered: add the numbers to the activity names'''
+    context = yaml_parser.ConversionContext()
+    if numbered:
+        add_counter_to_activities(playbook, context)
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(playbook, context)
+    stream = io.StringIO()
+    xml_generator.write_bpmn_xml(bpmn_process, stream, layout=layout_process(bpmn_process) if layout else None)
+    return stream.getvalue()
+
+def roundtrip(bpmn_file: str, numbered: bool = True) -> bool:
+    '''Imports a BPMN file and converts the playbooks again, True if the result is identical to the file'''
+    with open(bpmn_file, encoding="utf-8") as f:
+        original = f.read()
+    layout = "<bpmndi:BPMNShape" in original
+    playbooks = bpmn_importer.import_bpmn_file(bpmn_file, strip_counters=numbered)
+    return len(playbooks) == 1 and convert(playbooks[0], numbered, layout) == original
+
+def measure(task_count: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        bpmn_file = os.path.join(directory, "synthetic.bpmn")
+        with open(bpmn_file, "w", encoding="utf-8") as f:
+            f.write(convert(synthetic_playbook(task_count), numbered=False, layout=True))
+        tracemalloc.start()
+        start = time.perf_counter()
+        playbooks = bpmn_importer.import_bpmn_file(bpmn_file, strip_counters=False)
+        duration = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        identical = roundtrip(bpmn_file, numbered=False)
+        file_size = os.path.getsize(bpmn_file)
+    return {
+        "tasks": task_count,
+        "seconds": duration,
+        "file_kib": file_size // 1024,
+        "peak_kib": peak // 1024,
+        "identical": identical and len(playbooks) == 1
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 50000], help="number of tasks per process")
+    parser.add_argument("--file", dest="files", nargs="+", default=[BUNDLED_FILE], metavar="BPMN_FILE",
+                        help="BPMN files written by the converter (default: the bundled investigate_malware.bpmn)")
+    arguments = parser.parse_args(argv)
+
+    failed = 0
+    for bpmn_file in arguments.files:
+        identical = roundtrip(bpmn_file)
+        failed += not identical
+        print(f"{os.path.basename(bpmn_file)}: round trip identical: {identical}")
+
+    if arguments.sizes:
+        # the import holds the model of the process, the peak shows that the xml tree isn't kept besides it
+        print(f"{'tasks':>8} {'seconds':>9} {'file KiB':>9} {'peak KiB':>9} {'identical':>10}")
+    for task_count in arguments.sizes:
+        result = measure(task_count)
+        failed += not result["identical"]
+        print(f"{task_count:>8} {result['seconds']:>9.3f} {result['file_kib']:>9} {result['peak_kib']:>9} "
+              f"{str(result['identical']):>10}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
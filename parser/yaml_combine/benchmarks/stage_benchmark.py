@@ -0,0 +1,171 @@
+"""Times every stage of the converter on synthetic playbook trees
+
+Stages: load_yaml_file, process_playbook, validate_playbook, add_counter_to_activities,
+parse_playbook_to_bpmn_representation, layout_process and generate_bpmn_xml.
+Each scale generates a playbook tree (see playbook_generator) with the given width, converts all
+playbooks --repeat times and keeps the fastest time of every stage.
+Usage (from parser/yaml_combine):
+    python -m benchmarks.stage_benchmark run --widths 4 6 8 --output results.json
+    python -m benchmarks.stage_benchmark compare baseline.json results.json [--threshold 0.1]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import combiner, yaml_parser, xml_generator
+from yaml2bpmn_converter.module_index import ModuleIndex
+from yaml2bpmn_converter.yaml_loader import YamlLoader
+from yaml2bpmn_converter.layout import layout_process
+from yaml2bpmn_converter.validator import validate_playbook
+from benchmarks.playbook_generator import (
+    SHARED_MODULE_DIRECTORY, add_config_arguments, config_from_arguments, generate_playbook_tree
+)
+
+STAGES = [
+    "load_yaml_file",
+    "process_playbook",
+    "validate_playbook",
+    "add_counter_to_activities",
+    "parse_playbook_to_bpmn_representation",
+    "layout_process",
+    "generate_bpmn_xml"
+]
+
+def count_activities(activities: dict) -> int:
+    count = 0
+    blocks = [activities]
+    while blocks:
+        block = blocks.pop()
+        for activity in block.values():
+            count += 1
+            if isinstance(activity, dict) and isinstance(activity.get("activities"), dict):
+                blocks.append(activity["activities"])
+    return count
+
+def run_stages(playbooks: list[tuple[str, str]], shared_module_directory: str) -> tuple[dict, dict]:
+    '''
+    Converts all playbooks once and measures every stage separately
+
+    :return: (stage -> seconds, counters of the converted data)
+    '''
+    timings = dict.fromkeys(STAGES, 0.0)
+    counters = {"playbooks": len(playbooks), "activities": 0, "xml_bytes": 0}
+    yaml_loader = YamlLoader()
+    module_index = ModuleIndex(yaml_loader.load, [shared_module_directory])
+    for playbook_phase, playbook_file in playbooks:
+        start = time.perf_counter()
+        playbook_yaml = combiner.load_yaml_file(playbook_file, yaml_loader)
+        loaded = time.perf_counter()
+        combiner.process_playbook(playbook_yaml, playbook_phase, module_index)
+        processed = time.perf_counter()
+        validate_playbook(playbook_yaml, playbook_file)
+        validated = time.perf_counter()
+        context = yaml_parser.ConversionContext()
+        combiner.add_counter_to_activities(playbook_yaml, context)
+        numbered = time.perf_counter()
+        bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(playbook_yaml, context)
+        parsed = time.perf_counter()
+        diagram_layout = layout_process(bpmn_process)
+        laid_out = time.perf_counter()
+        bpmn_xml = xml_generator.generate_bpmn_xml(bpmn_process, diagram_layout)
+        generated = time.perf_counter()
+
+        timings["load_yaml_file"] += loaded - start
+        timings["process_playbook"] += processed - loaded
+        timings["validate_playbook"] += validated - processed
+        timings["add_counter_to_activities"] += numbered - validated
+        timings["parse_playbook_to_bpmn_representation"] += parsed - numbered
+        timings["layout_process"] += laid_out - parsed
+        timings["generate_bpmn_xml"] += generated - laid_out
+        counters["activities"] += count_activities(playbook_yaml.get("activities", {}))
+        counters["xml_bytes"] += len(bpmn_xml)
+    return timings, counters
+
+def benchmark_scale(config, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        playbooks = generate_playbook_tree(directory, config)
+        best = None
+        for _ in range(repeat):
+            timings, counters = run_stages(playbooks, os.path.join(directory, SHARED_MODULE_DIRECTORY))
+            best = timings if best is None else {stage: min(best[stage], timings[stage]) for stage in STAGES}
+    return {"config": config.to_dict(), "counters": counters, "stages": best, "total": sum(best.values())}
+
+def run(arguments) -> dict:
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": arguments.repeat,
+        "scales": []
+    }
+    print(f"{'width':>6} {'activities':>11} " + " ".join(f"{stage[:14]:>14}" for stage in STAGES) + f" {'total':>8}")
+    for width in arguments.widths:
+        arguments.width = width
+        scale = benchmark_scale(config_from_arguments(arguments), arguments.repeat)
+        results["scales"].append(scale)
+        print(f"{width:>6} {scale['counters']['activities']:>11} "
+              + " ".join(f"{scale['stages'][stage]:>14.4f}" for stage in STAGES) + f" {scale['total']:>8.4f}")
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(results, f, indent=1)
+    return results
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    '''
+    Compares the stage timings of two result files scale by scale
+
+    :return: list of regressions, a stage regresses if it got slower by more than threshold (relative)
+    '''
+    regressions = []
+    for baseline_scale, current_scale in zip(baseline["scales"], current["scales"]):
+        if baseline_scale["config"] != current_scale["config"]:
+            regressions.append(f"width {current_scale['config']['width']}: configs differ, results aren't comparable")
+            continue
+        for stage in STAGES + ["total"]:
+            if stage != "total" and (stage not in baseline_scale["stages"] or stage not in current_scale["stages"]):
+                continue  # result files of versions measuring other stages
+            before = baseline_scale["total"] if stage == "total" else baseline_scale["stages"][stage]
+            after = current_scale["total"] if stage == "total" else current_scale["stages"][stage]
+            change = (after - before) / before if before else 0.0
+            marker = "REGRESSION" if change > threshold else ""
+            print(f"width {current_scale['config']['width']:>4} {stage:>38} {before:>9.4f} -> {after:>9.4f} {change:>+8.1%} {marker}")
+            if marker:
+                regressions.append(f"width {current_scale['config']['width']}: {stage} {change:+.1%}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmark")
+    add_config_arguments(run_parser)
+    run_parser.add_argument("--widths", type=int, nargs="+", default=[4, 6, 8], help="activities per block, one scale per width")
+    run_parser.add_argument("--repeat", type=int, default=3, help="repetitions per scale, the fastest one is kept")
+    run_parser.add_argument("--output", help="json file for the results")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as regression (default: 0.1)")
+
+    arguments = parser.parse_args(argv)
+    if arguments.command == "run":
+        run(arguments)
+        return
+
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)
+    with open(arguments.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, arguments.threshold)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
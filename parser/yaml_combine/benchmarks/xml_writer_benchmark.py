@@ -0,0 +1,102 @@
+"""Compares the ElementTree based generate_bpmn_xml with the streaming write_bpmn_xml
+
+Every measurement runs in a fresh interpreter, so the peak RSS of one writer doesn't hide the other one.
+Usage (from parser/yaml_combine):
+    python -m benchmarks.xml_writer_benchmark [--sizes 1000 10000 50000]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser, xml_generator
+
+WRITERS = ["tree", "stream"]
+
+def synthetic_playbook(task_count: int, tasks_per_subprocess: int = 50) -> dict:
+    '''
+    Creates a playbook with task_count tasks, grouped into subprocesses.
+    Each subprocess is a chain of tasks with one exclusive gateway, so the process contains
+    conditional and unconditional sequence flows.
+    '''
+    activities = {}
+    for subprocess_number in range(max(1, task_count // tasks_per_subprocess)):
+        inner_activities = {}
+        for task_number in range(tasks_per_subprocess - 1):
+            inner_activities[f"task_{subprocess_number}_{task_number}"] = {
+                "type": ["manual", "human", "send"][task_number % 3],
+                "goto": f"task_{subprocess_number}_{task_number + 1}" if task_number < tasks_per_subprocess - 2 else f"gateway_{subprocess_number}"
+            }
+        inner_activities[f"gateway_{subprocess_number}"] = {
+            "type": "xgw",
+            "goto": [
+                {"if": "result = ok", "then": f"task_{subprocess_number}_0"},
+                {"if": "result = failed"}
+            ]
+        }
+        activities[f"subprocess_{subprocess_number}"] = {"type": "sub", "activities": inner_activities}
+    return {"process": f"synthetic_{task_count}", "activities": activities}
+
+def max_rss_kib() -> int:
+    # ru_maxrss is KiB on linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+def measure(writer: str, task_count: int) -> dict:
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(synthetic_playbook(task_count))
+    rss_before = max_rss_kib()
+    with tempfile.TemporaryDirectory() as directory:
+        output_file = os.path.join(directory, "output.bpmn")
+        start = time.perf_counter()
+        with open(output_file, "w") as f:
+            if writer == "tree":
+                f.write(xml_generator.generate_bpmn_xml(bpmn_process))
+            else:
+                xml_generator.write_bpmn_xml(bpmn_process, f)
+        duration = time.perf_counter() - start
+        output_size = os.path.getsize(output_file)
+    return {
+        "writer": writer,
+        "tasks": task_count,
+        "seconds": duration,
+        "output_kib": output_size // 1024,
+        "peak_rss_increase_kib": max_rss_kib() - rss_before
+    }
+
+def check_identical(task_count: int) -> bool:
+    import io
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(synthetic_playbook(task_count))
+    stream = io.StringIO()
+    xml_generator.write_bpmn_xml(bpmn_process, stream)
+    return stream.getvalue() == xml_generator.generate_bpmn_xml(bpmn_process)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="number of tasks per process")
+    parser.add_argument("--writer", choices=WRITERS, help=argparse.SUPPRESS)  # used for the measurement subprocesses
+    arguments = parser.parse_args(argv)
+
+    if arguments.writer:
+        result = measure(arguments.writer, arguments.sizes[0])
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+        return
+
+    print(f"output identical: {check_identical(min(arguments.sizes))}")
+    print(f"{'tasks':>8} {'writer':>7} {'seconds':>9} {'output KiB':>11} {'peak RSS +KiB':>14}")
+    for task_count in arguments.sizes:
+        for writer in WRITERS:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.xml_writer_benchmark", "--writer", writer, "--sizes", str(task_count)],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = dict(x.split("=", 1) for x in output.split())
+            print(f"{task_count:>8} {writer:>7} {float(result['seconds']):>9.3f} {result['output_kib']:>11} {result['peak_rss_increase_kib']:>14}")
+
+if __name__ == "__main__":
+    main()
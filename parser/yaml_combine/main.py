@@ -1,242 +1,410 @@
 import os
 import sys
+import json
+import time
+import queue
+import argparse
 
-import yaml
 import logging
-
-from yaml2bpmn_converter import yaml_parser, xml_generator
+import logging.handlers
+
+from yaml2bpmn_converter import combiner
+from yaml2bpmn_converter.combiner import ConversionResult, check_playbook, convert_playbooks
+from yaml2bpmn_converter.validator import ERROR
+from yaml2bpmn_converter.module_index import ModuleIndex, DEFAULT_MAX_MODULE_DEPTH
+from yaml2bpmn_converter.build_manifest import BuildManifest, compute_converter_hash
+from yaml2bpmn_converter.yaml_loader import YamlLoader
+from yaml2bpmn_converter.profiling import StageProfiler, NULL_PROFILER
+from yaml2bpmn_converter.file_watcher import create_watcher, wait_for_changes
+from yaml2bpmn_converter.output_sinks import OUTPUT_FORMATS, OutputSink, DirectorySink, create_sink
+from yaml2bpmn_converter.pipeline import ConversionPipeline, DEFAULT_PREFETCH_THREADS, DEFAULT_QUEUE_SIZE
+from yaml2bpmn_converter.combined_ir import IR_FILE_EXTENSION, CombinedPlaybook, save_ir, dump_combined_yaml
+from yaml2bpmn_converter.discovery import DiscoveryRules, PlaybookTreeSnapshot, discover_playbooks, load_rules
+from yaml2bpmn_converter.exporters import EXPORT_FORMATS
 
 logger = logging.getLogger(__name__)
 
 START_DIRECTORY = "../../playbooks" # Directory to start searching playbooks
 OUTPUT_DIRECTORY = "parser/yaml_combine/output"       # Output directory, where combined files will be stored
 BPMN_OUTPUT_DIRECTORY = "parser/yaml_combine/output/bpmn"
-
-activity_counter: int = 0 # Global variable for counting activities (more infos see "add_counter_to_activities" function)
-
-def list_directory(dir:str):
+IR_OUTPUT_DIRECTORY = "parser/yaml_combine/output/ir"  # combined playbooks in binary form (--save-ir)
+MANIFEST_FILE = "parser/yaml_combine/output/.build-manifest.json"  # Dependencies of the BPMN files for incremental builds
+# Include and exclude rules of the playbook discovery, see yaml2bpmn_converter/discovery.py
+DISCOVERY_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "playbook_discovery.yml")
+BUNDLE_FILES = {"tar": "parser/yaml_combine/output/bpmn.tar", "zip": "parser/yaml_combine/output/bpmn.zip"}
+# Module locations shared by all playbooks, searched after the "modules" directory of the playbook phase
+SHARED_MODULE_DIRECTORIES = [
+    "../../playbooks/05_documentation",
+    "../../playbooks/05_documentation/modules"
+]
+
+def find_playbook_files(rules: DiscoveryRules, start_directory: str = START_DIRECTORY) -> PlaybookTreeSnapshot:
     '''
-    Lists all directories and files within on directory
-    The files and directories are split into two separate lists
+    Searches all playbook files in the playbooks directory, see discovery.discover_playbooks
 
-    :param dir: expects an existing directory
-    :return: (list,list)
-        dirs: Subdirctorys within the defined directory
-        files: files within the defined directory
-    '''
-    dirs = []
-    files = []
-    for entry in os.listdir(dir):
-        full_path = os.path.join(dir, entry)
-        if os.path.isdir(full_path):
-            dirs.append(full_path)
-        if os.path.isfile(full_path):
-            files.append(full_path)
-    return dirs, files
-
-def get_activities(obj:dict):
+    :param rules: include and exclude rules, loaded from DISCOVERY_CONFIG or --discovery-config
+    :param start_directory: directory containing the playbook directories
+    :return: snapshot of the playbook files, snapshot.playbooks() are the (playbook_phase, playbook_file) tuples
+        in processing order
     '''
-    extracts all activities on the highest level of a data structure
-    in case the dict has a key "activities"
-
-    :param obj: complex data structure which has at least a dict in the highest level of the data structure
-    :return: List of all direct members of the activity Key
+    snapshot = discover_playbooks(start_directory, rules)
+    logger.info("[+] Found %d playbook file(s) in %d directories (%.1f ms)", len(snapshot), snapshot.directories,
+                snapshot.elapsed * 1000)
+    return snapshot
+
+def converter_source_files():
+    """Source files of the converter, used to compute the converter hash of the build manifest"""
+    converter_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "yaml2bpmn_converter")
+    return [os.path.abspath(__file__)] + [
+        os.path.join(converter_directory, x) for x in os.listdir(converter_directory) if x.endswith(".py")
+    ]
+
+def select_stale_playbooks(playbooks: list[tuple[str, str]], manifest: BuildManifest, module_index: ModuleIndex):
     '''
-    if not "activities" in obj.keys():
-        return []
-    return [x for x in obj["activities"].keys()]
+    Splits the playbooks into the ones which have to be converted and the ones whose output is still up to date
 
-def get_activitie_object_type(activity_obj):
+    :return: (list of playbooks to convert, list of skipped playbooks)
     '''
-    Identifies the general type, of an activity element
-
-    :param activity_obj:
-    :return: one of the following strings (task, gateway, event, subprocess) depending on what kind of BPMN Object the activity represents
-        or an empty string if no type could be identified
+    playbook_files = [playbook_file for playbook_phase, playbook_file in playbooks]
+    manifest.forget_missing_playbooks(playbook_files)
+    stale_playbooks = manifest.stale_playbooks(playbook_files, manifest.changed_files())
+
+    to_convert, skipped = [], []
+    for playbook_phase, playbook_file in playbooks:
+        if manifest.is_up_to_date(playbook_file, stale_playbooks, BPMN_OUTPUT_DIRECTORY,
+                                  lambda module_name: module_index.find_module_files(module_name, playbook_phase)):
+            skipped.append((playbook_phase, playbook_file))
+        else:
+            to_convert.append((playbook_phase, playbook_file))
+    return to_convert, skipped
+
+def build_playbooks(playbooks: list[tuple[str, str]], jobs: int, manifest: BuildManifest, module_index: ModuleIndex,
+                    yaml_loader: YamlLoader, profiler: StageProfiler = NULL_PROFILER,
+                    layout: bool = True, sink: OutputSink = None,
+                    pipeline: ConversionPipeline = None, save_combined_ir: bool = False,
+                    combined_yaml: bool = False, export_formats: tuple[str, ...] = ()) -> list[ConversionResult]:
     '''
-    if not "type" in activity_obj.keys():
-        return ""
-    type = activity_obj["type"]
-    if type in ["human", "manual", "busin", "call", "send", "receive", "script", "serv", "task"]:
-        return "task"
-    if type in ["xgw", "pgw", "igw"]:
-        return "gateway"
-    if type in ["insthrow", "inscatch", "inmthrow", "inmcatch", "intimer", "inescal"]:
-        return "event"
-    if type in ["sub"]:
-        return "subprocess"
-
-    return ""
-
-def add_counter_to_activities(obj):
+    Converts the playbooks, writes their BPMN files and records them in the manifest
+
+    :param layout: add the diagram (BPMNDI shapes and edges) to the BPMN files
+    :param sink: receives the BPMN files, by default they are written into the BPMN output directory
+    :param pipeline: converts the playbooks with overlapping read, convert and write stages instead
+        (jobs, layout and sink are taken from the pipeline, which has to keep the combined playbooks
+        if they are saved)
+    :param save_combined_ir: save the combined playbooks and their BPMN models into the IR output directory
+    :param combined_yaml: write the combined playbooks as yaml files into the output directory
+    :param export_formats: formats written into the sink besides the BPMN files, e.g. mermaid and dot
+        (taken from the pipeline as well)
+    :return: results of the failed conversions
     '''
-    This functions replaces the keys of all activities within data structure a by a version with an _<counting_number> at the end of the name
-    e.g. original key name: "quarantine_device" new key name "quarantine_device_42"
-    So each of the activites has a unique number within the final document
-    This is replacement is required to eliminate duplicates in the resulting data structure,
-    because BPMNator is not able to handle duplicate activity names
-
-    :param obj: a complex data structure which is a dict on its toplevel. The function will actively modify the data in this data structure.
-    :return: None
+    def record(result: ConversionResult):
+        if result.error:
+            # a failed playbook has to be converted again in the next run, even if it doesn't change
+            manifest.forget_playbook(result.playbook_file)
+            return
+        manifest.record(result.playbook_file, result.process_name+".bpmn", result.module_lookups)
+        if save_combined_ir:
+            with profiler.stage("save_ir", result.playbook_file):
+                save_ir(os.path.join(IR_OUTPUT_DIRECTORY, result.process_name + IR_FILE_EXTENSION),
+                        CombinedPlaybook(result.playbook_file, result.process_name, result.combined_playbook,
+                                         result.original_names, result.bpmn_process))
+        if combined_yaml:
+            with profiler.stage("dump_combined_yaml", result.playbook_file):
+                with open(os.path.join(OUTPUT_DIRECTORY, result.process_name+".yml"), "w", encoding="utf-8") as f:
+                    dump_combined_yaml(result.combined_playbook, f)
+            logger.info("[+] Created combined file: \"%s\"", result.process_name+".yml")
+
+    if pipeline is not None:
+        failed_results = pipeline.run(playbooks, record)
+        with profiler.stage("save_manifest"):
+            manifest.save()
+        return failed_results
+
+    if sink is None:
+        sink = DirectorySink(BPMN_OUTPUT_DIRECTORY)
+    failed_results = []
+    for result in convert_playbooks(playbooks, jobs, module_index, yaml_loader, profiler, layout=layout,
+                                    keep_combined=save_combined_ir or combined_yaml, export_formats=export_formats):
+        if result.error:
+            failed_results.append(result)
+        else:
+            combiner.write_bpmn_file(result, sink, profiler)
+        record(result)
+    with profiler.stage("save_manifest"):
+        manifest.save()
+    return failed_results
+
+def select_changed_playbooks(changed_files: set[str], playbooks: list[tuple[str, str]], manifest: BuildManifest,
+                             module_index: ModuleIndex, discovery_rules: DiscoveryRules):
     '''
-    global activity_counter
-
-    assigned_numbers={}
-    # Step 1: Rename all activities and its child activities
-    for activity in get_activities(obj):
-        # Call a method to add a number to all inner activities of this activity object
-        add_counter_to_activities(obj["activities"][activity])
-        # Replace the key of the activity by a key with an added activity_counter The replacement
-        # is being realized by creating a new node in the dict as a copy of the old one just with
-        # the new key name This new node is beeing attached at the bottom of the dict. This
-        # replacement only works, because the for loop iterates over the activities from top to
-        # bottom. so the sorting of the data remains correct after replacing all nodes in the
-        # activity node.
-        activity_counter += 1
-        assigned_numbers[activity] = activity_counter
-        obj["activities"][activity + "_" + str(activity_counter)] = obj["activities"][activity]
-        del obj["activities"][activity]
-
-    # Step 2: adjust naming for goto steps in gateway and send
-    for activity in get_activities(obj):
-        if "gateway" == get_activitie_object_type(obj["activities"][activity]) and \
-           "goto" in obj["activities"][activity].keys():
-            for goto_element in obj["activities"][activity]["goto"]:
-                # Für exclusive gateways
-                if isinstance(goto_element, dict) and "then" in goto_element.keys():
-                    goto_element["then"] = goto_element["then"] + "_" + str(assigned_numbers[goto_element["then"]])
-                # Für parallel gateway (TODO: Noch nicht testbar wegen fehlendem vorkommen in PBs)
-                if isinstance(goto_element, str):
-                    obj["activities"][activity]["goto"].append(goto_element+"_"+str(assigned_numbers[goto_element]))
-                    obj["activities"][activity]["goto"].remove(goto_element)
-
-        if (
-            "task" == get_activitie_object_type(obj["activities"][activity]) or
-            "event" == get_activitie_object_type(obj["activities"][activity])
-            ) and "goto" in obj["activities"][activity].keys():
-            if isinstance(obj["activities"][activity]["goto"], str):
-                obj["activities"][activity]["goto"] = obj["activities"][activity]["goto"] + "_" +str(assigned_numbers[obj["activities"][activity]["goto"]])
-
-def load_yaml_file(yaml_file):
+    Determines the playbooks affected by changed files (playbook files or modules)
+    If files have been added or removed, the playbook directory and the module roots are scanned again
+
+    :param changed_files: files reported by the file watcher
+    :param playbooks: current list of (playbook_phase, playbook_file) tuples
+    :param discovery_rules: rules to find the playbook files, if the playbooks directory is scanned again
+    :return: (updated list of all playbooks, list of playbooks to convert)
     '''
-    save loading of a yaml file and converting it into a usable datastructure
-    :param yaml_file: a valid yaml file
-    :return: data structure of dicts and lists representing the yaml content
+    manifest.forget_current_hashes(changed_files)
+    known_playbook_files = {playbook_file for playbook_phase, playbook_file in playbooks}
+    if any(path not in manifest.files and path not in known_playbook_files or not os.path.exists(path)
+           for path in changed_files):
+        module_index.invalidate()
+        snapshot = find_playbook_files(discovery_rules)
+        manifest.use_file_stats(snapshot.file_stats())
+        playbooks = snapshot.playbooks()
+    # files may vanish between scanning and converting (e.g. temporary files of editors)
+    playbooks = [(playbook_phase, playbook_file) for playbook_phase, playbook_file in playbooks
+                 if os.path.exists(playbook_file)]
+    stale_playbooks = select_stale_playbooks(playbooks, manifest, module_index)[0]
+    # a file may change again while its playbook is converted, after which the manifest already holds
+    # the new hash. So every playbook depending on a reported file is converted, even if the hash matches
+    affected_files = set(changed_files)
+    module_users = manifest.module_users()
+    for path in changed_files:
+        affected_files.update(module_users.get(path, []))
+    return playbooks, [(playbook_phase, playbook_file) for playbook_phase, playbook_file in playbooks
+                       if (playbook_phase, playbook_file) in stale_playbooks or playbook_file in affected_files]
+
+def watch_playbooks(playbooks: list[tuple[str, str]], manifest: BuildManifest, module_index: ModuleIndex,
+                    yaml_loader: YamlLoader, debounce: float = 0.05, polling: bool = False, layout: bool = True,
+                    sink: OutputSink = None, save_combined_ir: bool = False, combined_yaml: bool = False,
+                    discovery_rules: DiscoveryRules = None, export_formats: tuple[str, ...] = ()):
     '''
-    with open(yaml_file) as f:
-        try:
-            yaml_data = yaml.safe_load(f)
-            return yaml_data
-        except yaml.YAMLError as exc:
-            logger.error("[-]%s", exc)
-            sys.exit(-1)
-
-def process_playbook(playbook_obj, playbook_phase):
+    Watches the playbook directory and converts the playbooks affected by every change, until Ctrl+C is pressed
+    Module index, yaml loader and manifest stay in memory, so only the changed files are parsed and hashed again
+
+    :param playbooks: list of (playbook_phase, playbook_file) tuples of the initial build
+    :param debounce: changes within this time in seconds are handled together
+    :param polling: use mtime polling instead of inotify
+    :param layout: add the diagram (BPMNDI shapes and edges) to the BPMN files
+    :param sink: receives the BPMN files, by default they are written into the BPMN output directory
+    :param save_combined_ir: save the combined playbooks, see build_playbooks
+    :param combined_yaml: write the combined playbooks as yaml files, see build_playbooks
+    :param discovery_rules: rules to find the playbook files, defaults to DiscoveryRules()
+    :param export_formats: formats written besides the BPMN files, see build_playbooks
     '''
-    Iterates over the playbook data structure and inserts module data where it is reverenced in the main playbook file
-    The inserted "playbook_obj" will be modified in this function.
-    This function uses recursion to ensure a proper parsing of unclear depth of subprocess nesting
-    It calls itself again, if it finds a subprocess in the activities of the provided dataset
-    and makes the function call with the data structure of the subprocess as argument.
-    The recursion ends if an activity has only tasks and no more subprocesses
-
-    :param playbook_obj: data structure representing the yaml content of the playbook or fracation of it
-    :param playbook_phase: current phase of the play book. Needet referencing the possible module locations
-    :return: None
+    if discovery_rules is None:
+        discovery_rules = DiscoveryRules()
+    watcher = create_watcher([START_DIRECTORY], polling)
+    print(f"watching {START_DIRECTORY} ({watcher.kind}), press Ctrl+C to stop", file=sys.stderr)
+    try:
+        while True:
+            changed_files = wait_for_changes(watcher, debounce)
+            start = time.perf_counter()
+            playbooks, stale_playbooks = select_changed_playbooks(changed_files, playbooks, manifest, module_index,
+                                                                  discovery_rules)
+            failed_results = build_playbooks(stale_playbooks, 1, manifest, module_index, yaml_loader, layout=layout,
+                                             sink=sink, save_combined_ir=save_combined_ir, combined_yaml=combined_yaml,
+                                             export_formats=export_formats)
+            for result in failed_results:
+                print(f"failed to convert {result.playbook_file}: {result.error}", file=sys.stderr)
+            logger.info("[+] %d changed file(s), %d playbook(s) converted in %.1f ms", len(changed_files),
+                        len(stale_playbooks), (time.perf_counter() - start) * 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+def configure_logging(verbose: bool = False) -> logging.handlers.QueueListener:
     '''
-    # Iterate over all activities in the provided data structure
-    for activity in get_activities(playbook_obj):
-        activity_obj = playbook_obj["activities"][activity]
-
-        # if a found activity is a task try to replace it with the corresponding module
-        if "task" == get_activitie_object_type(activity_obj):
-                logger.debug("[+] Task %s found", activity_obj)
-                # If the element is a task insert an activity key with the content of the module activity
-                possible_file_locations = [
-                    os.path.join(playbook_phase, "modules"),
-                    "../../playbooks/05_documentation",
-                    "../../playbooks/05_documentation/modules"
-                ]  # Modules can be placed at one of this locations
-
-                # Search the fitting module file within this loop
-                for possible_file_location in possible_file_locations:
-                    file_to_load = os.path.join(possible_file_location, activity + ".yml")
-                    logger.debug("[*] Searching module %s at location %s", activity,
-                                 file_to_load)
-                    if os.path.isfile(file_to_load):
-                        logger.debug("[+] Module found at location %s ", file_to_load)
-                        # Module file has been found now try to insert the module
-                        try:
-                            module_yaml = load_yaml_file(file_to_load)
-                            activity_obj["activities"] = module_yaml["activities"]
-                            activity_obj["type"] = "sub"  # by inserting the module the task converts into a subprocess
-                            break  # Module found, no search for further modules needed
-                        except KeyError as ex:
-                            logger.error("[-] Unable to convert file %s", possible_file_location)
-
-        # if the found activity is a subprocess call this funktion again for this subprocess
-        # because each subprocess can/will contain further tasks which needs to be replaced with the
-        # corresponding module
-        elif "subprocess" == get_activitie_object_type(activity_obj):
-            process_playbook(activity_obj, playbook_phase)
+    Logs into yaml_combiner.log. The converting thread only puts the log records into a queue,
+    the file is written by a separate listener thread. Debug messages are only logged in verbose mode.
 
+    :return: the started listener, stop it at the end of the run to flush the log file
+    '''
+    log_queue = queue.SimpleQueue()
+    file_handler = logging.FileHandler("yaml_combiner.log")
+    file_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    listener.start()
+    return listener
+
+def write_metrics(metrics_file: str, profiler: StageProfiler, skipped_playbooks: list, failed_results: list,
+                  caches: dict, output: dict = None, pipeline: dict = None):
+    metrics = profiler.to_dict()
+    metrics["caches"] = caches
+    metrics["output"] = output
+    metrics["pipeline"] = pipeline
+    metrics["skipped_playbooks"] = [playbook_file for playbook_phase, playbook_file in skipped_playbooks]
+    metrics["failed_playbooks"] = {result.playbook_file: result.error for result in failed_results}
+    with open(metrics_file, "w") as f:
+        json.dump(metrics, f, indent=1)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Combines playbooks with their modules and converts them into BPMN")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes used to convert playbook files (default: 1)")
+    parser.add_argument("--force", action="store_true",
+                        help="convert all playbooks, even if their output is up to date")
+    parser.add_argument("--yaml-cache", metavar="DIRECTORY",
+                        help="directory for a persistent cache of parsed yaml files (default: no cache)")
+    parser.add_argument("--profile", action="store_true",
+                        help="measure wall time and call counts of every stage and print a summary")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write the collected metrics as json (implies --profile)")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="write cProfile stats of this process (implies --profile, use -j 1 to include the conversions)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="write debug messages into the log file")
+    parser.add_argument("--no-layout", dest="layout", action="store_false",
+                        help="don't add the diagram (BPMNDI shapes and edges) to the BPMN files")
+    parser.add_argument("--module-depth", type=int, default=DEFAULT_MAX_MODULE_DEPTH, metavar="N",
+                        help="maximum number of nested modules, 1 only inserts the modules referenced by the playbooks "
+                             f"(default: {DEFAULT_MAX_MODULE_DEPTH})")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="read playbook and module files in background threads and write the BPMN files in a "
+                             "separate thread, while the playbooks are converted (can't be combined with -j)")
+    parser.add_argument("--prefetch-threads", type=int, default=DEFAULT_PREFETCH_THREADS, metavar="N",
+                        help=f"number of threads reading files in pipeline mode (default: {DEFAULT_PREFETCH_THREADS})")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, metavar="N",
+                        help="number of playbooks waiting between two stages in pipeline mode, "
+                             f"before the earlier stage is paused (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument("--save-ir", action="store_true",
+                        help="save every combined playbook and its BPMN model as compact binary IR into "
+                             f"{IR_OUTPUT_DIRECTORY}, see python -m yaml2bpmn_converter.combined_ir")
+    parser.add_argument("--combined-yaml", action="store_true",
+                        help=f"write every combined playbook as readable yaml into {OUTPUT_DIRECTORY}")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and convert the affected playbooks whenever playbook or module files change")
+    parser.add_argument("--watch-polling", action="store_true",
+                        help="detect changes by polling modification times instead of inotify")
+    parser.add_argument("--debounce", type=float, default=0.05, metavar="SECONDS",
+                        help="changes within this time are converted together in watch mode (default: 0.05)")
+    parser.add_argument("--discovery-config", default=DISCOVERY_CONFIG, metavar="FILE",
+                        help="yaml file with the include and exclude rules (glob patterns) selecting the playbook files "
+                             "(default: playbook_discovery.yml next to main.py)")
+    parser.add_argument("--export", dest="export_formats", nargs="+", default=[], metavar="FORMAT",
+                        choices=[export_format for export_format in EXPORT_FORMATS if export_format != "bpmn"],
+                        help="also write every process in these formats next to its BPMN file, rendered in the same "
+                             "pass over the process: mermaid (.mmd flowchart), dot (.dot Graphviz graph)")
+    parser.add_argument("--check", action="store_true",
+                        help="only validate all playbooks and print every problem, exit with 1 on errors (no output is written)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="directory",
+                        help="directory: one file per process in the output directory, unchanged files are kept; "
+                             "tar/zip: one bundle (see --output); ndjson: one json line per file on stdout "
+                             "(default: directory)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="bundle file of the tar and zip formats (default: parser/yaml_combine/output/bpmn.<format>)")
+    arguments = parser.parse_args(argv)
+    if arguments.watch and arguments.output_format in BUNDLE_FILES:
+        parser.error("--watch can't be combined with a bundle output format")
+    if arguments.module_depth < 1:
+        parser.error("--module-depth must be at least 1")
+    if arguments.pipeline and arguments.jobs > 1:
+        parser.error("--pipeline can't be combined with --jobs")
+    if arguments.prefetch_threads < 1 or arguments.queue_size < 1:
+        parser.error("--prefetch-threads and --queue-size must be at least 1")
+    arguments.export_formats = list(dict.fromkeys(arguments.export_formats))
+    try:
+        arguments.discovery_rules = load_rules(arguments.discovery_config)
+    except (OSError, ValueError) as exc:
+        parser.error(f"can't load the discovery rules: {exc}")
+    return arguments
 
 
 if __name__ == '__main__':
     '''
     Iterate over all playbooks and create combined files for each playbook phase
     '''
+    arguments = parse_arguments()
+
+    log_listener = configure_logging(arguments.verbose)
+    profiler = StageProfiler() if arguments.profile or arguments.metrics or arguments.cprofile else NULL_PROFILER
+    c_profiler = None
+    if arguments.cprofile:
+        import cProfile
+        c_profiler = cProfile.Profile()
+        c_profiler.enable()
+
+    if arguments.check:
+        # validate all playbooks without converting or writing anything, e.g. as a pre-commit check
+        yaml_loader = YamlLoader(arguments.yaml_cache)
+        module_index = ModuleIndex(yaml_loader.load, SHARED_MODULE_DIRECTORIES, arguments.module_depth)
+        issues = []
+        for playbook_phase, playbook_file in find_playbook_files(arguments.discovery_rules).playbooks():
+            issues.extend(check_playbook(playbook_phase, playbook_file, module_index, yaml_loader, profiler))
+        for issue in issues:
+            print(issue)
+        if profiler.enabled:
+            print(profiler.summary(), file=sys.stderr)
+        log_listener.stop()
+        sys.exit(1 if any(issue.severity == ERROR for issue in issues) else 0)
 
-    logging.basicConfig(filename='yaml_combiner.log', level=logging.DEBUG)
     # Create Playbook Output directory if not exist
     if not os.path.exists(OUTPUT_DIRECTORY):
         os.makedirs(OUTPUT_DIRECTORY)
 
-    # Specific folders in the Playbook directory, which shall not be processed like normal Playbook directories
-    specific_folders = ["/files", "/05_documentation", "additional_fields"]
+    yaml_loader = YamlLoader(arguments.yaml_cache)
+    module_index = ModuleIndex(yaml_loader.load, SHARED_MODULE_DIRECTORIES, arguments.module_depth)
+    # outputs created with other options are outdated as well
+    converter_hash = compute_converter_hash(converter_source_files(), {"layout": arguments.layout,
+                                                                      "module_depth": arguments.module_depth,
+                                                                      "save_ir": arguments.save_ir,
+                                                                      "combined_yaml": arguments.combined_yaml,
+                                                                      "export_formats": arguments.export_formats})
+    manifest = BuildManifest(MANIFEST_FILE, converter_hash)
+    if arguments.output_format == "directory":
+        sink = DirectorySink(BPMN_OUTPUT_DIRECTORY)
+        if not arguments.force:
+            manifest = BuildManifest.load(MANIFEST_FILE, manifest.converter_hash)
+    else:
+        sink = create_sink(arguments.output_format, arguments.output or BUNDLE_FILES.get(arguments.output_format))
+        # the manifest describes the files of the output directory, so all playbooks are converted
+        # and the manifest is only kept in memory (e.g. for the watch mode)
+        manifest = BuildManifest(None, converter_hash)
+
+    # Only convert playbooks, whose playbook file or modules changed since the last run
+    with profiler.stage("find_playbook_files"):
+        snapshot = find_playbook_files(arguments.discovery_rules)
+    # the manifest reuses mtime and size collected by the discovery instead of stat-ing the playbook files again
+    manifest.use_file_stats(snapshot.file_stats())
+    playbook_files = snapshot.playbooks()
+    with profiler.stage("select_stale_playbooks"):
+        playbooks, skipped_playbooks = select_stale_playbooks(playbook_files, manifest, module_index)
+    for playbook_phase, playbook_file in skipped_playbooks:
+        logger.info("[*] Skipped unchanged playbook \"%s\"", playbook_file)
+    if skipped_playbooks:
+        print(f"skipped {len(skipped_playbooks)} unchanged playbook(s)")
 
     # Iterate over possible playbook directorys and convert the splitted files into one big Playbook
-    playbook_dirs, playbook_files = list_directory(START_DIRECTORY)
-    for playbook_dir in playbook_dirs:
-
-        if any(playbook_dir.endswith(x) for x in specific_folders):
-            # fields directory is not a playbook directory
-            continue
-
-        # Temp restriction for malware playbook only
-        # TODO: die Folgenden beiden Zeilen müssen enfernt werden, sobald alle Playbooks übersetzt werden können
-        if not playbook_dir.endswith("/malware_new"):
-            continue
-
-        playbook_phases = list_directory(playbook_dir)[0]
-        for playbook_phase in playbook_phases:
-            playbook_related_folder, playbook_files = list_directory(playbook_phase)
-
-            logger.info("[+] Processing playbook at following location: \"%s\"",  playbook_phase)
-            for playbook_file in playbook_files:
-                # Convert yaml file into data structure
-                playbook_yaml = load_yaml_file(playbook_file)
-                # Process playbook and insert modules in data structure where referenced
-                process_playbook(playbook_yaml, playbook_phase)
-                # add a rolling number to each activity name to evade duplicates
-                add_counter_to_activities(playbook_yaml)
-                # Convert the modified object back into yaml
-                # The flags default_flow_style=False, sort_keys=False are necessary in this case.
-                # They enforce that the orientation of the keys in the object will not be reorderd
-                # The ordering is important, because the BPMNator would not process it otherwise
-
-                # If you want to have files for the yaml output, uncomment the following two lines
-                #
-                # with open(os.path.join(OUTPUT_DIRECTORY, playbook_yaml["process"]+".yml"), "w") as f:
-                #     f.write(yaml.dump(playbook_yaml, default_flow_style=False, sort_keys=False))
-                # logger.info("[+] Created combined file: \"%s\"", playbook_yaml["process"]+".yml")
-
-                # Convert the modified object into BPMN
-                bpmn_yaml = yaml_parser.parse_playbook_to_bpmn_representation(playbook_yaml)
-                bpmn_xml = xml_generator.generate_bpmn_xml(bpmn_yaml)
-                if not os.path.exists(BPMN_OUTPUT_DIRECTORY):
-                    os.makedirs(BPMN_OUTPUT_DIRECTORY)
-                with open(os.path.join(BPMN_OUTPUT_DIRECTORY, playbook_yaml["process"]+".bpmn"), "w") as f:
-                    f.write(bpmn_xml)
-                logger.info("[+] Created BPMN file: \"%s\"", playbook_yaml["process"]+".bpmn")
-                print(f"created BPMN File: {playbook_yaml["process"]+".bpmn"}")
+    # a bundle is only replaced if all playbooks have been processed
+    pipeline = None
+    if arguments.pipeline:
+        pipeline = ConversionPipeline(module_index, yaml_loader, sink, profiler, arguments.layout,
+                                      arguments.prefetch_threads, arguments.queue_size,
+                                      keep_combined=arguments.save_ir or arguments.combined_yaml,
+                                      export_formats=tuple(arguments.export_formats))
+    with sink:
+        failed_results = build_playbooks(playbooks, arguments.jobs, manifest, module_index, yaml_loader, profiler,
+                                         arguments.layout, sink, pipeline, arguments.save_ir, arguments.combined_yaml,
+                                         tuple(arguments.export_formats))
+    print(sink.summary(), file=sys.stderr)
+
+    if c_profiler is not None:
+        c_profiler.disable()
+        c_profiler.dump_stats(arguments.cprofile)
+    if profiler.enabled:
+        print(profiler.summary(), file=sys.stderr)
+        if pipeline is not None:
+            print(pipeline.summary(), file=sys.stderr)
+    if arguments.metrics:
+        # cache statistics of this process, worker processes of parallel runs keep their own caches
+        caches = {"module_index": module_index.stats(), "yaml_loader": yaml_loader.stats()}
+        write_metrics(arguments.metrics, profiler, skipped_playbooks, failed_results, caches, sink.stats(),
+                      pipeline.stats() if pipeline is not None else None)
+
+    # report all failed playbooks at once instead of stopping at the first error
+    for result in failed_results:
+        print(f"failed to convert {result.playbook_file}: {result.error}", file=sys.stderr)
+
+    if arguments.watch:
+        watch_playbooks(playbook_files, manifest, module_index, yaml_loader, arguments.debounce, arguments.watch_polling,
+                        arguments.layout, sink, arguments.save_ir, arguments.combined_yaml, arguments.discovery_rules,
+                        tuple(arguments.export_formats))
+    log_listener.stop()
+    if failed_results and not arguments.watch:
+        sys.exit(1)
@@ -0,0 +1,87 @@
+"""Round trip of playbooks through the converter and the BPMN importer: yaml -> bpmn -> yaml
+Run from parser/yaml_combine:
+    python -m unittest discover -s tests -t .
+"""
+import io
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser, xml_generator, bpmn_importer
+from benchmarks.playbook_generator import GeneratorConfig, generate_activities
+
+# every goto kind: subprocesses as source and target of gotos (also from gateway branches), nested subprocesses,
+# branches of all gateway types and intermediate events
+PLAYBOOK = {"process": "roundtrip", "activities": {
+    "receive alert": {"type": "inmcatch", "goto": "triage"},
+    "triage": {"type": "sub", "goto": "decide", "activities": {
+        "collect": {"type": "human", "goto": "enrich"},
+        "enrich": {"type": "sub", "goto": "wait", "activities": {
+            "lookup": {"type": "serv", "goto": "score"},
+            "score": {"type": "script"},
+        }},
+        "wait": {"type": "intimer"},
+    }},
+    "decide": {"type": "xgw", "goto": [
+        {"if": "severity = high", "then": "contain"},
+        {"if": "severity = low", "then": "document"},
+    ]},
+    "contain": {"type": "pgw", "goto": ["isolate", {"if": "notify", "then": "inform"}]},
+    "isolate": {"type": "sub", "goto": "merge", "activities": {
+        "block": {"type": "manual", "goto": "escalate"},
+        "escalate": {"type": "inescal"},
+    }},
+    "inform": {"type": "send", "goto": "signal"},
+    "signal": {"type": "insthrow", "goto": "merge"},
+    "merge": {"type": "igw", "goto": [
+        {"if": "report needed", "then": "document"},
+        {"if": "ticket open", "then": "close"},
+    ]},
+    "document": {"type": "sub", "goto": "close", "activities": {
+        "write": {"type": "busin", "goto": "confirm"},
+        "confirm": {"type": "inscatch"},
+    }},
+    "close": {"type": "inmthrow"},
+}}
+
+def convert(playbook: dict) -> str:
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(playbook, yaml_parser.ConversionContext())
+    stream = io.StringIO()
+    xml_generator.write_bpmn_xml(bpmn_process, stream)
+    return stream.getvalue()
+
+def import_xml(bpmn_xml: str, strip_counters: bool = True) -> dict:
+    processes = bpmn_importer.read_bpmn_processes(io.BytesIO(bpmn_xml.encode("utf-8")))
+    return bpmn_importer.process_to_playbook(processes[0], strip_counters)
+
+def gotos(activities: dict, path: str = "") -> dict:
+    '''activity path -> (type, goto) of all activities, including the activities of subprocesses'''
+    result = {}
+    for name, activity in activities.items():
+        result[path + name] = (activity.get("type"), activity.get("goto"))
+        result.update(gotos(activity.get("activities", {}), path + name + "/"))
+    return result
+
+class BpmnImporterRoundTripTest(unittest.TestCase):
+    def test_gotos_survive_the_round_trip(self):
+        playbook = import_xml(convert(PLAYBOOK))
+        self.assertEqual(gotos(playbook["activities"]), gotos(PLAYBOOK["activities"]))
+
+    def test_round_trip_converts_to_the_same_bpmn(self):
+        bpmn_xml = convert(PLAYBOOK)
+        self.assertEqual(convert(import_xml(bpmn_xml)), bpmn_xml)
+
+    def test_generated_playbooks_convert_to_the_same_bpmn(self):
+        config = GeneratorConfig(depth=3, width=6, gateway_density=0.3)
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                activities = generate_activities(config, random.Random(seed), config.depth, config.width, [], "a")
+                bpmn_xml = convert({"process": f"generated_{seed}", "activities": activities})
+                # the generated names end with numbers, which aren't counters of the converter
+                self.assertEqual(convert(import_xml(bpmn_xml, strip_counters=False)), bpmn_xml)
+
+if __name__ == "__main__":
+    unittest.main()
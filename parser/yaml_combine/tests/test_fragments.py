@@ -0,0 +1,89 @@
+"""Subprocess fragments (fragments.py): copies instantiated from a template have to be converted into
+the same BPMN as subprocesses converted one by one
+Run from parser/yaml_combine:
+    python -m unittest discover -s tests -t .
+"""
+import io
+import os
+import sys
+import copy
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser, xml_generator
+from yaml2bpmn_converter.combiner import add_counter_to_activities
+from yaml2bpmn_converter.layout import layout_process
+
+# activities of a module, inlined several times like module_expansion does
+MODULE = {
+    "wait for reply": {"type": "intimer", "goto": "check"},
+    "check": {"type": "xgw", "goto": [
+        {"if": "reply received", "then": "analyse"},
+        {"if": "no reply", "then": "remind"},
+    ]},
+    "remind": {"type": "send", "name": "send reminder", "goto": "wait for reply"},
+    "analyse": {"type": "sub", "goto": "split", "activities": {
+        "read": {"type": "human", "goto": "signal"},
+        "signal": {"type": "insthrow"},
+    }},
+    "split": {"type": "pgw", "goto": ["archive", {"if": "notify", "then": "inform"}]},
+    "archive": {"type": "manual", "goto": "merge"},
+    "inform": {"type": "inmthrow", "goto": "merge"},
+    "merge": {"type": "igw", "goto": [
+        {"if": "ticket open", "then": "close"},
+        {"if": "check", "then": "escalate"},  # condition equal to an activity name
+    ]},
+    "escalate": {"type": "inescal"},
+    "close": {"type": "task"},
+}
+
+def module_copy(**changes) -> dict:
+    activities = copy.deepcopy(MODULE)
+    activities.update(changes)
+    return activities
+
+def repeated_playbook() -> dict:
+    '''Playbook with the module inlined on several levels, including copies nested in copies'''
+    return {"process": "repeated", "activities": {
+        "start": {"type": "inmcatch", "goto": "first"},
+        "first": {"type": "sub", "goto": "second", "activities": module_copy()},
+        "second": {"type": "sub", "goto": "outer", "activities": module_copy()},
+        "outer": {"type": "sub", "goto": "changed", "activities": {
+            "prepare": {"type": "script", "goto": "inner"},
+            "inner": {"type": "sub", "activities": module_copy()},
+            "again": {"type": "sub", "activities": {
+                "nested": {"type": "sub", "activities": module_copy()},
+            }},
+        }},
+        # same activities with a different structure, converted from its own template
+        "changed": {"type": "sub", "goto": "empty", "activities": module_copy(close={"type": "task", "goto": "check"})},
+        "empty": {"type": "sub", "goto": "empty again", "activities": {}},
+        "empty again": {"type": "sub", "activities": {}},
+    }}
+
+def convert(playbook: dict, memoize_fragments: bool, numbered: bool, layout: bool) -> tuple[str, int]:
+    '''Converts a playbook like the combiner does, returns the BPMN and the number of instantiated copies'''
+    playbook = copy.deepcopy(playbook)
+    context = yaml_parser.ConversionContext(memoize_fragments=memoize_fragments)
+    if numbered:
+        add_counter_to_activities(playbook, context)
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(playbook, context)
+    stream = io.StringIO()
+    xml_generator.write_bpmn_xml(bpmn_process, stream, layout=layout_process(bpmn_process) if layout else None)
+    return stream.getvalue(), context.fragment_copies
+
+class FragmentMemoizationTest(unittest.TestCase):
+    def test_copies_convert_to_the_same_bpmn(self):
+        playbook = repeated_playbook()
+        # the layout needs unique ids, which the combiner ensures by numbering the activities
+        for numbered, layout in [(False, False), (True, False), (True, True)]:
+            with self.subTest(numbered=numbered, layout=layout):
+                memoized, copies = convert(playbook, True, numbered, layout)
+                converted, no_copies = convert(playbook, False, numbered, layout)
+                self.assertGreater(copies, 0)
+                self.assertEqual(no_copies, 0)
+                self.assertEqual(memoized.encode("utf-8"), converted.encode("utf-8"))
+
+if __name__ == "__main__":
+    unittest.main()
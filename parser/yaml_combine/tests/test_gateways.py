@@ -0,0 +1,88 @@
+"""Branches of exclusive, parallel and inclusive gateways (goto lists)
+Run from parser/yaml_combine:
+    python -m unittest discover -s tests -t .
+"""
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yaml2bpmn_converter import yaml_parser, xml_generator, bpmn_importer
+from yaml2bpmn_converter.validator import validate_playbook
+
+def gateway_playbook(gateway_type: str, branches: list) -> dict:
+    return {"process": "gateways", "activities": {
+        "decide": {"type": gateway_type, "goto": branches},
+        "left": {"type": "task", "goto": "join"},
+        "right": {"type": "task", "goto": "join"},
+        "join": {"type": "task"},
+    }}
+
+def gateway_flows(playbook: dict) -> list[tuple[str, str, str]]:
+    '''(target, name, condition) of the flows from the gateway "decide" to other activities'''
+    bpmn_process = yaml_parser.parse_playbook_to_bpmn_representation(playbook)
+    return [(flow.target_ref, None if flow.name == flow.id else flow.name, flow.condition_expression)
+            for flow in bpmn_process.sequence_flows
+            if flow.source_ref == "decide" and flow.target_ref in playbook["activities"]]
+
+def roundtrip(playbook: dict) -> dict:
+    stream = io.StringIO()
+    xml_generator.write_bpmn_xml(yaml_parser.parse_playbook_to_bpmn_representation(playbook), stream)
+    processes = bpmn_importer.read_bpmn_processes(io.BytesIO(stream.getvalue().encode("utf-8")))
+    return bpmn_importer.process_to_playbook(processes[0])
+
+def goto_warnings(playbook: dict) -> list[str]:
+    return [issue.message for issue in validate_playbook(playbook, "gateways.yml") if issue.location == "decide"]
+
+CONDITIONAL_BRANCHES = [{"if": "score > 5", "then": "left"}, {"if": "score <= 5", "then": "right"}]
+
+class GatewayParserTest(unittest.TestCase):
+    def test_exclusive_gateway_flows_have_conditions(self):
+        self.assertEqual(gateway_flows(gateway_playbook("xgw", CONDITIONAL_BRANCHES)),
+                         [("left", "score > 5", "score > 5"), ("right", "score <= 5", "score <= 5")])
+
+    def test_inclusive_gateway_flows_have_conditions(self):
+        self.assertEqual(gateway_flows(gateway_playbook("igw", CONDITIONAL_BRANCHES)),
+                         [("left", "score > 5", "score > 5"), ("right", "score <= 5", "score <= 5")])
+
+    def test_conditional_branch_without_if_is_skipped(self):
+        self.assertEqual(gateway_flows(gateway_playbook("xgw", [{"then": "left"}, "right"])), [])
+
+    def test_parallel_gateway_flows_have_no_conditions(self):
+        branches = ["left", {"if": "in parallel", "then": "right"}]
+        self.assertEqual(gateway_flows(gateway_playbook("pgw", branches)),
+                         [("left", None, None), ("right", "in parallel", None)])
+
+    def test_goto_list_of_non_gateway_is_ignored(self):
+        with self.assertLogs(yaml_parser.logger, "WARNING") as logs:
+            self.assertEqual(gateway_flows(gateway_playbook("task", CONDITIONAL_BRANCHES)), [])
+        self.assertIn("found 'goto' list for non-gateway decide", logs.output[0])
+
+class GatewayValidatorTest(unittest.TestCase):
+    def test_branches_of_all_gateways_are_accepted(self):
+        self.assertEqual(goto_warnings(gateway_playbook("xgw", CONDITIONAL_BRANCHES)), [])
+        self.assertEqual(goto_warnings(gateway_playbook("igw", CONDITIONAL_BRANCHES)), [])
+        self.assertEqual(goto_warnings(gateway_playbook("pgw", ["left", {"then": "right"}])), [])
+
+    def test_conditional_branch_without_if_is_reported(self):
+        warnings = goto_warnings(gateway_playbook("igw", [{"then": "left"}, "right"]))
+        self.assertEqual(len(warnings), 2)
+        self.assertIn("has no \"if\" condition", warnings[0])
+
+    def test_goto_list_of_non_gateway_is_reported(self):
+        warnings = goto_warnings(gateway_playbook("task", CONDITIONAL_BRANCHES))
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("only supported on gateways", warnings[0])
+
+class GatewayImportTest(unittest.TestCase):
+    def test_branches_survive_the_round_trip(self):
+        for gateway_type, branches in [("xgw", CONDITIONAL_BRANCHES), ("igw", CONDITIONAL_BRANCHES),
+                                       ("pgw", ["left", {"if": "in parallel", "then": "right"}])]:
+            with self.subTest(gateway_type):
+                playbook = roundtrip(gateway_playbook(gateway_type, branches))
+                self.assertEqual(playbook["activities"]["decide"], {"type": gateway_type, "goto": branches})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Command line entry point, run from parser/yaml_combine:
+
+    python -m yaml2bpmn_converter PATH [PATH ...] [-o OUTPUT_DIRECTORY] [-j JOBS]
+
+PATH is a playbook file or a playbooks directory (<directory>/<playbook>/<phase>/<playbook file>).
+With --check, the playbooks are only validated and every problem is printed.
+Without --module-root, the 05_documentation directories of the given playbooks directories are used.
+"""
+import os
+import sys
+import argparse
+import logging
+
+from .api import convert_many, default_module_roots, validate_many
+from .validator import ERROR
+from .module_index import DEFAULT_MAX_MODULE_DEPTH
+from .combiner import write_bpmn_file
+from .output_sinks import OUTPUT_FORMATS, create_sink
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m yaml2bpmn_converter", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="playbook file or playbooks directory")
+    parser.add_argument("-o", "--output", default=".", metavar="PATH",
+                        help="directory for the BPMN files, or the bundle file of the tar and zip formats "
+                             "(default: current directory)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="directory",
+                        help="directory (unchanged files are kept), tar, zip or ndjson (one json line per file on stdout)")
+    parser.add_argument("--module-root", action="append", dest="module_roots", metavar="DIRECTORY",
+                        help="shared module directory, can be given several times")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes used to convert playbook files (default: 1)")
+    parser.add_argument("--yaml-cache", metavar="DIRECTORY",
+                        help="directory for a persistent cache of parsed yaml files (default: no cache)")
+    parser.add_argument("--no-layout", dest="layout", action="store_false",
+                        help="don't add the diagram (BPMNDI shapes and edges) to the BPMN files")
+    parser.add_argument("--module-depth", type=int, default=DEFAULT_MAX_MODULE_DEPTH, metavar="N",
+                        help=f"maximum number of nested modules (default: {DEFAULT_MAX_MODULE_DEPTH})")
+    parser.add_argument("--check", action="store_true",
+                        help="only validate the playbooks and print all problems, exit with 1 on errors")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    arguments = parse_arguments(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    module_roots = arguments.module_roots
+    if module_roots is None:
+        module_roots = [root for path in arguments.paths if os.path.isdir(path) for root in default_module_roots(path)]
+
+    if arguments.check:
+        issues = validate_many(arguments.paths, module_roots, arguments.yaml_cache,
+                               max_module_depth=arguments.module_depth)
+        for issue in issues:
+            print(issue)
+        return 1 if any(issue.severity == ERROR for issue in issues) else 0
+
+    failed = 0
+    with create_sink(arguments.output_format, arguments.output) as sink:
+        for result in convert_many(arguments.paths, module_roots, arguments.jobs, arguments.yaml_cache,
+                                   render_xml=False, layout=arguments.layout,
+                                   max_module_depth=arguments.module_depth):
+            if result.error:
+                print(f"failed to convert {result.playbook_file}: {result.error}", file=sys.stderr)
+                failed += 1
+                continue
+            write_bpmn_file(result, sink)
+    print(sink.summary(), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
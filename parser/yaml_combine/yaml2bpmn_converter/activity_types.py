@@ -0,0 +1,98 @@
+from .bpmn_object_models import *
+
+# --- Activity Types
+
+def _no_child_elements(element: BPMNFlowElement) -> tuple:
+    return ()
+
+def _event_definition(definition_tag: str):
+    '''Returns a child element emitter, which writes the event definition of an intermediate event'''
+    def child_elements(element: BPMNIntermediateEvent) -> tuple:
+        return ((definition_tag, {"id": element.event_definition_id}),)
+    return child_elements
+
+class ActivityType:
+    """Everything the stages need to know about one type of flow element
+
+    code: type code in the playbook yaml (None for the implicit start and end events)
+    object_type: general type, one of task, gateway, event or subprocess
+    model_class: class of the BPMN model element
+    bpmn_tag: tag of the element in the BPMN xml (without namespace)
+    definition_tag: tag of the event definition, only set for intermediate events
+    child_elements: emitter returning the (tag, attributes) of the child elements written in front of
+        the incoming and outgoing flows, used by both xml writers
+    """
+    __slots__ = ("code", "object_type", "model_class", "bpmn_tag", "definition_tag", "child_elements")
+
+    def __init__(self, code: str, object_type: str, model_class: type, bpmn_tag: str, definition_tag: str = None):
+        self.code = code
+        self.object_type = object_type
+        self.model_class = model_class
+        self.bpmn_tag = bpmn_tag
+        self.definition_tag = definition_tag
+        self.child_elements = _event_definition(definition_tag) if definition_tag else _no_child_elements
+
+    def __repr__(self) -> str:
+        return f"ActivityType({self.code!r}, {self.bpmn_tag!r})"
+
+# type code -> activity type
+ACTIVITY_TYPES: dict[str, ActivityType] = {activity_type.code: activity_type for activity_type in [
+    ActivityType("human", "task", BPMNUserTask, "userTask"),
+    ActivityType("manual", "task", BPMNManualTask, "manualTask"),
+    ActivityType("busin", "task", BPMNBusinessRuleTask, "businessRuleTask"),
+    ActivityType("call", "task", BPMNCallActivity, "callActivity"),
+    ActivityType("send", "task", BPMNSendTask, "sendTask"),
+    ActivityType("receive", "task", BPMNReceiveTask, "receiveTask"),
+    ActivityType("script", "task", BPMNScriptTask, "scriptTask"),
+    ActivityType("serv", "task", BPMNServiceTask, "serviceTask"),
+    ActivityType("task", "task", BPMNTask, "task"),
+    ActivityType("xgw", "gateway", BPMNExclusiveGateway, "exclusiveGateway"),
+    ActivityType("pgw", "gateway", BPMNParallelGateway, "parallelGateway"),
+    ActivityType("igw", "gateway", BPMNInclusiveGateway, "inclusiveGateway"),
+    ActivityType("insthrow", "event", BPMNSignalThrowEvent, "intermediateThrowEvent", "signalEventDefinition"),
+    ActivityType("inscatch", "event", BPMNSignalCatchEvent, "intermediateCatchEvent", "signalEventDefinition"),
+    ActivityType("inmthrow", "event", BPMNMessageThrowEvent, "intermediateThrowEvent", "messageEventDefinition"),
+    ActivityType("inmcatch", "event", BPMNMessageCatchEvent, "intermediateCatchEvent", "messageEventDefinition"),
+    ActivityType("intimer", "event", BPMNIntimerEvent, "intermediateCatchEvent", "timerEventDefinition"),
+    ActivityType("inescal", "event", BPMNEscalationThrowEvent, "intermediateThrowEvent", "escalationEventDefinition"),
+    ActivityType("sub", "subprocess", BPMNSubProcess, "subProcess"),
+]}
+
+# activities with a missing or unknown type code are converted into generic tasks
+DEFAULT_ACTIVITY_TYPE = ACTIVITY_TYPES["task"]
+
+# model class -> activity type, including the implicit start and end events
+_TYPES_BY_CLASS: dict[type, ActivityType] = {activity_type.model_class: activity_type
+                                             for activity_type in ACTIVITY_TYPES.values()}
+_TYPES_BY_CLASS[BPMNStartEvent] = ActivityType(None, "event", BPMNStartEvent, "startEvent")
+_TYPES_BY_CLASS[BPMNEndEvent] = ActivityType(None, "event", BPMNEndEvent, "endEvent")
+
+def element_type(element: BPMNFlowElement) -> ActivityType | None:
+    '''
+    Returns the activity type of a model element
+    Subclasses of the model classes get the type of their nearest registered base class (looked up once per class)
+
+    :return: ActivityType or None, if the element isn't a registered flow element
+    '''
+    element_class = type(element)
+    try:
+        return _TYPES_BY_CLASS[element_class]
+    except KeyError:
+        activity_type = next((_TYPES_BY_CLASS[x] for x in element_class.__mro__ if x in _TYPES_BY_CLASS), None)
+        _TYPES_BY_CLASS[element_class] = activity_type
+        return activity_type
+
+def get_activitie_object_type(activity_obj):
+    '''
+    Identifies the general type, of an activity element
+
+    :param activity_obj:
+    :return: one of the following strings (task, gateway, event, subprocess) depending on what kind of BPMN Object the activity represents
+        or an empty string if no type could be identified
+    '''
+    if not isinstance(activity_obj, dict):
+        return ""
+    activity_type = activity_obj.get("type")
+    if not isinstance(activity_type, str) or activity_type not in ACTIVITY_TYPES:
+        return ""
+    return ACTIVITY_TYPES[activity_type].object_type
@@ -0,0 +1,106 @@
+"""Importable conversion API
+
+Converts many playbooks in one interpreter, sharing the parsed modules between them:
+
+    from yaml2bpmn_converter.api import convert_many, default_module_roots
+
+    for result in convert_many(["playbooks"], roots=default_module_roots("playbooks")):
+        print(result.process_name, result.error or len(result.bpmn_xml))
+
+validate_many checks playbooks for broken references without converting them (e.g. in a pre-commit hook).
+
+Nothing depends on the working directory, all paths are taken as given.
+"""
+import os
+
+from .combiner import ConversionResult, check_playbook, convert_playbooks, find_playbook_files
+from .module_index import ModuleIndex, DEFAULT_MAX_MODULE_DEPTH
+from .yaml_loader import YamlLoader
+from .profiling import StageProfiler, NULL_PROFILER
+from .validator import ValidationIssue
+from .discovery import DiscoveryRules, discover_playbooks
+
+SHARED_MODULE_DIRECTORY = "05_documentation"  # directory of the shared modules within the playbooks directory
+
+def default_module_roots(start_directory: str) -> list[str]:
+    """Shared module roots of a playbooks directory: 05_documentation and 05_documentation/modules"""
+    shared_directory = os.path.join(start_directory, SHARED_MODULE_DIRECTORY)
+    return [shared_directory, os.path.join(shared_directory, "modules")]
+
+def expand_paths(paths, discovery_rules: DiscoveryRules = None) -> list[tuple[str, str]]:
+    '''
+    Turns playbook files and playbooks directories into (playbook_phase, playbook_file) tuples
+
+    :param paths: playbook files (their directory is the playbook phase) or
+        playbooks directories with the layout <directory>/<playbook>/<phase>/<playbook file>
+    :param discovery_rules: include and exclude rules selecting the playbook files of the playbooks directories,
+        see discovery.discover_playbooks. By default the layout above is searched
+    :return: list of (playbook_phase, playbook_file) tuples in the order of the paths
+    '''
+    playbooks = []
+    for path in paths:
+        if os.path.isdir(path) and discovery_rules is not None:
+            playbooks.extend(discover_playbooks(path, discovery_rules, collect_stats=False).playbooks())
+        elif os.path.isdir(path):
+            playbooks.extend(find_playbook_files(path))
+        else:
+            playbooks.append((os.path.dirname(path) or ".", path))
+    return playbooks
+
+def convert_many(paths, roots: list[str] = None, jobs: int = 1, yaml_cache: str = None,
+                 module_index: ModuleIndex = None, yaml_loader: YamlLoader = None, render_xml: bool = True,
+                 profiler: StageProfiler = NULL_PROFILER, layout: bool = True,
+                 max_module_depth: int = DEFAULT_MAX_MODULE_DEPTH, discovery_rules: DiscoveryRules = None,
+                 export_formats: tuple[str, ...] = ()):
+    '''
+    Combines playbooks with their modules and converts them into BPMN
+
+    :param paths: playbook files and playbooks directories, see expand_paths
+    :param roots: shared module directories, searched after the modules directory of the playbook phase
+    :param jobs: number of worker processes, with 1 all playbooks are converted in this process
+    :param yaml_cache: directory of the persistent cache of parsed yaml files, None disables it
+    :param module_index: index to resolve and cache modules, pass the same index to several calls to keep
+        the parsed modules. If given, roots is ignored
+    :param yaml_loader: loader for the yaml files. If given, yaml_cache is ignored
+    :param render_xml: if False, results converted in this process contain the BPMN process instead of the xml,
+        which can be streamed into a file with combiner.write_bpmn_file
+    :param profiler: collects the time of every stage
+    :param layout: add the diagram (BPMNDI shapes and edges) to the BPMN files
+    :param max_module_depth: maximum number of nested modules. Ignored if module_index is given
+    :param discovery_rules: rules selecting the playbook files of playbooks directories, see expand_paths
+    :param export_formats: formats rendered besides BPMN (see exporters.EXPORT_FORMATS), e.g. ("mermaid", "dot").
+        Rendered results contain them in ConversionResult.exports
+    :return: iterator of ConversionResult, in the order of the playbooks. Failed conversions have error set
+    '''
+    if yaml_loader is None:
+        yaml_loader = YamlLoader(yaml_cache)
+    if module_index is None:
+        module_index = ModuleIndex(yaml_loader.load, roots, max_module_depth)
+    return convert_playbooks(expand_paths(paths, discovery_rules), jobs, module_index, yaml_loader, profiler, render_xml, layout,
+                             export_formats=export_formats)
+
+def validate_many(paths, roots: list[str] = None, yaml_cache: str = None, module_index: ModuleIndex = None,
+                  yaml_loader: YamlLoader = None, profiler: StageProfiler = NULL_PROFILER,
+                  max_module_depth: int = DEFAULT_MAX_MODULE_DEPTH,
+                  discovery_rules: DiscoveryRules = None) -> list[ValidationIssue]:
+    '''
+    Combines playbooks with their modules and validates them, without converting anything
+
+    :param paths: playbook files and playbooks directories, see expand_paths
+    :param roots: shared module directories, searched after the modules directory of the playbook phase
+    :param yaml_cache: directory of the persistent cache of parsed yaml files, None disables it
+    :param module_index: index to resolve and cache modules. If given, roots is ignored
+    :param yaml_loader: loader for the yaml files. If given, yaml_cache is ignored
+    :param profiler: collects the time of every stage
+    :param max_module_depth: maximum number of nested modules. Ignored if module_index is given
+    :param discovery_rules: rules selecting the playbook files of playbooks directories, see expand_paths
+    :return: issues of all playbooks, in the order of the playbooks. Errors would fail the conversion
+    '''
+    if yaml_loader is None:
+        yaml_loader = YamlLoader(yaml_cache)
+    if module_index is None:
+        module_index = ModuleIndex(yaml_loader.load, roots, max_module_depth)
+    issues = []
+    for playbook_phase, playbook_file in expand_paths(paths, discovery_rules):
+        issues.extend(check_playbook(playbook_phase, playbook_file, module_index, yaml_loader, profiler))
+    return issues
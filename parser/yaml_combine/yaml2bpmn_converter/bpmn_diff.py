@@ -0,0 +1,379 @@
+"""Structural diff of two versions of BPMN processes, run from parser/yaml_combine:
+
+    python -m yaml2bpmn_converter.bpmn_diff OLD NEW [--format markdown|text] [--limit N] [-o FILE]
+
+OLD and NEW are BPMN files, IR files with a BPMN model (see combined_ir) or directories, whose files are
+compared by name. The report lists added, removed and changed activities, flows and conditions, and is
+short enough for the description of a pull request. Exit code: 0 without differences, 1 with differences.
+"""
+import os
+import sys
+import argparse
+import xml.etree.ElementTree as ET
+
+from .bpmn_object_models import *
+from .activity_types import element_type
+from .bpmn_importer import original_activity_name, read_bpmn_processes
+from .combined_ir import IR_FILE_EXTENSION, IRFormatError, load_ir
+
+# --- Structural Diff
+
+# The converter numbers all activities with one counter per playbook, so a single inserted activity changes
+# the ids of many others. Elements are therefore aligned by their original activity name (the id without
+# the number) within their container, then by their id and at last by an explicit name of the same type.
+# Containers are compared top down, each pair of aligned subprocesses once, and every lookup goes through
+# a dict, so the diff takes linear time. Flows are compared by the aligned names of their source and target,
+# start and end events only by their position ("(start)", "(end)"): their ids carry no meaning.
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+RENAMED = "renamed"
+FLOW_ADDED = "flow added"
+FLOW_REMOVED = "flow removed"
+CONDITION_CHANGED = "condition changed"
+CHANGE_KINDS = [ADDED, REMOVED, CHANGED, RENAMED, FLOW_ADDED, FLOW_REMOVED, CONDITION_CHANGED]
+
+_START = "(start)"
+_END = "(end)"
+
+class Change:
+    """One difference between the processes"""
+    __slots__ = ("kind", "path", "detail")
+
+    def __init__(self, kind: str, path: str, detail: str = None):
+        self.kind = kind  # one of CHANGE_KINDS
+        self.path = path  # aligned activity names from the process to the element, e.g. "triage/check_alert"
+        self.detail = detail
+
+    def __str__(self) -> str:
+        return f"{self.kind}: {self.path}" + (f" ({self.detail})" if self.detail else "")
+
+    def __repr__(self) -> str:
+        return f"Change({self.kind!r}, {self.path!r}, {self.detail!r})"
+
+class ProcessDiff:
+    """Differences between two versions of a process"""
+    def __init__(self, process_id: str, changes: list[Change] = None):
+        self.process_id = process_id
+        self.changes: list[Change] = changes if changes is not None else []
+
+    def __bool__(self) -> bool:
+        return bool(self.changes)
+
+    def counts(self) -> dict[str, int]:
+        counts = {}
+        for change in self.changes:
+            counts[change.kind] = counts.get(change.kind, 0) + 1
+        return counts
+
+def _type_code(element: BPMNFlowElement) -> str:
+    activity_type = element_type(element)
+    return activity_type.code if activity_type is not None and activity_type.code else type(element).__name__
+
+def _explicit_name(element: BPMNFlowElement) -> str | None:
+    '''Name given in the playbook, None if the name defaults to the id'''
+    return element.name if element.name != element.id else None
+
+def _local_names(container: BPMNProcess | BPMNSubProcess) -> dict[str, BPMNFlowElement]:
+    '''
+    Activities of a container by their original name. Start and end events are left out
+    Activities with the same original name are numbered in the order of the container: "check", "check#2"
+    '''
+    names = {}
+    occurrences = {}
+    for element in container.flow_elements:
+        if isinstance(element, BPMNEvent):
+            continue
+        name = original_activity_name(element.id)
+        occurrence = occurrences[name] = occurrences.get(name, 0) + 1
+        if occurrence > 1:
+            name = f"{name}#{occurrence}"
+            while name in names:  # an activity is actually called "check#2"
+                occurrence = occurrences[name] = occurrences.get(name, 0) + 1
+                name = f"{name}#{occurrence}"
+        names[name] = element
+    return names
+
+def _align(old_names: dict, new_names: dict) -> dict[str, str]:
+    '''
+    Aligns the activities of two versions of a container: by id, then by original name, then by type and explicit name
+
+    :return: new name -> old name of every aligned activity
+    '''
+    old_by_id = {element.id: name for name, element in old_names.items()}
+    aligned = {}
+    for new_name, element in new_names.items():
+        old_name = old_by_id.pop(element.id, None)
+        if old_name is not None:
+            aligned[new_name] = old_name
+    if len(aligned) == len(new_names) or not old_by_id:
+        return aligned
+
+    # the ids have been renumbered: activities with the same original name are aligned in their order
+    old_by_original_name = {}
+    for old_name in old_by_id.values():
+        old_by_original_name.setdefault(original_activity_name(old_names[old_name].id), []).append(old_name)
+    for old_names_list in old_by_original_name.values():
+        old_names_list.reverse()  # popped from the end, in the order of the container
+    unmatched_old = set(old_by_id.values())
+    for new_name, element in new_names.items():
+        if new_name in aligned:
+            continue
+        candidates = old_by_original_name.get(original_activity_name(element.id))
+        if candidates:
+            aligned[new_name] = candidates.pop()
+            unmatched_old.discard(aligned[new_name])
+
+    # the activity has been renamed, but kept its type and its explicit name
+    old_by_explicit_name = {}
+    for old_name in unmatched_old:
+        element = old_names[old_name]
+        explicit_name = _explicit_name(element)
+        if explicit_name is not None:
+            key = (_type_code(element), explicit_name)
+            old_by_explicit_name[key] = None if key in old_by_explicit_name else old_name  # ambiguous names aren't aligned
+    for new_name, element in new_names.items():
+        explicit_name = _explicit_name(element)
+        if new_name in aligned or explicit_name is None:
+            continue
+        old_name = old_by_explicit_name.pop((_type_code(element), explicit_name), None)
+        if old_name is not None:
+            aligned[new_name] = old_name
+    return aligned
+
+def _flow_endpoint(container, element_id: str, names_by_id: dict[str, str]) -> str:
+    element = container.get_element(element_id)
+    if isinstance(element, BPMNStartEvent):
+        return _START
+    if isinstance(element, BPMNEndEvent):
+        return _END
+    return names_by_id.get(element_id, element_id)
+
+def _flows(container, names_by_id: dict[str, str]) -> dict[tuple[str, str], list]:
+    '''Conditions of the flows of a container by (source name, target name)'''
+    flows = {}
+    for flow in container.sequence_flows:
+        key = (_flow_endpoint(container, flow.source_ref, names_by_id),
+               _flow_endpoint(container, flow.target_ref, names_by_id))
+        flows.setdefault(key, []).append(flow.condition_expression)
+    return flows
+
+def _count_elements(container: BPMNProcess | BPMNSubProcess) -> int:
+    '''Number of activities within a container, including the ones of nested subprocesses'''
+    count = 0
+    containers = [container]
+    while containers:
+        for element in containers.pop().flow_elements:
+            if not isinstance(element, BPMNEvent):
+                count += 1
+                if isinstance(element, BPMNSubProcess):
+                    containers.append(element)
+    return count
+
+def _quoted_name(element: BPMNFlowElement) -> str:
+    explicit_name = _explicit_name(element)
+    return f"\"{explicit_name}\"" if explicit_name is not None else "(none)"
+
+def _describe(element: BPMNFlowElement) -> str:
+    detail = _type_code(element)
+    if _explicit_name(element) is not None:
+        detail += f", \"{element.name}\""
+    if isinstance(element, BPMNSubProcess):
+        detail += f", {_count_elements(element)} activities"
+    return detail
+
+def _path(prefix: str, name: str) -> str:
+    return f"{prefix}/{name}" if prefix else name
+
+def diff_processes(old_process: BPMNProcess, new_process: BPMNProcess) -> ProcessDiff:
+    '''
+    Compares two versions of a process
+
+    :return: ProcessDiff, the changes are ordered container by container, top down
+    '''
+    diff = ProcessDiff(new_process.id)
+    changes = diff.changes
+    containers = [(old_process, new_process, "")]
+    while containers:
+        old_container, new_container, prefix = containers.pop()
+        old_names = _local_names(old_container)
+        new_names = _local_names(new_container)
+        aligned = _align(old_names, new_names)
+        aligned_old = set(aligned.values())
+
+        for old_name, element in old_names.items():
+            if old_name not in aligned_old:
+                changes.append(Change(REMOVED, _path(prefix, old_name), _describe(element)))
+        inner_containers = []
+        for new_name, new_element in new_names.items():
+            old_name = aligned.get(new_name)
+            if old_name is None:
+                changes.append(Change(ADDED, _path(prefix, new_name), _describe(new_element)))
+                continue
+            old_element = old_names[old_name]
+            path = _path(prefix, old_name)
+            if original_activity_name(old_element.id) != original_activity_name(new_element.id):
+                changes.append(Change(RENAMED, path, f"now {original_activity_name(new_element.id)}"))
+            details = []
+            if _type_code(old_element) != _type_code(new_element):
+                details.append(f"type {_type_code(old_element)} -> {_type_code(new_element)}")
+            if _explicit_name(old_element) != _explicit_name(new_element):
+                details.append(f"name {_quoted_name(old_element)} -> {_quoted_name(new_element)}")
+            if details:
+                changes.append(Change(CHANGED, path, ", ".join(details)))
+            if isinstance(old_element, BPMNSubProcess) and isinstance(new_element, BPMNSubProcess):
+                inner_containers.append((old_element, new_element, path))
+
+        # flows of the new version are named like the aligned activities of the old version
+        old_ids = {element.id: name for name, element in old_names.items()}
+        new_ids = {element.id: aligned.get(name, name) for name, element in new_names.items()}
+        old_flows = _flows(old_container, old_ids)
+        new_flows = _flows(new_container, new_ids)
+        for key, old_conditions in old_flows.items():
+            new_conditions = new_flows.get(key, [])
+            flow_path = _path(prefix, f"{key[0]} -> {key[1]}")
+            if len(old_conditions) == 1 and len(new_conditions) == 1:
+                if old_conditions[0] != new_conditions[0]:
+                    changes.append(Change(CONDITION_CHANGED, flow_path,
+                                          f"{old_conditions[0]!r} -> {new_conditions[0]!r}"))
+                continue
+            remaining = list(new_conditions)
+            for condition in old_conditions:
+                if condition in remaining:
+                    remaining.remove(condition)
+                else:
+                    changes.append(Change(FLOW_REMOVED, flow_path, f"if {condition!r}" if condition else None))
+            for condition in remaining:
+                changes.append(Change(FLOW_ADDED, flow_path, f"if {condition!r}" if condition else None))
+        for key, new_conditions in new_flows.items():
+            if key not in old_flows:
+                for condition in new_conditions:
+                    changes.append(Change(FLOW_ADDED, _path(prefix, f"{key[0]} -> {key[1]}"),
+                                          f"if {condition!r}" if condition else None))
+        # keep the order of the container for the inner subprocesses
+        containers.extend(reversed(inner_containers))
+    return diff
+
+# --- Report
+
+_SECTION_TITLES = {ADDED: "Added", REMOVED: "Removed", CHANGED: "Changed", RENAMED: "Renamed",
+                   FLOW_ADDED: "Flows added", FLOW_REMOVED: "Flows removed", CONDITION_CHANGED: "Conditions changed"}
+
+def summary_line(diff: ProcessDiff) -> str:
+    counts = diff.counts()
+    return ", ".join(f"{kind}: {counts[kind]}" for kind in CHANGE_KINDS if kind in counts) or "no changes"
+
+def format_diff(diff: ProcessDiff, markdown: bool = True, limit: int = 20) -> str:
+    '''
+    Report of one process, grouped by kind of change
+
+    :param markdown: markdown for pull requests, plain text otherwise
+    :param limit: maximum number of lines per kind of change, the remaining changes are only counted
+    '''
+    lines = [f"### {diff.process_id}" if markdown else f"{diff.process_id}:", summary_line(diff)]
+    grouped = {}
+    for change in diff.changes:
+        grouped.setdefault(change.kind, []).append(change)
+    for kind in CHANGE_KINDS:
+        changes = grouped.get(kind)
+        if not changes:
+            continue
+        lines.append(f"\n**{_SECTION_TITLES[kind]}**" if markdown else f"  {_SECTION_TITLES[kind]}:")
+        for change in changes[:limit]:
+            path = f"`{change.path}`" if markdown else change.path
+            detail = f" ({change.detail})" if change.detail else ""
+            lines.append(f"- {path}{detail}" if markdown else f"    {path}{detail}")
+        if len(changes) > limit:
+            more = f"... and {len(changes) - limit} more"
+            lines.append(f"- {more}" if markdown else f"    {more}")
+    return "\n".join(lines)
+
+def load_processes(path: str) -> dict[str, BPMNProcess]:
+    '''
+    Reads the processes of a BPMN file or the model of an IR file
+
+    :return: process id -> process
+    :raises ValueError: if a BPMN file isn't valid xml or an IR file doesn't contain a BPMN model
+    '''
+    if path.endswith(IR_FILE_EXTENSION):
+        combined = load_ir(path)
+        if combined.bpmn_process is None:
+            raise ValueError(f"{path}: the IR file doesn't contain the BPMN model")
+        return {combined.bpmn_process.id: combined.bpmn_process}
+    try:
+        return {bpmn_process.id: bpmn_process for bpmn_process in read_bpmn_processes(path)}
+    except ET.ParseError as exc:
+        raise ValueError(f"{path}: {exc}") from exc
+
+def _model_files(directory: str) -> dict[str, str]:
+    with os.scandir(directory) as entries:
+        return {entry.name: entry.path for entry in entries
+                if entry.is_file() and entry.name.endswith((".bpmn", IR_FILE_EXTENSION))}
+
+def diff_paths(old_path: str, new_path: str) -> tuple[list[str], list[str], list[ProcessDiff]]:
+    '''
+    Compares two files or two directories of files
+
+    :return: (added processes, removed processes, diffs of the changed processes)
+    '''
+    if os.path.isdir(old_path) or os.path.isdir(new_path):
+        old_files = _model_files(old_path) if os.path.isdir(old_path) else {}
+        new_files = _model_files(new_path) if os.path.isdir(new_path) else {}
+        file_pairs = [(old_files.get(name), new_files.get(name)) for name in sorted(old_files.keys() | new_files.keys())]
+    else:
+        file_pairs = [(old_path, new_path)]
+
+    added, removed, diffs = [], [], []
+    for old_file, new_file in file_pairs:
+        old_processes = load_processes(old_file) if old_file else {}
+        new_processes = load_processes(new_file) if new_file else {}
+        removed.extend(process_id for process_id in old_processes if process_id not in new_processes)
+        for process_id, new_process in new_processes.items():
+            old_process = old_processes.get(process_id)
+            if old_process is None:
+                added.append(process_id)
+                if len(old_processes) != 1 or len(new_processes) != 1:
+                    continue
+                # the only process of the file has been renamed, its content is compared as well
+                old_process = next(iter(old_processes.values()))
+            diff = diff_processes(old_process, new_process)
+            if diff:
+                diffs.append(diff)
+    return added, removed, diffs
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m yaml2bpmn_converter.bpmn_diff", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", help="BPMN file, IR file or directory of the old version")
+    parser.add_argument("new", help="BPMN file, IR file or directory of the new version")
+    parser.add_argument("--format", choices=["markdown", "text"], default="markdown",
+                        help="markdown for pull request descriptions or plain text (default: markdown)")
+    parser.add_argument("--limit", type=int, default=20, metavar="N",
+                        help="maximum number of listed changes per kind and process (default: 20)")
+    parser.add_argument("-o", "--output", metavar="FILE", help="write the report into a file instead of stdout")
+    arguments = parser.parse_args(argv)
+
+    try:
+        added, removed, diffs = diff_paths(arguments.old, arguments.new)
+    except (OSError, ValueError, IRFormatError) as exc:
+        print(f"failed to compare: {exc}", file=sys.stderr)
+        return 2
+
+    markdown = arguments.format == "markdown"
+    sections = []
+    if added:
+        sections.append("Added processes: " + ", ".join(f"`{x}`" if markdown else x for x in added))
+    if removed:
+        sections.append("Removed processes: " + ", ".join(f"`{x}`" if markdown else x for x in removed))
+    sections.extend(format_diff(diff, markdown, arguments.limit) for diff in diffs)
+    report = "\n\n".join(sections) if sections else "No structural changes."
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 1 if sections else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
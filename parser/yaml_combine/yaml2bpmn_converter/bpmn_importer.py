@@ -0,0 +1,354 @@
+"""Imports BPMN files into the playbook format, run from parser/yaml_combine:
+
+    python -m yaml2bpmn_converter.bpmn_importer BPMN_FILE [BPMN_FILE ...] [-o OUTPUT_DIRECTORY]
+
+Every process of a BPMN file becomes one playbook file <process id>.yml.
+Start and end events aren't written, the converter adds them again. Sequence flows become goto values,
+flows of exclusive and inclusive gateways with conditions become "if"/"then" branches,
+the flows of parallel gateways become a list of targets.
+"""
+import os
+import re
+import sys
+import logging
+import argparse
+import xml.etree.ElementTree as ET
+
+from .bpmn_object_models import *
+from .activity_types import ACTIVITY_TYPES, DEFAULT_ACTIVITY_TYPE, element_type
+from .xml_generator import BPMN_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+# --- BPMN Reader
+
+# The file is read with iterparse: every element is cleared and removed from its parent as soon as it has been
+# converted into the model, so only the open elements of the current path are held in memory, no matter how
+# large the export is. The diagram (BPMNDI) is skipped, the converter lays out the process again.
+
+_PREFIX = "{" + BPMN_NAMESPACE + "}"
+_PROCESS_TAG = _PREFIX + "process"
+_SUBPROCESS_TAG = _PREFIX + "subProcess"
+_SEQUENCE_FLOW_TAG = _PREFIX + "sequenceFlow"
+_CONDITION_TAG = _PREFIX + "conditionExpression"
+_FLOW_REF_TAGS = {_PREFIX + "incoming": "incoming", _PREFIX + "outgoing": "outgoing"}
+_EVENT_TAGS = {_PREFIX + "startEvent": BPMNStartEvent, _PREFIX + "endEvent": BPMNEndEvent}
+# (element tag, tag of the event definition or None) -> activity type
+_TYPES_BY_TAG = {(_PREFIX + activity_type.bpmn_tag,
+                  _PREFIX + activity_type.definition_tag if activity_type.definition_tag else None): activity_type
+                 for activity_type in ACTIVITY_TYPES.values()}
+_DEFINITION_TAGS = {definition_tag for tag, definition_tag in _TYPES_BY_TAG if definition_tag}
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+class _RootTagFilter:
+    """Binary file wrapper, which removes repeated identical attributes from the start tag of the root element
+
+    BPMN files written by the converter declare xmlns:xsi twice if the process contains conditions,
+    which isn't well-formed xml. The rest of the file is passed through unchanged.
+    """
+    _ATTRIBUTE_PATTERN = re.compile(rb'\s+([^\s=/>]+)\s*=\s*("[^"]*"|\'[^\']*\')')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.head = self._read_root_tag()
+
+    def _read_root_tag(self) -> bytes:
+        head = b""
+        position = 0
+        while True:
+            chunk = self.stream.read(64 * 1024)
+            head += chunk
+            # the root start tag is the first tag which isn't a declaration, processing instruction or comment
+            for match in re.finditer(rb"<(?![?!])", head[position:]):
+                start = position + match.start()
+                end = self._tag_end(head, start)
+                if end is not None:
+                    return head[:start] + self._deduplicate(head[start:end]) + head[end:]
+                break
+            if not chunk:
+                return head
+
+    @staticmethod
+    def _tag_end(data: bytes, start: int) -> int | None:
+        quote = None
+        for position in range(start, len(data)):
+            character = data[position:position + 1]
+            if quote:
+                if character == quote:
+                    quote = None
+            elif character in (b'"', b"'"):
+                quote = character
+            elif character == b">":
+                return position + 1
+        return None
+
+    def _deduplicate(self, tag: bytes) -> bytes:
+        seen = set()
+
+        def keep_first(match):
+            attribute = (match.group(1), match.group(2)[1:-1])
+            if attribute in seen:
+                return b""
+            seen.add(attribute)
+            return match.group(0)
+        return self._ATTRIBUTE_PATTERN.sub(keep_first, tag)
+
+    def read(self, size: int = -1) -> bytes:
+        if self.head:
+            if size is None or size < 0:
+                data, self.head = self.head + self.stream.read(), b""
+            else:
+                data, self.head = self.head[:size], self.head[size:]
+            return data
+        return self.stream.read(size)
+
+class _OpenElement:
+    """Flow element whose xml element hasn't ended yet"""
+    __slots__ = ("tag", "attributes", "depth", "definition_tag", "definition_id", "incoming", "outgoing", "element")
+
+    def __init__(self, tag: str, attributes: dict, depth: int, element=None):
+        self.tag = tag
+        self.attributes = attributes
+        self.depth = depth
+        self.definition_tag = None
+        self.definition_id = None
+        self.incoming = []
+        self.outgoing = []
+        self.element = element  # model element, only set for subprocesses, which are created at their start tag
+
+def _flow_element(open_element: _OpenElement) -> BPMNFlowElement | None:
+    '''Creates the model element of a flow node, None for elements which aren't flow nodes (e.g. text annotations)'''
+    element_id = open_element.attributes.get("id")
+    name = open_element.attributes.get("name")
+    if open_element.tag in _EVENT_TAGS:
+        return _EVENT_TAGS[open_element.tag](element_id, name)
+    activity_type = _TYPES_BY_TAG.get((open_element.tag, open_element.definition_tag))
+    if activity_type is None:
+        if not open_element.incoming and not open_element.outgoing:
+            return None
+        logger.warning("[-] Unsupported element %s \"%s\", it is imported as a task", _local_name(open_element.tag),
+                       element_id)
+        activity_type = DEFAULT_ACTIVITY_TYPE
+    if activity_type.definition_tag:
+        return activity_type.model_class(element_id, name, open_element.definition_id)
+    return activity_type.model_class(element_id, name)
+
+def read_bpmn_processes(source) -> list[BPMNProcess]:
+    '''
+    Reads the processes of a BPMN file into the model, with iterparse and bounded memory
+
+    :param source: path or binary file object of the BPMN file
+    :return: list of BPMNProcess, in the order of the file
+    '''
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return read_bpmn_processes(f)
+
+    processes = []
+    containers: list[tuple[BPMNProcess | BPMNSubProcess, int]] = []  # open processes and subprocesses with their depth
+    open_elements: list[_OpenElement] = []  # open flow nodes, including the open subprocesses
+    xml_elements = []  # xml elements of the current path, used to remove finished elements from their parent
+    flow_attributes = None  # attributes of the open sequence flow
+    condition = None
+    for event, xml_element in ET.iterparse(_RootTagFilter(source), events=("start", "end")):
+        tag = xml_element.tag
+        if event == "start":
+            depth = len(xml_elements)
+            xml_elements.append(xml_element)
+            is_container_child = bool(containers) and containers[-1][1] == depth - 1
+            if tag == _PROCESS_TAG:
+                process = BPMNProcess(xml_element.get("id"), xml_element.get("name"),
+                                      xml_element.get("isExecutable", "true").lower() == "true")
+                processes.append(process)
+                containers.append((process, depth))
+            elif tag == _SEQUENCE_FLOW_TAG and is_container_child:
+                flow_attributes, condition = dict(xml_element.attrib), None
+            elif tag == _SUBPROCESS_TAG and is_container_child:
+                sub_process = BPMNSubProcess(xml_element.get("id"), xml_element.get("name"))
+                open_elements.append(_OpenElement(tag, dict(xml_element.attrib), depth, sub_process))
+                containers.append((sub_process, depth))
+            elif (is_container_child and tag.startswith(_PREFIX)
+                  and tag not in _FLOW_REF_TAGS and tag not in _DEFINITION_TAGS):
+                # the incoming/outgoing references of an open subprocess are children of the subprocess as well,
+                # they belong to the subprocess and aren't flow nodes
+                open_elements.append(_OpenElement(tag, dict(xml_element.attrib), depth))
+            elif tag in _DEFINITION_TAGS and open_elements and open_elements[-1].depth == depth - 1:
+                open_elements[-1].definition_tag = tag
+                open_elements[-1].definition_id = xml_element.get("id")
+            continue
+
+        xml_elements.pop()
+        depth = len(xml_elements)
+        if tag in _FLOW_REF_TAGS and open_elements and open_elements[-1].depth == depth - 1:
+            getattr(open_elements[-1], _FLOW_REF_TAGS[tag]).append((xml_element.text or "").strip())
+        elif tag == _CONDITION_TAG and flow_attributes is not None:
+            condition = xml_element.text
+        elif tag == _SEQUENCE_FLOW_TAG and flow_attributes is not None:
+            containers[-1][0].add_sequence_flow(BPMNSequenceFlow(
+                flow_attributes.get("id"), flow_attributes.get("sourceRef"), flow_attributes.get("targetRef"),
+                flow_attributes.get("name"), condition))
+            flow_attributes = None
+        elif containers and containers[-1][1] == depth and (tag == _PROCESS_TAG or tag == _SUBPROCESS_TAG):
+            container = containers.pop()[0]
+            if tag == _SUBPROCESS_TAG:
+                open_element = open_elements.pop()
+                _add_flow_element(containers[-1][0], container, open_element)
+        elif open_elements and open_elements[-1].depth == depth:
+            open_element = open_elements.pop()
+            element = _flow_element(open_element)
+            if element is not None:
+                _add_flow_element(containers[-1][0], element, open_element)
+
+        # the element has been converted, drop it. It is the only child left in its parent
+        xml_element.clear()
+        if xml_elements:
+            xml_elements[-1].remove(xml_element)
+    return processes
+
+def _add_flow_element(container: BPMNProcess | BPMNSubProcess, element: BPMNFlowElement, open_element: _OpenElement):
+    for flow_id in open_element.incoming:
+        element.add_incoming_flow(flow_id)
+    for flow_id in open_element.outgoing:
+        element.add_outgoing_flow(flow_id)
+    if isinstance(element, BPMNStartEvent) and container.start_event is None:
+        container.set_start_event(element)
+    elif isinstance(element, BPMNEndEvent):
+        container.add_end_event(element)
+    container.add_flow_element(element)
+
+# --- Playbook Export
+
+_COUNTER_PATTERN = re.compile(r"^(.+)_\d+$")
+
+def original_activity_name(activity_id: str) -> str:
+    '''Activity id without the number added by the converter: "gather_alert_data_1" -> "gather_alert_data"'''
+    match = _COUNTER_PATTERN.match(activity_id)
+    return match.group(1) if match else activity_id
+
+def _activity_names(elements: list[BPMNFlowElement], strip_counters: bool) -> dict[str, str]:
+    '''
+    Returns the activity name of every element id of one block
+    With strip_counters the number added by the converter ("gather_alert_data_1") is removed again,
+    unless two activities of the block would get the same name
+    '''
+    names = {element.id: element.id for element in elements}
+    if not strip_counters:
+        return names
+    stripped = {}
+    for element in elements:
+        name = original_activity_name(element.id)
+        if name != element.id:
+            stripped[element.id] = name
+    counts = {}
+    for name in list(stripped.values()) + [x for x in names if x not in stripped]:
+        counts[name] = counts.get(name, 0) + 1
+    for element_id, name in stripped.items():
+        if counts[name] == 1:
+            names[element_id] = name
+    return names
+
+def _goto(element: BPMNFlowElement, container: BPMNProcess | BPMNSubProcess, names: dict[str, str]):
+    '''Goto value of an element: its outgoing flows to other activities of the block (flows to end events are implicit)'''
+    flows = []
+    for flow_id in element.outgoing_flows:
+        flow = container.get_flow(flow_id)
+        if flow is not None and flow.target_ref in names:
+            flows.append(flow)
+    if not flows:
+        return None
+    if isinstance(element, BPMNParallelGateway) and len(flows) > 1:
+        # parallel branches have no condition, the name of a flow is kept as "if"
+        return [{"if": flow.name, "then": names[flow.target_ref]} if flow.name != flow.id else names[flow.target_ref]
+                for flow in flows]
+    if (isinstance(element, (BPMNExclusiveGateway, BPMNInclusiveGateway))
+            and (len(flows) > 1 or flows[0].condition_expression)):
+        branches = []
+        for flow in flows:
+            condition = flow.condition_expression
+            if not condition:
+                # the converter only creates flows for branches with a condition
+                condition = flow.name if flow.name != flow.id else "default"
+                logger.warning("[-] Flow %s of gateway %s has no condition, \"%s\" is used", flow.id, element.id,
+                               condition)
+            branches.append({"if": condition, "then": names[flow.target_ref]})
+        return branches
+    if len(flows) > 1:
+        logger.warning("[-] %s has %d outgoing flows, only gateways can branch: only the flow to %s is kept",
+                       element.id, len(flows), flows[0].target_ref)
+    return names[flows[0].target_ref]
+
+def process_to_playbook(bpmn_process: BPMNProcess, strip_counters: bool = True) -> dict:
+    '''
+    Turns a process into the playbook data structure (process, activities, type, name, goto, if/then)
+
+    :param bpmn_process: process read by read_bpmn_processes
+    :param strip_counters: remove the numbers added to the activity names by the converter,
+        so converting the playbook again gives the same ids
+    :return: playbook dict, which can be dumped with playbook_to_yaml
+    '''
+    playbook = {"process": bpmn_process.id, "activities": {}}
+    # containers still to export: (process or subprocess, activities dict to fill)
+    containers = [(bpmn_process, playbook["activities"])]
+    while containers:
+        container, activities = containers.pop()
+        elements = [x for x in container.flow_elements if not isinstance(x, (BPMNStartEvent, BPMNEndEvent))]
+        names = _activity_names(elements, strip_counters)
+        for element in elements:
+            activity = {"type": element_type(element).code}
+            if element.name != element.id:
+                activity["name"] = element.name
+            goto = _goto(element, container, names)
+            if goto is not None:
+                activity["goto"] = goto
+            if isinstance(element, BPMNSubProcess):
+                activity["activities"] = {}
+                containers.append((element, activity["activities"]))
+            activities[names[element.id]] = activity
+    return playbook
+
+def playbook_to_yaml(playbook: dict) -> str:
+    import yaml
+    # keep the order of the keys, the order of the activities defines the order of the elements
+    return yaml.safe_dump(playbook, default_flow_style=False, sort_keys=False, allow_unicode=True)
+
+def import_bpmn_file(bpmn_file, strip_counters: bool = True) -> list[dict]:
+    '''
+    Reads a BPMN file and returns one playbook per process
+
+    :param bpmn_file: path or binary file object of the BPMN file
+    :param strip_counters: see process_to_playbook
+    :return: list of playbook dicts
+    '''
+    return [process_to_playbook(bpmn_process, strip_counters) for bpmn_process in read_bpmn_processes(bpmn_file)]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m yaml2bpmn_converter.bpmn_importer", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("bpmn_files", nargs="+", metavar="BPMN_FILE")
+    parser.add_argument("-o", "--output", default=".", metavar="DIRECTORY",
+                        help="directory for the playbook files (default: current directory)")
+    parser.add_argument("--keep-counters", dest="strip_counters", action="store_false",
+                        help="keep the numbers the converter added to the activity names")
+    arguments = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    failed = 0
+    os.makedirs(arguments.output, exist_ok=True)
+    for bpmn_file in arguments.bpmn_files:
+        try:
+            playbooks = import_bpmn_file(bpmn_file, arguments.strip_counters)
+        except (OSError, ET.ParseError) as exc:
+            print(f"failed to import {bpmn_file}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        for playbook in playbooks:
+            playbook_file = os.path.join(arguments.output, playbook["process"] + ".yml")
+            with open(playbook_file, "w", encoding="utf-8") as f:
+                f.write(playbook_to_yaml(playbook))
+            print(f"created playbook file: {playbook_file}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,65 +1,226 @@
+# --- Collections
+
+class IndexedList:
+    """Insertion ordered collection with O(1) membership test and lookup by key
+
+    Used for the flows and flow elements of the model. Items are identified by their key
+    (e.g. the id of an element), adding an item with an already known key is ignored.
+    Iterating, len(), bool() and access to the first and last item behave like a list.
+    """
+    __slots__ = ("_key", "_items")
+
+    def __init__(self, items=(), key=None):
+        self._key = key
+        self._items: dict = {}
+        for item in items:
+            self.add(item)
+
+    @classmethod
+    def by_id(cls, items=()) -> "IndexedList":
+        """Collection of model elements, indexed by their id"""
+        return cls(items, key=_element_id)
+
+    def add(self, item) -> bool:
+        '''
+        :return: True if the item has been added, False if an item with the same key already exists
+        '''
+        key = self._key(item) if self._key else item
+        if key in self._items:
+            return False
+        self._items[key] = item
+        return True
+
+    def append(self, item):
+        self.add(item)
+
+    def discard(self, item):
+        self._items.pop(self._key(item) if self._key else item, None)
+
+    def get(self, key, default=None):
+        return self._items.get(key, default)
+
+    def has_key(self, key) -> bool:
+        return key in self._items
+
+    def __contains__(self, item) -> bool:
+        key = self._key(item) if self._key else item
+        return key in self._items and (self._key is None or self._items[key] is item)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __reversed__(self):
+        return reversed(self._items.values())
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    def __getitem__(self, index: int):
+        if index == 0:
+            return next(iter(self._items.values()))
+        if index == -1:
+            return next(reversed(self._items.values()))
+        return list(self._items.values())[index]
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"IndexedList({list(self)!r})"
+
+def _element_id(element) -> str:
+    return element.id
+
+# Flow references of an element are stored in a tuple as long as there are only a few of them,
+# which is the case for nearly all elements. Elements with many flows (e.g. start events connected
+# to many tasks) switch to an IndexedList, so adding a flow stays O(1)
+SMALL_FLOW_REFS_LIMIT = 8
+
+def _add_flow_ref(flow_refs: tuple | IndexedList, flow_ref: str) -> tuple | IndexedList:
+    if isinstance(flow_refs, IndexedList):
+        flow_refs.add(flow_ref)
+        return flow_refs
+    if flow_ref in flow_refs:
+        return flow_refs
+    if len(flow_refs) < SMALL_FLOW_REFS_LIMIT:
+        return flow_refs + (flow_ref,)
+    return IndexedList(flow_refs + (flow_ref,))
+
 # --- BPMN Model Classes
 
+# All model classes define __slots__, so their instances don't carry a __dict__.
+# BPMNProcessTemplateMixin has empty slots, its attributes are declared by BPMNProcess and BPMNSubProcess,
+# otherwise BPMNSubProcess couldn't inherit from both BPMNTask and the mixin.
+
 class BPMNElement:  # -> FlowElement, SequenceFlow, Process
     """Base Class for all BPMN Elements"""
+    __slots__ = ("id", "name")
+
     def __init__(self, id: str, name: str = None):
         self.id = id
         self.name = name if name else id
 
 class BPMNFlowElement(BPMNElement):  # -> Task, Event
     """Base Class for elements that flows can connect"""
+    __slots__ = ("incoming_flows", "outgoing_flows")
+
     def __init__(self, id: str, name: str = None):
         super().__init__(id, name)
-        self.incoming_flows: list[str] = [] # <- maybe change type to BPMNSequenceFlow
-        self.outgoing_flows: list[str] = [] # <- maybe change type to BPMNSequenceFlow
+        self.incoming_flows: tuple | IndexedList = () # ids of the sequence flows
+        self.outgoing_flows: tuple | IndexedList = () # ids of the sequence flows
 
     def add_incoming_flow(self, flow_ref: str):
-        if flow_ref not in self.incoming_flows:
-            self.incoming_flows.append(flow_ref)
+        self.incoming_flows = _add_flow_ref(self.incoming_flows, flow_ref)
 
     def add_outgoing_flow(self, flow_ref: str):
-        if flow_ref not in self.outgoing_flows:
-            self.outgoing_flows.append(flow_ref)
+        self.outgoing_flows = _add_flow_ref(self.outgoing_flows, flow_ref)
 
-class BPMNTask(BPMNFlowElement):  # -> UserTask, SendTask, ManualTask, Gateway, Subprocess
-    """Base class for Tasks and Subprocesses"""
-    pass
+class BPMNTask(BPMNFlowElement):  # -> typed Tasks, Gateways, Intermediate Events, Subprocess
+    """Base class for Tasks and Subprocesses, also used for activities without a known type"""
+    __slots__ = ()
 
 class BPMNUserTask(BPMNTask):
     """Class for User Tasks (human with software assistance)"""
-    pass
+    __slots__ = ()
 
 class BPMNSendTask(BPMNTask):
     """Class for Send Tasks"""
-    pass
+    __slots__ = ()
+
+class BPMNReceiveTask(BPMNTask):
+    """Class for Receive Tasks"""
+    __slots__ = ()
 
 class BPMNManualTask(BPMNTask):
     """Class for Manual Tasks (human without software assistance)"""
-    pass
+    __slots__ = ()
+
+class BPMNBusinessRuleTask(BPMNTask):
+    """Class for Business Rule Tasks"""
+    __slots__ = ()
+
+class BPMNScriptTask(BPMNTask):
+    """Class for Script Tasks"""
+    __slots__ = ()
+
+class BPMNServiceTask(BPMNTask):
+    """Class for Service Tasks"""
+    __slots__ = ()
+
+class BPMNCallActivity(BPMNTask):
+    """Class for Call Activities (calls another process)"""
+    __slots__ = ()
 
-class BPMNIntimerEvent(BPMNTask):
+class BPMNIntermediateEvent(BPMNTask):  # -> Intimer, Signal, Message and Escalation Events
+    """Base class for Intermediate Events, which have one event definition"""
+    __slots__ = ("event_definition_id",)
+
+    def __init__(self, id: str, name: str = None, event_definition_id: str = None):
+        super().__init__(id, name)
+        self.event_definition_id = event_definition_id
+
+class BPMNIntimerEvent(BPMNIntermediateEvent):
     """Intermediate Catch Event"""
+    __slots__ = ()
+
     def __init__(self, id: str, name: str = None, timer_event_definition_id: str = None):
-        super().__init__(id, name)
-        self.timer_event_definition_id = timer_event_definition_id
+        super().__init__(id, name, timer_event_definition_id)
+
+    @property
+    def timer_event_definition_id(self) -> str:
+        return self.event_definition_id
+
+class BPMNSignalThrowEvent(BPMNIntermediateEvent):
+    """Intermediate Throw Event with a signal definition"""
+    __slots__ = ()
+
+class BPMNSignalCatchEvent(BPMNIntermediateEvent):
+    """Intermediate Catch Event with a signal definition"""
+    __slots__ = ()
+
+class BPMNMessageThrowEvent(BPMNIntermediateEvent):
+    """Intermediate Throw Event with a message definition"""
+    __slots__ = ()
+
+class BPMNMessageCatchEvent(BPMNIntermediateEvent):
+    """Intermediate Catch Event with a message definition"""
+    __slots__ = ()
+
+class BPMNEscalationThrowEvent(BPMNIntermediateEvent):
+    """Intermediate Throw Event with an escalation definition"""
+    __slots__ = ()
 
 class BPMNExclusiveGateway(BPMNTask):
     """Class for Exclusive Gateways"""
-    pass
+    __slots__ = ()
+
+class BPMNParallelGateway(BPMNTask):
+    """Class for Parallel Gateways"""
+    __slots__ = ()
+
+class BPMNInclusiveGateway(BPMNTask):
+    """Class for Inclusive Gateways"""
+    __slots__ = ()
 
 class BPMNEvent(BPMNFlowElement):  # -> StartEvent, EndEvent
     """Base Class for Events (start, end)"""
+    __slots__ = ()
 
 class BPMNStartEvent(BPMNEvent):
     """Start Event"""
-    pass
+    __slots__ = ()
 
 class BPMNEndEvent(BPMNEvent):
     """End Event"""
-    pass
+    __slots__ = ()
 
 class BPMNSequenceFlow(BPMNElement):
     """Class for Sequence Flows"""
+    __slots__ = ("source_ref", "target_ref", "condition_expression")
+
     def __init__(self, id: str, source_ref: str, target_ref: str, name: str = None, condition_expression: str = None):
         super().__init__(id, name)
         self.source_ref = source_ref
@@ -68,39 +229,97 @@ class BPMNSequenceFlow(BPMNElement):
 
 class BPMNProcessTemplateMixin(BPMNElement):
     """Base Class to define methods of Processes and Subprocesses"""
+    __slots__ = ()
 
     def __init__(self, id: str, name: str = None):
         super().__init__(id, name)
         self.start_event: BPMNStartEvent = None
-        self.end_events: list[BPMNEndEvent] = []
-        self.flow_elements: list[BPMNFlowElement] = []
-        self.sequence_flows: list[BPMNSequenceFlow] = []
+        self.end_events: IndexedList = IndexedList.by_id()
+        self._flow_elements: IndexedList = IndexedList.by_id()
+        self._sequence_flows: IndexedList = IndexedList.by_id()
+        self._graph = None  # ProcessGraph, built on first use
+
+    # flow elements and sequence flows are indexed by their id. Assigning a list replaces the whole index
+    @property
+    def flow_elements(self) -> IndexedList:
+        return self._flow_elements
+
+    @flow_elements.setter
+    def flow_elements(self, elements):
+        self._flow_elements = IndexedList.by_id(elements)
+        self._graph = None
+
+    @property
+    def sequence_flows(self) -> IndexedList:
+        return self._sequence_flows
+
+    @sequence_flows.setter
+    def sequence_flows(self, flows):
+        self._sequence_flows = IndexedList.by_id(flows)
+        self._graph = None
 
     def add_flow_element(self, element: BPMNFlowElement):
-        if element not in self.flow_elements:
-            self.flow_elements.append(element)
+        self._flow_elements.add(element)
+        self._graph = None
 
     def add_sequence_flow(self, flow: BPMNSequenceFlow):
-        if flow not in self.sequence_flows:
-            self.sequence_flows.append(flow)
+        self._sequence_flows.add(flow)
+        self._graph = None
 
     def add_end_event(self, end_event: BPMNEndEvent):
-        if end_event not in self.end_events:
-            self.end_events.append(end_event)
+        self.end_events.add(end_event)
+        self._graph = None
+
+    def get_element(self, id: str) -> BPMNFlowElement | None:
+        """Returns the flow element with the given id (direct children only) or None"""
+        return self._flow_elements.get(id)
+
+    def get_flow(self, id: str) -> BPMNSequenceFlow | None:
+        """Returns the sequence flow with the given id (direct children only) or None"""
+        return self._sequence_flows.get(id)
+
+    def get_source(self, flow: BPMNSequenceFlow) -> BPMNFlowElement | None:
+        return self._flow_elements.get(flow.source_ref)
+
+    def get_target(self, flow: BPMNSequenceFlow) -> BPMNFlowElement | None:
+        return self._flow_elements.get(flow.target_ref)
 
     def set_start_event(self, start_event: BPMNStartEvent):
         self.start_event = start_event
+        self._graph = None
 
     def clean_start_end_events(self):
         self.start_event = None
-        self.end_events = []
+        self.end_events = IndexedList.by_id()
+        self._graph = None
+
+    def graph(self):
+        '''
+        Returns the adjacency index of the direct elements (process_graph.ProcessGraph) for graph queries
+        It's built once and rebuilt after the container has been changed with the methods above.
+        Call invalidate_graph after changing flow_elements or sequence_flows directly.
+        '''
+        if self._graph is None:
+            from .process_graph import ProcessGraph
+            self._graph = ProcessGraph(self)
+        return self._graph
+
+    def invalidate_graph(self):
+        self._graph = None
 
 class BPMNProcess(BPMNProcessTemplateMixin):
     """Class for main Process"""
+    __slots__ = ("start_event", "end_events", "_flow_elements", "_sequence_flows", "_graph", "is_executable")
+
     def __init__(self, id: str, name: str = None, is_executable: bool = True):
         BPMNProcessTemplateMixin.__init__(self, id, name)
         self.is_executable = is_executable
 
 class BPMNSubProcess(BPMNTask, BPMNProcessTemplateMixin):
     """Class for subprocesses"""
-    pass
\ No newline at end of file
+    __slots__ = ("start_event", "end_events", "_flow_elements", "_sequence_flows", "_graph", "fragment")
+
+    def __init__(self, id: str, name: str = None):
+        super().__init__(id, name)
+        # FragmentTemplate, if the content is a copy of an already converted subprocess (see fragments.py)
+        self.fragment = None
@@ -0,0 +1,211 @@
+import os
+import json
+import hashlib
+
+# --- Build Manifest
+
+MANIFEST_VERSION = 1
+
+def hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def compute_converter_hash(source_files: list[str], options: dict = None) -> str:
+    """Hash over the source code of the converter and the options affecting the output.
+    A changed converter invalidates all outputs"""
+    converter_hash = hashlib.sha256()
+    if options:
+        converter_hash.update(json.dumps(options, sort_keys=True).encode())
+    for source_file in sorted(source_files):
+        converter_hash.update(os.path.basename(source_file).encode())
+        with open(source_file, "rb") as f:
+            converter_hash.update(f.read())
+    return converter_hash.hexdigest()
+
+class BuildManifest:
+    """Records the dependencies of every generated BPMN file to allow incremental rebuilds
+
+    For each playbook file the manifest stores the name of the output file, the module lookups
+    done by process_playbook (module name -> candidate module files) and the converter hash.
+    Hashes of the playbook and module files are stored once per file, together with mtime and size,
+    so unchanged files don't need to be read again. A reverse index maps every file to the playbooks
+    depending on it, so a changed module only invalidates the playbooks that use it.
+    """
+    def __init__(self, path: str | None, converter_hash: str):
+        self.path = path
+        self.converter_hash = converter_hash
+        self.playbooks: dict[str, dict] = {}  # playbook file -> entry
+        self.files: dict[str, dict] = {}  # playbook or module file -> {"sha256", "mtime_ns", "size"}
+        self._current_hashes: dict[str, str | None] = {}  # file -> current hash, computed at most once per run
+        self._known_stats: dict[str, tuple[int, int]] = {}  # file -> (mtime_ns, size), collected by the discovery
+
+    @classmethod
+    def load(cls, path: str, converter_hash: str) -> "BuildManifest":
+        '''
+        Loads an existing manifest. A missing, unreadable or outdated manifest results in an empty one,
+        which means that every playbook gets rebuilt.
+        '''
+        manifest = cls(path, converter_hash)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if data.get("version") != MANIFEST_VERSION or data.get("converter") != converter_hash:
+            return manifest
+        manifest.playbooks = data.get("playbooks", {})
+        manifest.files = data.get("files", {})
+        return manifest
+
+    def save(self):
+        '''Writes the manifest atomically (temporary file and rename). A manifest without path is kept in memory only'''
+        if self.path is None:
+            return
+        data = {
+            "version": MANIFEST_VERSION,
+            "converter": self.converter_hash,
+            "playbooks": self.playbooks,
+            "files": self.files,
+            "module_users": self.module_users()
+        }
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+    def current_hash(self, path: str) -> str | None:
+        '''
+        Returns the current hash of a file or None if it doesn't exist
+        The stored hash is reused, as long as mtime and size of the file didn't change.
+        '''
+        if path in self._current_hashes:
+            return self._current_hashes[path]
+        known_stat = self._known_stats.pop(path, None)
+        if known_stat is not None:
+            mtime_ns, size = known_stat
+        else:
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                self._current_hashes[path] = None
+                return None
+            mtime_ns, size = stat_result.st_mtime_ns, stat_result.st_size
+        recorded = self.files.get(path)
+        if recorded and recorded["mtime_ns"] == mtime_ns and recorded["size"] == size:
+            file_hash = recorded["sha256"]
+        else:
+            try:
+                file_hash = hash_file(path)
+            except FileNotFoundError:
+                file_hash = None  # removed since it has been discovered
+        self._current_hashes[path] = file_hash
+        if file_hash is not None:
+            self.files[path] = {"sha256": file_hash, "mtime_ns": mtime_ns, "size": size}
+        return file_hash
+
+    def use_file_stats(self, file_stats: dict[str, tuple[int, int]]):
+        '''
+        Provides mtime and size of files, which have just been collected (e.g. PlaybookTreeSnapshot.file_stats),
+        so current_hash doesn't stat them again
+
+        :param file_stats: file -> (mtime_ns, size)
+        '''
+        self._known_stats.update(file_stats)
+
+    def module_users(self) -> dict[str, list[str]]:
+        """Reverse index: module file -> playbook files which inlined (or tried to inline) it"""
+        users: dict[str, list[str]] = {}
+        for playbook_file, entry in self.playbooks.items():
+            for module_file in entry["dependencies"]:
+                if module_file != playbook_file:
+                    users.setdefault(module_file, []).append(playbook_file)
+        return users
+
+    def changed_files(self) -> set[str]:
+        """All recorded files whose content changed since the last build. Every file is hashed at most once"""
+        changed = set()
+        for path, recorded in self.files.items():
+            if self.current_hash(path) != recorded["sha256"]:
+                changed.add(path)
+        return changed
+
+    def stale_playbooks(self, playbook_files: list[str], changed_files: set[str]) -> set[str]:
+        '''
+        Determines the playbooks, which have to be rebuilt because one of their files changed
+
+        :param playbook_files: all playbook files of this run
+        :param changed_files: result of changed_files()
+        :return: set of playbook files
+        '''
+        stale = {playbook_file for playbook_file in playbook_files if playbook_file not in self.playbooks}
+        users = self.module_users()
+        for path in changed_files:
+            if path in self.playbooks:
+                stale.add(path)
+            stale.update(users.get(path, []))
+        return stale
+
+    def is_up_to_date(self, playbook_file: str, stale_playbooks: set[str], output_directory: str, find_module_files) -> bool:
+        '''
+        Checks whether the output of a playbook can be reused
+
+        :param playbook_file: playbook file
+        :param stale_playbooks: result of stale_playbooks()
+        :param output_directory: directory containing the generated BPMN files
+        :param find_module_files: function returning the candidate files of a module name,
+            used to detect modules which have been added or removed since the last build
+        :return: True if the playbook doesn't need to be converted again
+        '''
+        if playbook_file in stale_playbooks:
+            return False
+        entry = self.playbooks[playbook_file]
+        if not os.path.isfile(os.path.join(output_directory, entry["output"])):
+            return False
+        for module_name, module_files in entry["module_lookups"].items():
+            if find_module_files(module_name) != module_files:
+                return False
+        return True
+
+    def record(self, playbook_file: str, output: str, module_lookups: dict[str, list[str]]):
+        '''
+        Records the dependencies of a converted playbook
+
+        :param playbook_file: playbook file
+        :param output: name of the generated BPMN file
+        :param module_lookups: module name -> candidate module files, as collected by process_playbook
+        '''
+        dependencies = [playbook_file]
+        for module_files in module_lookups.values():
+            dependencies.extend(module_files)
+        dependencies = list(dict.fromkeys(dependencies))
+        for path in dependencies:
+            self.current_hash(path)
+        self.playbooks[playbook_file] = {
+            "output": output,
+            "module_lookups": module_lookups,
+            "dependencies": dependencies
+        }
+
+    def forget_playbook(self, playbook_file: str):
+        """Removes the entry of a playbook, e.g. if its conversion failed, so it's converted again next time"""
+        self.playbooks.pop(playbook_file, None)
+
+    def forget_current_hashes(self, paths):
+        """Drops the memoized current hashes of files, which changed while the manifest is in use (watch mode)"""
+        for path in paths:
+            self._current_hashes.pop(path, None)
+            self._known_stats.pop(path, None)
+
+    def forget_missing_playbooks(self, playbook_files: list[str]):
+        """Removes entries of playbooks which don't exist anymore, and files which are not referenced anymore"""
+        existing = set(playbook_files)
+        for playbook_file in list(self.playbooks):
+            if playbook_file not in existing:
+                del self.playbooks[playbook_file]
+        referenced = {path for entry in self.playbooks.values() for path in entry["dependencies"]}
+        for path in list(self.files):
+            if path not in referenced:
+                del self.files[path]
@@ -0,0 +1,240 @@
+"""Saves combined playbooks in a compact binary format and loads them again, run from parser/yaml_combine:
+
+    python -m yaml2bpmn_converter.combined_ir IR_FILE [IR_FILE ...] [--yaml | --bpmn] [-o OUTPUT_DIRECTORY]
+
+An IR file holds the playbook after its modules have been inserted and its activities have been numbered,
+and optionally the BPMN model converted from it. Loading it takes milliseconds, so the BPMN file or a
+readable yaml file can be created again without combining the playbook (--bpmn, --yaml).
+"""
+import os
+import sys
+import pickle
+import marshal
+import argparse
+import threading
+
+from .bpmn_object_models import *
+from .activity_types import ACTIVITY_TYPES, element_type
+
+# --- Combined Playbook IR
+
+# File layout: MAGIC, one byte format version, then the payload serialized with marshal
+# (or with pickle, if the playbook contains values marshal can't store, e.g. dates).
+# Like the yaml cache, IR files are meant for the converter and its tools: only load files from trusted sources.
+# The model is stored as flat tuples: one entry per container (process or subprocess) in breadth first order,
+# subprocess elements refer to their container by its index. So deep nesting doesn't need recursion.
+
+MAGIC = b"Y2B-IR"
+IR_VERSION = 1
+IR_FILE_EXTENSION = ".ir"
+
+class IRFormatError(Exception):
+    """Raised if a file isn't an IR file or has been written by an incompatible version"""
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+        self.message = message
+
+class CombinedPlaybook:
+    """Content of an IR file"""
+    __slots__ = ("playbook_file", "process_name", "playbook", "original_names", "bpmn_process")
+
+    def __init__(self, playbook_file: str, process_name: str, playbook: dict, original_names: dict = None,
+                 bpmn_process: BPMNProcess = None):
+        self.playbook_file = playbook_file
+        self.process_name = process_name
+        self.playbook = playbook  # combined playbook with numbered activities
+        self.original_names = original_names if original_names is not None else {}  # numbered -> original name
+        self.bpmn_process = bpmn_process  # None if the model hasn't been saved
+
+# start and end events don't have a type code
+_EVENT_KEYS = {BPMNStartEvent: "startEvent", BPMNEndEvent: "endEvent"}
+_CLASSES_BY_KEY = {activity_type.code: activity_type.model_class for activity_type in ACTIVITY_TYPES.values()}
+_CLASSES_BY_KEY.update({key: model_class for model_class, key in _EVENT_KEYS.items()})
+
+def encode_process(bpmn_process: BPMNProcess) -> tuple:
+    '''
+    Turns a process into nested tuples of strings, which marshal stores compactly
+
+    :return: (process id, process name, is_executable, containers). Each container:
+        (id, name, elements, flows, start event id, end event ids), elements: (type key, id, name or None
+        if it equals the id, incoming flows, outgoing flows, event definition id or container index)
+    '''
+    containers = [bpmn_process]
+    encoded_containers = []
+    for container in containers:
+        elements = []
+        for element in container.flow_elements:
+            extra = None
+            if isinstance(element, BPMNIntermediateEvent):
+                extra = element.event_definition_id
+            elif isinstance(element, BPMNSubProcess):
+                extra = len(containers)
+                containers.append(element)
+            key = _EVENT_KEYS.get(type(element)) or element_type(element).code
+            elements.append((key, element.id, None if element.name == element.id else element.name,
+                             tuple(element.incoming_flows), tuple(element.outgoing_flows), extra))
+        flows = tuple((flow.id, flow.source_ref, flow.target_ref, None if flow.name == flow.id else flow.name,
+                       flow.condition_expression) for flow in container.sequence_flows)
+        encoded_containers.append((container.id, None if container.name == container.id else container.name,
+                                   tuple(elements), flows,
+                                   container.start_event.id if container.start_event is not None else None,
+                                   tuple(end_event.id for end_event in container.end_events)))
+    return bpmn_process.id, bpmn_process.name, bpmn_process.is_executable, tuple(encoded_containers)
+
+def _flow_refs(flow_refs: tuple) -> tuple | IndexedList:
+    return flow_refs if len(flow_refs) <= SMALL_FLOW_REFS_LIMIT else IndexedList(flow_refs)
+
+def decode_process(data: tuple) -> BPMNProcess:
+    '''Creates the process encoded by encode_process'''
+    process_id, process_name, is_executable, encoded_containers = data
+    bpmn_process = BPMNProcess(process_id, process_name, is_executable)
+    containers = {0: bpmn_process}
+    for index, (container_id, name, elements, flows, start_event_id, end_event_ids) in enumerate(encoded_containers):
+        container = containers.pop(index)
+        for key, element_id, element_name, incoming, outgoing, extra in elements:
+            model_class = _CLASSES_BY_KEY[key]
+            if model_class is BPMNSubProcess:
+                element = containers[extra] = BPMNSubProcess(element_id, element_name)
+            elif issubclass(model_class, BPMNIntermediateEvent):
+                element = model_class(element_id, element_name, extra)
+            else:
+                element = model_class(element_id, element_name)
+            element.incoming_flows = _flow_refs(incoming)
+            element.outgoing_flows = _flow_refs(outgoing)
+            container.add_flow_element(element)
+        for flow_id, source_ref, target_ref, flow_name, condition in flows:
+            container.add_sequence_flow(BPMNSequenceFlow(flow_id, source_ref, target_ref, flow_name, condition))
+        if start_event_id is not None:
+            container.set_start_event(container.get_element(start_event_id))
+        for end_event_id in end_event_ids:
+            container.add_end_event(container.get_element(end_event_id))
+    return bpmn_process
+
+def _serialize(payload) -> bytes:
+    try:
+        return b"M" + marshal.dumps(payload)
+    except ValueError:
+        return b"P" + pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+def dumps(combined: CombinedPlaybook) -> bytes:
+    payload = (combined.playbook_file, combined.process_name, combined.playbook, combined.original_names,
+               encode_process(combined.bpmn_process) if combined.bpmn_process is not None else None)
+    return MAGIC + bytes([IR_VERSION]) + _serialize(payload)
+
+def loads(content: bytes, path: str = "<bytes>") -> CombinedPlaybook:
+    '''
+    :raises IRFormatError: if the content isn't a valid IR of this version
+    '''
+    if not content.startswith(MAGIC) or len(content) < len(MAGIC) + 2:
+        raise IRFormatError(path, "not an IR file")
+    version = content[len(MAGIC)]
+    if version != IR_VERSION:
+        raise IRFormatError(path, f"IR version {version} isn't supported (expected {IR_VERSION})")
+    serialized = content[len(MAGIC) + 1:]
+    try:
+        if serialized[:1] == b"M":
+            payload = marshal.loads(serialized[1:])
+        else:
+            payload = pickle.loads(serialized[1:])
+        playbook_file, process_name, playbook, original_names, encoded_process = payload
+        bpmn_process = decode_process(encoded_process) if encoded_process is not None else None
+    except (ValueError, EOFError, TypeError, KeyError, pickle.UnpicklingError) as exc:
+        raise IRFormatError(path, f"corrupt IR file ({exc})") from exc
+    return CombinedPlaybook(playbook_file, process_name, playbook, original_names, bpmn_process)
+
+def save_ir(path: str, combined: CombinedPlaybook):
+    '''Writes an IR file, through a temporary file, so readers never see a partial file'''
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary_path, "wb") as f:
+            f.write(dumps(combined))
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.unlink(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def load_ir(path: str) -> CombinedPlaybook:
+    '''
+    :raises IRFormatError: if the file isn't a valid IR of this version
+    :raises OSError: if the file can't be read
+    '''
+    with open(path, "rb") as f:
+        return loads(f.read(), path)
+
+# --- Combined Yaml
+
+_safe_dumper = None
+
+def _get_safe_dumper():
+    global _safe_dumper
+    if _safe_dumper is None:
+        # use the libyaml based dumper if pyyaml has been built with libyaml, it's several times faster
+        try:
+            from yaml import CSafeDumper as SafeDumper
+        except ImportError:
+            from yaml import SafeDumper
+        _safe_dumper = SafeDumper
+    return _safe_dumper
+
+def dump_combined_yaml(playbook: dict, stream):
+    '''
+    Writes a combined playbook as yaml, for reading it
+    The keys keep their order, the order of the activities defines the order of the BPMN elements
+
+    :param stream: text stream
+    '''
+    import yaml
+    yaml.dump(playbook, stream, Dumper=_get_safe_dumper(), default_flow_style=False, sort_keys=False,
+              allow_unicode=True)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m yaml2bpmn_converter.combined_ir", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ir_files", nargs="+", metavar="IR_FILE")
+    output_format = parser.add_mutually_exclusive_group()
+    output_format.add_argument("--yaml", dest="output_format", action="store_const", const="yaml",
+                               help="write the combined playbook as yaml (default)")
+    output_format.add_argument("--bpmn", dest="output_format", action="store_const", const="bpmn",
+                               help="write the BPMN file of the saved model")
+    parser.add_argument("--no-layout", dest="layout", action="store_false",
+                        help="don't add the diagram (BPMNDI shapes and edges) to the BPMN files")
+    parser.add_argument("-o", "--output", default=".", metavar="DIRECTORY",
+                        help="output directory (default: current directory)")
+    arguments = parser.parse_args(argv)
+    output_format = arguments.output_format or "yaml"
+
+    failed = 0
+    for ir_file in arguments.ir_files:
+        try:
+            combined = load_ir(ir_file)
+        except (OSError, IRFormatError) as exc:
+            print(f"failed to load {ir_file}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        if output_format == "bpmn" and combined.bpmn_process is None:
+            print(f"{ir_file} doesn't contain the BPMN model", file=sys.stderr)
+            failed += 1
+            continue
+        os.makedirs(arguments.output, exist_ok=True)
+        if output_format == "yaml":
+            output_file = os.path.join(arguments.output, combined.process_name + ".yml")
+            with open(output_file, "w", encoding="utf-8") as f:
+                dump_combined_yaml(combined.playbook, f)
+        else:
+            from .xml_generator import write_bpmn_xml
+            from .layout import layout_process
+            output_file = os.path.join(arguments.output, combined.process_name + ".bpmn")
+            layout = layout_process(combined.bpmn_process) if arguments.layout else None
+            with open(output_file, "w", encoding="utf-8") as f:
+                write_bpmn_xml(combined.bpmn_process, f, layout=layout)
+        print(f"created file: {output_file}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
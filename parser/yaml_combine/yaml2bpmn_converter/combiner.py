@@ -0,0 +1,527 @@
+import os
+import sys
+import logging
+import logging.handlers
+
+from . import yaml_parser
+from .module_index import ModuleIndex, DEFAULT_MAX_MODULE_DEPTH
+from .module_expansion import ModuleExpansion, EXPANDED, expand_modules
+from .yaml_loader import YamlLoader, YamlLoadError, libyaml_available
+from .yaml_parser import ConversionContext
+from .profiling import StageProfiler, NULL_PROFILER
+from .layout import DiagramLayout, layout_process
+from .activity_types import get_activitie_object_type
+from .validator import ValidationIssue, validate_playbook, ERROR
+from .output_sinks import DirectorySink
+from .discovery import DEFAULT_INCLUDE, DiscoveryRules, discover_playbooks
+from .process_graph import DEAD_END, MISSING_END_EVENT, UNJOINED_BRANCHES, find_graph_issues
+
+# xml_generator (xml.etree) and concurrent.futures are imported where they are needed,
+# so importing this module stays cheap for runs which don't convert anything
+
+logger = logging.getLogger(__name__)
+
+# Specific folders in the Playbook directory, which shall not be processed like normal Playbook directories
+SPECIFIC_FOLDERS = ["/files", "/05_documentation", "additional_fields"]
+
+_worker_module_index: ModuleIndex = None  # module index of a worker process (see "_init_worker")
+_worker_yaml_loader: YamlLoader = None  # yaml loader of a worker process (see "_init_worker")
+_worker_profile: bool = False  # whether a worker process collects metrics (see "_init_worker")
+_worker_layout: bool = True  # whether a worker process lays out the diagrams (see "_init_worker")
+_worker_keep_combined: bool = False  # whether a worker process returns the combined playbooks (see "_init_worker")
+_worker_export_formats: tuple[str, ...] = ()  # formats a worker process renders besides BPMN (see "_init_worker")
+
+# --- Playbook Conversion
+
+class ConversionResult:
+    """Result of the conversion of one playbook file. If the conversion failed, error is set.
+    Contains either the rendered BPMN xml or the BPMN process, which is streamed into the output file.
+    The additional export formats (see exporters.EXPORT_FORMATS) are rendered together with the BPMN xml"""
+    def __init__(self, playbook_phase: str, playbook_file: str, process_name: str = None, bpmn_xml: str = None,
+                 module_lookups: dict = None, error: str = None, bpmn_process=None, metrics: dict = None,
+                 diagram_layout: DiagramLayout = None, module_expansions: list[ModuleExpansion] = None,
+                 combined_playbook: dict = None, original_names: dict = None, export_formats: tuple[str, ...] = (),
+                 exports: dict[str, str] = None):
+        self.playbook_phase = playbook_phase
+        self.playbook_file = playbook_file
+        self.process_name = process_name
+        self.bpmn_xml = bpmn_xml
+        self.bpmn_process = bpmn_process
+        self.module_lookups = module_lookups if module_lookups is not None else {}
+        self.error = error
+        self.metrics = metrics  # metrics collected in a worker process, see StageProfiler.to_dict
+        self.diagram_layout = diagram_layout  # diagram of bpmn_process, if it hasn't been rendered yet
+        # expansion trace: every task which references a module, see module_expansion.expand_modules
+        self.module_expansions = module_expansions if module_expansions is not None else []
+        # playbook with the inserted modules and numbered activities, only kept if requested (see convert_playbook)
+        self.combined_playbook = combined_playbook
+        self.original_names = original_names  # numbered activity name -> original name, kept with combined_playbook
+        self.export_formats = export_formats  # formats written besides the BPMN file
+        self.exports = exports if exports is not None else {}  # export format -> content, rendered with bpmn_xml
+
+def list_directory(dir:str):
+    '''
+    Lists all directories and files within on directory
+    The files and directories are split into two separate lists
+
+    :param dir: expects an existing directory
+    :return: (list,list)
+        dirs: Subdirctorys within the defined directory
+        files: files within the defined directory
+    '''
+    dirs = []
+    files = []
+    # the type of an entry is cached by scandir, so no additional stat is needed
+    with os.scandir(dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dirs.append(entry.path)
+            elif entry.is_file():
+                files.append(entry.path)
+    return dirs, files
+
+def get_activities(obj:dict):
+    '''
+    extracts all activities on the highest level of a data structure
+    in case the dict has a key "activities"
+
+    :param obj: complex data structure which has at least a dict in the highest level of the data structure
+    :return: List of all direct members of the activity Key
+    '''
+    if not isinstance(obj, dict) or not isinstance(obj.get("activities"), dict):
+        return []
+    return [x for x in obj["activities"].keys()]
+
+class PlaybookReferenceError(Exception):
+    """Raised if an activity references (goto/then) an activity which doesn't exist on its level"""
+    def __init__(self, activity_path: list[str], target: str):
+        super().__init__(f"goto target \"{target}\" of activity \"{'/'.join(activity_path)}\" doesn't exist")
+        self.activity_path = activity_path
+        self.target = target
+
+def _rename_goto(goto, assigned_names: dict, activity_path: list[str]):
+    '''
+    Returns the goto value of an activity with all targets replaced by their numbered names
+    Handles direct gotos (string), exclusive gateways (list of dicts with "if" and "then")
+    and parallel gateways (list of strings)
+    '''
+    def rename(target):
+        try:
+            return assigned_names[target]
+        except KeyError:
+            raise PlaybookReferenceError(activity_path, target) from None
+
+    if isinstance(goto, str):
+        return rename(goto)
+    if isinstance(goto, list):
+        renamed_goto = []
+        for goto_element in goto:
+            if isinstance(goto_element, dict) and "then" in goto_element.keys():
+                goto_element["then"] = rename(goto_element["then"])
+            elif isinstance(goto_element, str):
+                goto_element = rename(goto_element)
+            renamed_goto.append(goto_element)
+        return renamed_goto
+    return goto
+
+def add_counter_to_activities(obj, context: ConversionContext):
+    '''
+    This functions replaces the keys of all activities within data structure a by a version with an _<counting_number> at the end of the name
+    e.g. original key name: "quarantine_device" new key name "quarantine_device_42"
+    So each of the activites has a unique number within the final document
+    This is replacement is required to eliminate duplicates in the resulting data structure,
+    because BPMNator is not able to handle duplicate activity names
+
+    The activities are numbered in one traversal with an explicit stack (no recursion), so any nesting
+    depth is supported. Inner activities are numbered before the activity containing them.
+    Each activities block is rebuilt as a new dict with the numbered names, and the goto targets of the
+    block are renamed with the table of names assigned on this level.
+
+    :param obj: a complex data structure which is a dict on its toplevel. The function will actively modify the data in this data structure.
+    :param context: conversion context of the playbook, which holds the activity counter
+    :return: dict mapping the new activity names to the original names
+    :raises PlaybookReferenceError: if a goto target doesn't exist on the level of the activity
+    '''
+    original_names = {}
+    if not isinstance(obj.get("activities"), dict):
+        return original_names
+
+    # each stack frame represents one activities block:
+    # [owner of the block, names of the activities, position, original name -> new name, descended into current activity]
+    stack = [[obj, list(obj["activities"]), 0, {}, False]]
+    while stack:
+        frame = stack[-1]
+        owner, names, position, assigned_names, descended = frame
+
+        if position < len(names):
+            activity = owner["activities"][names[position]]
+            # Step 1: number all inner activities of this activity first
+            if not descended and isinstance(activity, dict) and isinstance(activity.get("activities"), dict):
+                frame[4] = True
+                stack.append([activity, list(activity["activities"]), 0, {}, False])
+                continue
+            activity_number = context.next_activity_number()
+            new_name = names[position] + "_" + str(activity_number)
+            assigned_names[names[position]] = new_name
+            original_names[new_name] = names[position]
+            frame[2] = position + 1
+            frame[4] = False
+            continue
+
+        # Step 2: all activities of this block are numbered -> rebuild the block and adjust naming for goto steps
+        activity_path = [f[1][f[2]] for f in stack[:-1]]
+        renamed_activities = {}
+        for name in names:
+            activity = owner["activities"][name]
+            if isinstance(activity, dict) and "goto" in activity.keys():
+                activity["goto"] = _rename_goto(activity["goto"], assigned_names, activity_path + [name])
+            renamed_activities[assigned_names[name]] = activity
+        owner["activities"] = renamed_activities
+        stack.pop()
+
+    return original_names
+
+def load_yaml_file(yaml_file, yaml_loader: YamlLoader = None):
+    '''
+    save loading of a yaml file and converting it into a usable datastructure
+    Uses libyaml if available and the persistent cache of the yaml loader, if it has one
+    :param yaml_file: a valid yaml file
+    :param yaml_loader: loader to use. If None, the file is parsed without cache
+    :return: data structure of dicts and lists representing the yaml content
+    :raises YamlLoadError: if the file can't be read or parsed
+    '''
+    if yaml_loader is None:
+        yaml_loader = YamlLoader()
+    return yaml_loader.load(yaml_file)
+
+def process_playbook(playbook_obj, playbook_phase, module_index: ModuleIndex = None, module_lookups: dict = None,
+                     max_depth: int = None) -> list[ModuleExpansion]:
+    '''
+    Iterates over the playbook data structure and inserts module data where it is reverenced in the main playbook file
+    The inserted "playbook_obj" will be modified in this function.
+    Modules referenced within inserted modules are inserted as well, up to max_depth nested modules.
+    The nesting is handled with an explicit work stack instead of recursion (see module_expansion.expand_modules),
+    modules referencing each other in a cycle are only inserted once per chain.
+
+    :param playbook_obj: data structure representing the yaml content of the playbook or fracation of it
+    :param playbook_phase: current phase of the play book. Needet referencing the possible module locations
+    :param module_index: index used to resolve and load modules. Share one index between calls to
+        parse every module file only once. If None, a new index without shared module roots is created for this call.
+    :param module_lookups: optional dict, which is filled with the candidate module files of every
+        task name looked up (module name -> list of files). Used to track the dependencies of a playbook
+    :param max_depth: maximum number of nested modules, defaults to the maximum depth of the module index
+    :return: expansion trace of the playbook, list of ModuleExpansion
+    '''
+    if module_index is None:
+        module_index = ModuleIndex(load_yaml_file)
+    return expand_modules(playbook_obj, playbook_phase, module_index, module_lookups, max_depth)
+
+def find_playbook_files(start_directory: str, excluded_folders: list[str] = SPECIFIC_FOLDERS,
+                        playbook_directory_filter=None):
+    '''
+    Searches all playbook files in the playbook directories
+    Expects the layout <start_directory>/<playbook>/<phase>/<playbook file>, see discovery.discover_playbooks
+    for other layouts and configurable rules
+
+    :param start_directory: directory containing the playbook directories
+    :param excluded_folders: directories ending with one of these names aren't playbook directories
+    :param playbook_directory_filter: optional function, only playbook directories for which it returns True are searched
+    :return: list of (playbook_phase, playbook_file) tuples in processing order
+    '''
+    # "/files" excludes the playbook directory "files", "additional_fields" every name ending with it
+    excluded_patterns = [folder[1:] if folder.startswith("/") else "*" + folder for folder in excluded_folders]
+    snapshot = discover_playbooks(start_directory, DiscoveryRules(DEFAULT_INCLUDE, excluded_patterns),
+                                  collect_stats=False)
+    playbooks = snapshot.playbooks()
+    if playbook_directory_filter is not None:
+        playbooks = [(playbook_phase, playbook_file) for playbook_phase, playbook_file in playbooks
+                     if playbook_directory_filter(os.path.dirname(playbook_phase))]
+    return playbooks
+
+def _log_validation_issues(issues: list[ValidationIssue]) -> list[ValidationIssue]:
+    '''Logs the warnings and errors of a validation and returns the errors
+    Warnings are only written into the log, "--check" prints them'''
+    errors = []
+    for issue in issues:
+        if issue.severity == ERROR:
+            logger.error("[-] %s", issue)
+            errors.append(issue)
+        else:
+            logger.info("[*] %s", issue)
+    return errors
+
+def check_playbook(playbook_phase: str, playbook_file: str, module_index: ModuleIndex, yaml_loader: YamlLoader = None,
+                   profiler: StageProfiler = NULL_PROFILER) -> list[ValidationIssue]:
+    '''
+    Combines a playbook with its modules and validates it, without converting it (see validator.validate_playbook)
+
+    :param playbook_phase: directory of the playbook phase
+    :param playbook_file: playbook file within the phase directory
+    :param module_index: index used to resolve and load modules
+    :param yaml_loader: loader for the playbook file
+    :param profiler: collects the time of every stage
+    :return: list of ValidationIssue, a yaml error of the playbook or a module is returned as an error issue
+    '''
+    module_lookups = {}
+    try:
+        with profiler.stage("load_yaml_file", playbook_file):
+            playbook_yaml = load_yaml_file(playbook_file, yaml_loader)
+        with profiler.stage("process_playbook", playbook_file):
+            module_expansions = process_playbook(playbook_yaml, playbook_phase, module_index, module_lookups)
+    except YamlLoadError as exc:
+        return [ValidationIssue(playbook_file, [], "invalid_yaml", ERROR, str(exc))]
+    with profiler.stage("validate_playbook", playbook_file):
+        return validate_playbook(playbook_yaml, playbook_file, module_lookups, module_expansions)
+
+def convert_playbook(playbook_phase: str, playbook_file: str, module_index: ModuleIndex, yaml_loader: YamlLoader = None,
+                     render_xml: bool = True, profiler: StageProfiler = NULL_PROFILER, layout: bool = True,
+                     playbook_yaml: dict = None, keep_combined: bool = False, export_formats: tuple[str, ...] = ()):
+    '''
+    Combines a playbook with its modules and converts it into BPMN
+    Each call uses its own conversion context, so the result doesn't depend on other playbooks
+    Yaml errors in the playbook or its modules don't abort the run, they are returned in the result
+
+    :param playbook_phase: directory of the playbook phase
+    :param playbook_file: playbook file within the phase directory
+    :param module_index: index used to resolve and load modules
+    :param yaml_loader: loader for the playbook file
+    :param render_xml: if False, the result contains the BPMN process instead of the xml string,
+        so the xml can be streamed into the output file (see "write_bpmn_file")
+    :param profiler: collects the time of every stage and the element counts of the playbook
+    :param layout: compute the diagram (BPMNDI shapes and edges) of the process
+    :param playbook_yaml: content of the playbook file, if it has already been loaded (e.g. prefetched by the
+        pipeline). It is modified by the conversion
+    :param keep_combined: add the combined playbook to the result, e.g. to save it (see combined_ir)
+    :param export_formats: formats written besides the BPMN file (see exporters.EXPORT_FORMATS). With render_xml,
+        they are rendered in the same walk over the process as the xml
+    :return: ConversionResult
+    '''
+    logger.info("[+] Processing playbook \"%s\"", playbook_file)
+    context = ConversionContext()
+    module_lookups = {}
+    module_expansions = []
+    try:
+        # Convert yaml file into data structure
+        if playbook_yaml is None:
+            with profiler.stage("load_yaml_file", playbook_file):
+                playbook_yaml = load_yaml_file(playbook_file, yaml_loader)
+        # Process playbook and insert modules in data structure where referenced
+        with profiler.stage("process_playbook", playbook_file):
+            module_expansions = process_playbook(playbook_yaml, playbook_phase, module_index, module_lookups)
+        # report all broken references at once, before any BPMN is built
+        with profiler.stage("validate_playbook", playbook_file):
+            issues = validate_playbook(playbook_yaml, playbook_file, module_lookups, module_expansions)
+        errors = _log_validation_issues(issues)
+        if errors:
+            error = "; ".join(f"{issue.location}: {issue.message}" for issue in errors)
+            return ConversionResult(playbook_phase, playbook_file, module_lookups=module_lookups, error=error,
+                                    module_expansions=module_expansions)
+        # add a rolling number to each activity name to evade duplicates
+        with profiler.stage("add_counter_to_activities", playbook_file):
+            original_names = add_counter_to_activities(playbook_yaml, context)
+    except (YamlLoadError, PlaybookReferenceError) as exc:
+        logger.error("[-] %s: %s", playbook_file, exc)
+        return ConversionResult(playbook_phase, playbook_file, module_lookups=module_lookups, error=str(exc),
+                                module_expansions=module_expansions)
+    # The combined playbook can be kept in the result, to save it as IR or readable yaml (see combined_ir)
+    combined = {"combined_playbook": playbook_yaml, "original_names": original_names} if keep_combined else {}
+    export_formats = tuple(export_format for export_format in export_formats if export_format != "bpmn")
+
+    # Convert the modified object into BPMN
+    with profiler.stage("parse_playbook_to_bpmn_representation", playbook_file):
+        bpmn_yaml = yaml_parser.parse_playbook_to_bpmn_representation(playbook_yaml, context)
+    # structural problems of the diagram, which the validator can't see in the playbook (e.g. loops without exit).
+    # Unreachable activities have already been reported by validate_playbook
+    with profiler.stage("analyze_process_graph", playbook_file):
+        _log_validation_issues(find_graph_issues(bpmn_yaml, playbook_file, original_names,
+                                                 (DEAD_END, MISSING_END_EVENT, UNJOINED_BRANCHES)))
+    if profiler.enabled:
+        profiler.count(playbook_file, "activities", len(original_names))
+        profiler.count(playbook_file, "modules", sum(1 for x in module_lookups.values() if x))
+        profiler.count(playbook_file, "module_expansions", sum(1 for x in module_expansions if x.status == EXPANDED))
+        profiler.count(playbook_file, "sequence_flows", context.flow_id_counter)
+        profiler.count(playbook_file, "fragment_copies", context.fragment_copies)
+    diagram_layout = None
+    if layout:
+        with profiler.stage("layout_process", playbook_file):
+            diagram_layout = layout_process(bpmn_yaml)
+    if not render_xml:
+        return ConversionResult(playbook_phase, playbook_file, playbook_yaml["process"], module_lookups=module_lookups,
+                                bpmn_process=bpmn_yaml, diagram_layout=diagram_layout,
+                                module_expansions=module_expansions, export_formats=export_formats, **combined)
+    from . import xml_generator
+    exports = {}
+    with profiler.stage("generate_bpmn_xml", playbook_file):
+        if export_formats:
+            exports = _export_process(bpmn_yaml, diagram_layout, ("bpmn",) + export_formats)
+            bpmn_xml = exports.pop("bpmn")
+        else:
+            bpmn_xml = xml_generator.generate_bpmn_xml(bpmn_yaml, diagram_layout)
+    if profiler.enabled:
+        profiler.count(playbook_file, "xml_characters", len(bpmn_xml))
+    return ConversionResult(playbook_phase, playbook_file, playbook_yaml["process"], bpmn_xml, module_lookups,
+                            module_expansions=module_expansions, export_formats=export_formats, exports=exports,
+                            **combined)
+
+def _export_process(bpmn_process, diagram_layout: DiagramLayout, export_formats, bpmn_stream=None) -> dict[str, str]:
+    '''
+    Renders the process in all formats with one walk over the model
+
+    :param bpmn_stream: stream the BPMN xml is written to instead of a buffer, if given
+    :return: export format -> content, of the formats rendered into buffers
+    '''
+    import io
+    from .exporters import create_exporter, walk_process
+    buffers = {export_format: io.StringIO() for export_format in export_formats
+               if bpmn_stream is None or export_format != "bpmn"}
+    streams = dict(buffers, bpmn=bpmn_stream) if bpmn_stream is not None else buffers
+    walk_process(bpmn_process, [create_exporter(export_format, stream, diagram_layout)
+                                for export_format, stream in streams.items()])
+    return {export_format: buffer.getvalue() for export_format, buffer in buffers.items()}
+
+def write_bpmn_file(result: ConversionResult, output, profiler: StageProfiler = NULL_PROFILER) -> bool:
+    '''
+    Writes the BPMN file of a conversion result into an output sink. If the result contains the BPMN process
+    instead of the rendered xml, the xml is streamed into the sink without building it in memory first
+    (in this case the time of the "write_bpmn_file" stage includes generating the xml).
+    The files of the additional export formats follow, rendered in the same walk over the process as the xml
+
+    :param result: successful conversion result
+    :param output: OutputSink, or an output directory, which is written with a DirectorySink
+    :return: True if the BPMN file has been written, False if an identical file already existed
+    '''
+    from . import xml_generator
+    from .exporters import EXPORT_FORMATS
+    if isinstance(output, str):
+        output = DirectorySink(output)
+    file_name = result.process_name+".bpmn"
+    metadata = {"playbook": result.playbook_file, "process": result.process_name}
+    exports = dict(result.exports)
+
+    def render(stream):
+        if result.bpmn_xml is not None:
+            stream.write(result.bpmn_xml)
+        elif result.export_formats:
+            exports.update(_export_process(result.bpmn_process, result.diagram_layout, result.export_formats, stream))
+        else:
+            xml_generator.write_bpmn_xml(result.bpmn_process, stream, layout=result.diagram_layout)
+
+    with profiler.stage("write_bpmn_file", result.playbook_file):
+        written = output.write(file_name, render, metadata)
+        _report_file("BPMN", file_name, written, output)
+        for export_format in result.export_formats:
+            export_file_name = result.process_name + EXPORT_FORMATS[export_format][0]
+            content = exports[export_format]
+            export_written = output.write(export_file_name, lambda stream: stream.write(content), metadata)
+            _report_file(export_format, export_file_name, export_written, output)
+    return written
+
+def _report_file(file_type: str, file_name: str, written: bool, output):
+    message_stream = sys.stderr if output.uses_stdout else sys.stdout
+    if written:
+        logger.info("[+] Created %s file: \"%s\"", file_type, file_name)
+        print(f"created {file_type} File: {file_name}", file=message_stream)
+    else:
+        logger.info("[*] Unchanged %s file: \"%s\"", file_type, file_name)
+        print(f"unchanged {file_type} File: {file_name}", file=message_stream)
+
+def _init_worker(shared_roots: list[str], yaml_cache_directory: str = None, profile: bool = False, layout: bool = True,
+                 max_module_depth: int = DEFAULT_MAX_MODULE_DEPTH, keep_combined: bool = False,
+                 export_formats: tuple[str, ...] = (), log_queue=None, log_level: int = logging.INFO):
+    global _worker_module_index, _worker_yaml_loader, _worker_profile, _worker_layout, _worker_keep_combined
+    global _worker_export_formats
+    if log_queue is not None:
+        # handlers inherited from the parent (e.g. the queue of its log listener thread) don't reach the log file
+        # from a worker process, the records are sent to the parent instead (see _forward_worker_logs)
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        root_logger.setLevel(log_level)
+    _worker_yaml_loader = YamlLoader(yaml_cache_directory)
+    _worker_module_index = ModuleIndex(_worker_yaml_loader.load, shared_roots, max_module_depth)
+    _worker_profile = profile
+    _worker_layout = layout
+    _worker_keep_combined = keep_combined
+    _worker_export_formats = export_formats
+
+class _ParentLogHandler(logging.Handler):
+    """Passes the log records of the worker processes to the loggers of this process"""
+    def emit(self, record: logging.LogRecord):
+        logging.getLogger(record.name).handle(record)
+
+def _forward_worker_logs(log_queue) -> logging.handlers.QueueListener:
+    listener = logging.handlers.QueueListener(log_queue, _ParentLogHandler())
+    listener.start()
+    return listener
+
+def _convert_playbook_in_worker(playbook):
+    playbook_phase, playbook_file = playbook
+    profiler = StageProfiler() if _worker_profile else NULL_PROFILER
+    result = convert_playbook(playbook_phase, playbook_file, _worker_module_index, _worker_yaml_loader,
+                              profiler=profiler, layout=_worker_layout, keep_combined=_worker_keep_combined,
+                              export_formats=_worker_export_formats)
+    if profiler.enabled:
+        result.metrics = profiler.to_dict()
+    return result
+
+def convert_playbooks(playbooks: list[tuple[str, str]], jobs: int = 1, module_index: ModuleIndex = None,
+                      yaml_loader: YamlLoader = None, profiler: StageProfiler = NULL_PROFILER,
+                      render_xml: bool = False, layout: bool = True, keep_combined: bool = False,
+                      export_formats: tuple[str, ...] = ()):
+    '''
+    Converts all playbooks and yields the results in the order of the playbook list,
+    no matter in which order the conversions finish
+
+    :param playbooks: list of (playbook_phase, playbook_file) tuples
+    :param jobs: number of worker processes. With 1 all playbooks are converted in this process
+    :param module_index: module index used when converting in this process. Worker processes create their own
+        index with the same shared module roots. If None, a new index without shared module roots is created.
+    :param yaml_loader: yaml loader used when converting in this process. Worker processes create their own
+        loader using the same cache directory. If None, files are loaded without persistent cache
+    :param profiler: collects the metrics of all conversions, including the ones of worker processes
+    :param render_xml: if False, results of conversions in this process contain the BPMN process instead of
+        the xml, which can be streamed into the output file by "write_bpmn_file". Results of worker processes
+        always contain the rendered xml
+    :param layout: compute the diagrams (BPMNDI shapes and edges) of the processes
+    :param keep_combined: add the combined playbooks to the results, see convert_playbook
+    :param export_formats: formats written besides the BPMN files, see convert_playbook
+    :return: generator of ConversionResult
+    '''
+    if not playbooks:
+        return
+    if yaml_loader is None:
+        yaml_loader = YamlLoader()
+    # One module index for the whole run, so every module file is parsed only once
+    if module_index is None:
+        module_index = ModuleIndex(yaml_loader.load)
+    if jobs <= 1 or len(playbooks) <= 1:
+        for playbook_phase, playbook_file in playbooks:
+            yield convert_playbook(playbook_phase, playbook_file, module_index, yaml_loader, render_xml=render_xml,
+                                   profiler=profiler, layout=layout, keep_combined=keep_combined,
+                                   export_formats=export_formats)
+        logger.info("[+] Module cache: %(hits)d hits, %(misses)d misses, %(cached_modules)d cached modules",
+                    module_index.stats())
+        logger.info("[+] Yaml loader (libyaml: %s): %d files parsed, %d loaded from cache",
+                    libyaml_available(), yaml_loader.parsed, yaml_loader.cache_hits)
+        return
+
+    # Every worker process keeps its own module index for all playbooks it converts
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    yaml_cache_directory = yaml_loader.cache.directory if yaml_loader.cache else None
+    # the log records of the workers are logged by this process, so they reach the same handlers
+    log_queue = multiprocessing.Queue()
+    log_listener = _forward_worker_logs(log_queue)
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(module_index.shared_roots, yaml_cache_directory, profiler.enabled,
+                                           layout, module_index.max_depth, keep_combined, tuple(export_formats),
+                                           log_queue, logging.getLogger().getEffectiveLevel())) as executor:
+            for result in executor.map(_convert_playbook_in_worker, playbooks):
+                if result.metrics:
+                    profiler.merge(result.metrics)
+                yield result
+    finally:
+        # the workers have exited and flushed their records when the executor is shut down
+        log_listener.stop()
@@ -0,0 +1,294 @@
+"""Finds the playbook files below a playbooks directory, run from parser/yaml_combine:
+
+    python -m yaml2bpmn_converter.discovery [START_DIRECTORY] [--config FILE] [--stats]
+
+The directory tree is walked with os.scandir to any depth. Include and exclude rules are glob patterns,
+matched against the path relative to the start directory, with "/" as separator:
+"*", "?" and "[...]" match within one path segment, "**" matches any number of segments.
+An excluded directory isn't entered at all, and neither is a directory below which no include rule can match.
+The directory of a playbook file is its playbook phase (it contains the "modules" directory of the playbook).
+
+Rules files are yaml files with the lists "include" and "exclude", a missing list keeps its default.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+# --- Playbook Discovery
+
+# The default rules describe the layout <start_directory>/<playbook>/<phase>/<playbook file>,
+# without the directories of shared modules and other documents
+DEFAULT_INCLUDE = ["*/*/*"]
+DEFAULT_EXCLUDE = ["files", "05_documentation", "*additional_fields", "**/modules"]
+
+class GlobPattern:
+    """Glob pattern matched against relative paths, compiled into a regular expression"""
+    __slots__ = ("pattern", "regex", "_segments")
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        segments = []
+        for segment in pattern.strip("/").split("/"):
+            if segment != "**" or not segments or segments[-1] != "**":  # "**/**" equals "**"
+                segments.append(segment)
+        self.regex = _translate(segments)
+        # used to decide whether a directory has to be entered, None stands for "**"
+        self._segments = [None if segment == "**" else re.compile(_translate_segment(segment)).fullmatch
+                          for segment in segments]
+
+    def __repr__(self):
+        return f"GlobPattern({self.pattern!r})"
+
+    def matches(self, relative_path: str) -> bool:
+        return re.fullmatch(self.regex, relative_path, re.DOTALL) is not None
+
+    def may_match_below(self, segments: list[str]) -> bool:
+        '''
+        :param segments: names of the relative path of a directory
+        :return: False if the pattern can't match any path below the directory
+        '''
+        pattern_segments = self._segments
+        for index, name in enumerate(segments):
+            if index == len(pattern_segments):
+                return False
+            matcher = pattern_segments[index]
+            if matcher is None:
+                return True
+            if not matcher(name):
+                return False
+        return len(segments) < len(pattern_segments)
+
+def _translate_segment(segment: str) -> str:
+    '''Translates one segment like fnmatch.translate, but "*" and "?" don't match the separator'''
+    parts = []
+    index = 0
+    while index < len(segment):
+        character = segment[index]
+        index += 1
+        if character == "*":
+            parts.append("[^/]*")
+        elif character == "?":
+            parts.append("[^/]")
+        elif character == "[":
+            end = index + 1 if segment[index:index + 1] in ("!", "]") else index
+            if segment[index:index + 1] == "!" and segment[end:end + 1] == "]":
+                end += 1
+            end = segment.find("]", end)
+            if end < 0:
+                parts.append(re.escape(character))
+                continue
+            content = segment[index:end].replace("\\", "\\\\")
+            if content.startswith("!"):
+                content = "^" + content[1:] + "/"
+            elif content.startswith("^"):
+                content = "\\" + content
+            parts.append("[" + content + "]")
+            index = end + 1
+        else:
+            parts.append(re.escape(character))
+    return "".join(parts)
+
+def _translate(segments: list[str]) -> str:
+    parts = []
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment != "**":
+            parts.append(_translate_segment(segment) + ("" if last else "/"))
+        elif not last:
+            parts.append("(?:[^/]+/)*")
+        elif index == 0:
+            parts.append(".*")
+        else:
+            parts[-1] = parts[-1][:-1] + "(?:/.*)?"  # "a/**" matches "a" and everything below it
+    return "".join(parts)
+
+def _compile_patterns(patterns: list[GlobPattern]):
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern.regex})" for pattern in patterns), re.DOTALL).fullmatch
+
+class DiscoveryRules:
+    """Include and exclude rules of the playbook discovery, a file is a playbook file if an include rule
+    matches its relative path and no exclude rule matches the path or one of its directories"""
+    __slots__ = ("include", "exclude", "_include_match", "_exclude_match")
+
+    def __init__(self, include: list[str] = None, exclude: list[str] = None):
+        self.include = [GlobPattern(pattern) for pattern in (DEFAULT_INCLUDE if include is None else include)]
+        self.exclude = [GlobPattern(pattern) for pattern in (DEFAULT_EXCLUDE if exclude is None else exclude)]
+        # all patterns of a list are combined into one expression, so every path is matched only twice
+        self._include_match = _compile_patterns(self.include)
+        self._exclude_match = _compile_patterns(self.exclude)
+
+    @classmethod
+    def from_dict(cls, data: dict, source: str = "<rules>") -> "DiscoveryRules":
+        '''
+        :param data: dict with the optional lists "include" and "exclude"
+        :param source: name of the rules file, used in error messages
+        :raises ValueError: if the data doesn't describe valid rules
+        '''
+        if not isinstance(data, dict):
+            raise ValueError(f"{source}: expected a mapping with the keys include and exclude")
+        unknown_keys = set(data) - {"include", "exclude"}
+        if unknown_keys:
+            raise ValueError(f"{source}: unknown key(s) {', '.join(sorted(map(str, unknown_keys)))}")
+        for key in ("include", "exclude"):
+            patterns = data.get(key)
+            if patterns is not None and (not isinstance(patterns, list)
+                                         or not all(isinstance(pattern, str) and pattern for pattern in patterns)):
+                raise ValueError(f"{source}: {key} must be a list of glob patterns")
+        return cls(data.get("include"), data.get("exclude"))
+
+    def includes(self, relative_path: str) -> bool:
+        return self._include_match is not None and self._include_match(relative_path) is not None
+
+    def excludes(self, relative_path: str) -> bool:
+        return self._exclude_match is not None and self._exclude_match(relative_path) is not None
+
+    def may_include_below(self, segments: list[str]) -> bool:
+        return any(pattern.may_match_below(segments) for pattern in self.include)
+
+def load_rules(path: str) -> DiscoveryRules:
+    '''
+    Loads discovery rules from a yaml file
+
+    :raises OSError: if the file can't be read
+    :raises ValueError: if the file doesn't contain valid rules
+    '''
+    import yaml
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = yaml.safe_load(f)
+        except yaml.YAMLError as exc:
+            raise ValueError(f"{path}: {exc}") from exc
+    return DiscoveryRules.from_dict({} if data is None else data, path)
+
+class PlaybookFile:
+    """A discovered playbook file, mtime_ns and size are None if they haven't been collected"""
+    __slots__ = ("phase", "path", "relative_path", "mtime_ns", "size")
+
+    def __init__(self, phase: str, path: str, relative_path: str, mtime_ns: int = None, size: int = None):
+        self.phase = phase
+        self.path = path
+        self.relative_path = relative_path  # relative to the start directory, with "/" as separator
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+class PlaybookTreeSnapshot:
+    """Playbook files found by one discovery run, in processing order: the files of a directory
+    sorted by name, followed by its subdirectories. Later stages reuse the collected mtime and size
+    instead of calling os.stat again (see BuildManifest.use_file_stats)"""
+    __slots__ = ("start_directory", "files", "directories", "elapsed")
+
+    def __init__(self, start_directory: str):
+        self.start_directory = start_directory
+        self.files: list[PlaybookFile] = []
+        self.directories: int = 0  # number of scanned directories
+        self.elapsed: float = 0.0  # duration of the discovery in seconds
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def playbooks(self) -> list[tuple[str, str]]:
+        """(playbook_phase, playbook_file) tuples, as expected by the conversion"""
+        return [(playbook_file.phase, playbook_file.path) for playbook_file in self.files]
+
+    def phases(self) -> list[str]:
+        return list(dict.fromkeys(playbook_file.phase for playbook_file in self.files))
+
+    def file_stats(self) -> dict[str, tuple[int, int]]:
+        """playbook file -> (mtime_ns, size) of all files whose stat has been collected"""
+        return {playbook_file.path: (playbook_file.mtime_ns, playbook_file.size) for playbook_file in self.files
+                if playbook_file.mtime_ns is not None}
+
+def _entry_name(entry: os.DirEntry) -> str:
+    return entry.name
+
+def _directory_key(stat_result: os.stat_result) -> tuple[int, int]:
+    return stat_result.st_dev, stat_result.st_ino
+
+def discover_playbooks(start_directory: str, rules: DiscoveryRules = None,
+                       collect_stats: bool = True) -> PlaybookTreeSnapshot:
+    '''
+    Walks the playbooks directory and collects the playbook files
+    Only the type information cached by os.scandir is used to tell files and directories apart, so apart
+    from collect_stats no file is stat-ed, only the entered directories. Symbolic links are followed,
+    but every directory is entered only once, which stops link cycles.
+
+    :param start_directory: playbooks directory
+    :param rules: include and exclude rules, defaults to DiscoveryRules()
+    :param collect_stats: collect mtime and size of the playbook files (one stat call per playbook file)
+    :return: PlaybookTreeSnapshot
+    :raises OSError: if the start directory can't be read
+    '''
+    start = time.perf_counter()
+    if rules is None:
+        rules = DiscoveryRules()
+    snapshot = PlaybookTreeSnapshot(start_directory)
+    visited_directories = {_directory_key(os.stat(start_directory))}  # (st_dev, st_ino), stops link cycles
+    stack = [(start_directory, "")]
+    while stack:
+        directory, directory_prefix = stack.pop()
+        try:
+            with os.scandir(directory) as iterator:
+                entries = sorted(iterator, key=_entry_name)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            if directory is start_directory:
+                raise
+            continue  # the directory has been removed in the meantime or can't be read
+        snapshot.directories += 1
+        subdirectories = []
+        for entry in entries:
+            relative_path = directory_prefix + entry.name
+            if rules.excludes(relative_path):
+                continue
+            try:
+                if entry.is_dir():
+                    if not rules.may_include_below(relative_path.split("/")):
+                        continue
+                    directory_key = _directory_key(entry.stat())
+                    if directory_key in visited_directories:
+                        continue
+                    visited_directories.add(directory_key)
+                    subdirectories.append((entry.path, relative_path + "/"))
+                elif entry.is_file() and rules.includes(relative_path):
+                    playbook_file = PlaybookFile(directory, entry.path, relative_path)
+                    if collect_stats:
+                        stat_result = entry.stat()
+                        playbook_file.mtime_ns = stat_result.st_mtime_ns
+                        playbook_file.size = stat_result.st_size
+                    snapshot.files.append(playbook_file)
+            except FileNotFoundError:
+                continue  # removed since the directory has been scanned
+        stack.extend(reversed(subdirectories))
+    snapshot.elapsed = time.perf_counter() - start
+    return snapshot
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m yaml2bpmn_converter.discovery", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("start_directory", nargs="?", default="../../playbooks", metavar="START_DIRECTORY",
+                        help="playbooks directory (default: ../../playbooks)")
+    parser.add_argument("--config", metavar="FILE", help="rules file, by default the built-in rules are used")
+    parser.add_argument("--stats", action="store_true", help="print the number of files and the duration")
+    arguments = parser.parse_args(argv)
+
+    try:
+        rules = load_rules(arguments.config) if arguments.config else DiscoveryRules()
+        snapshot = discover_playbooks(arguments.start_directory, rules, collect_stats=False)
+    except (OSError, ValueError) as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    for playbook_file in snapshot:
+        print(playbook_file.path)
+    if arguments.stats:
+        print(f"{len(snapshot)} playbook file(s) in {snapshot.directories} directories, "
+              f"{snapshot.elapsed * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
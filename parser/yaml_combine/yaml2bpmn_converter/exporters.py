@@ -0,0 +1,307 @@
+"""Exports processes into several formats with one walk over the model, run from parser/yaml_combine:
+
+    python -m yaml2bpmn_converter.exporters BPMN_FILE [BPMN_FILE ...] [--format mermaid dot] [-o OUTPUT_DIRECTORY]
+
+walk_process visits every element and sequence flow of a process and its subprocesses once and passes
+them to all exporters at the same time, so each additional format only adds the cost of its own output.
+Exporters are ModelVisitor subclasses; subprocesses are entered and left like nested containers, which
+the Mermaid and DOT exporters draw as subgraphs (clusters). The BPMN xml exporter is
+xml_generator.BpmnXmlExporter, used by write_bpmn_xml.
+"""
+import os
+import re
+import sys
+import argparse
+
+from .bpmn_object_models import *
+from .activity_types import element_type
+
+# --- Model Walk
+
+class ModelVisitor:
+    """Receives the elements of a process from walk_process, all methods do nothing by default
+
+    For every flow element of a container: enter_element, for subprocesses followed by enter_subprocess,
+    the content of the subprocess and leave_subprocess, then leave_element. The sequence flows of a container
+    follow its elements. depth is 0 for the direct elements of the process and grows by one per subprocess.
+    """
+    def begin_process(self, bpmn_process: BPMNProcess):
+        pass
+
+    def end_process(self, bpmn_process: BPMNProcess):
+        pass
+
+    def enter_element(self, element: BPMNFlowElement, depth: int):
+        pass
+
+    def leave_element(self, element: BPMNFlowElement, depth: int):
+        pass
+
+    def enter_subprocess(self, subprocess: BPMNSubProcess, depth: int) -> bool:
+        '''
+        :param depth: depth of the elements of the subprocess
+        :return: False if the visitor doesn't need the content (e.g. it has written it already),
+            it then gets no calls until leave_subprocess
+        '''
+        return True
+
+    def leave_subprocess(self, subprocess: BPMNSubProcess, depth: int):
+        pass
+
+    def visit_flow(self, flow: BPMNSequenceFlow, container: BPMNProcess | BPMNSubProcess, depth: int):
+        pass
+
+def walk_container(container: BPMNProcess | BPMNSubProcess, visitors: list[ModelVisitor], depth: int = 0):
+    '''
+    Passes the content of a container to the visitors, without recursion, so any nesting depth is supported
+
+    :param depth: depth of the elements of the container
+    '''
+    # frames: [container, depth, visitors, remaining elements, visitors of the parent container]
+    stack = [(container, depth, visitors, iter(container.flow_elements), None)]
+    while stack:
+        container, depth, visitors, elements, parent_visitors = stack[-1]
+        entered = None
+        for element in elements:
+            for visitor in visitors:
+                visitor.enter_element(element, depth)
+            if isinstance(element, BPMNSubProcess):
+                inner_visitors = [visitor for visitor in visitors
+                                  if visitor.enter_subprocess(element, depth + 1) is not False]
+                if inner_visitors:
+                    entered = (element, depth + 1, inner_visitors, iter(element.flow_elements), visitors)
+                    break
+                for visitor in visitors:
+                    visitor.leave_subprocess(element, depth + 1)
+            for visitor in visitors:
+                visitor.leave_element(element, depth)
+        if entered is not None:
+            stack.append(entered)
+            continue
+        for flow in container.sequence_flows:
+            for visitor in visitors:
+                visitor.visit_flow(flow, container, depth)
+        stack.pop()
+        if parent_visitors is not None:
+            for visitor in parent_visitors:
+                visitor.leave_subprocess(container, depth)
+            for visitor in parent_visitors:
+                visitor.leave_element(container, depth - 1)
+
+def walk_process(bpmn_process: BPMNProcess, visitors: list[ModelVisitor]):
+    '''Passes the process to all visitors in one walk'''
+    for visitor in visitors:
+        visitor.begin_process(bpmn_process)
+    walk_container(bpmn_process, visitors)
+    for visitor in visitors:
+        visitor.end_process(bpmn_process)
+
+# --- Mermaid
+
+_MERMAID_ID_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_MERMAID_KEYWORDS = {"end", "graph", "subgraph", "flowchart", "direction", "style", "class", "classDef", "click",
+                     "linkStyle", "default"}
+# object type -> (opening, closing) of the node shape
+_MERMAID_SHAPES = {"event": ("((", "))"), "gateway": ("{", "}"), "task": ("[", "]")}
+MAX_LABEL_LENGTH = 50  # longer conditions are shortened in the edge labels of the diagrams
+
+def _flow_label(flow: BPMNSequenceFlow) -> str | None:
+    if flow.name != flow.id:
+        return flow.name
+    if flow.condition_expression:
+        condition = " ".join(flow.condition_expression.split())
+        return condition if len(condition) <= MAX_LABEL_LENGTH else condition[:MAX_LABEL_LENGTH - 3] + "..."
+    return None
+
+class MermaidExporter(ModelVisitor):
+    """Writes a Mermaid flowchart, subprocesses become subgraphs"""
+    def __init__(self, stream, direction: str = "LR"):
+        self.stream = stream
+        self.direction = direction
+        self._ids: dict[str, str] = {}  # element id -> mermaid node id, if the id can't be used as it is
+
+    def _node_id(self, element_id: str) -> str:
+        node_id = self._ids.get(element_id)
+        if node_id is None:
+            if _MERMAID_ID_PATTERN.fullmatch(element_id) and element_id not in _MERMAID_KEYWORDS:
+                node_id = element_id
+            else:
+                node_id = "x" + element_id.encode().hex()  # e.g. ids with "-" or keywords like "end"
+            self._ids[element_id] = node_id
+        return node_id
+
+    @staticmethod
+    def _label(text: str) -> str:
+        return '"' + text.replace('"', "#quot;").replace("\n", " ") + '"'
+
+    def begin_process(self, bpmn_process: BPMNProcess):
+        self.stream.write(f"---\ntitle: {self._label(bpmn_process.name)}\n---\nflowchart {self.direction}\n")
+
+    def enter_element(self, element: BPMNFlowElement, depth: int):
+        indent = "\t" * (depth + 1)
+        if isinstance(element, BPMNSubProcess):
+            self.stream.write(f"{indent}subgraph {self._node_id(element.id)}[{self._label(element.name)}]\n"
+                              f"{indent}\tdirection {self.direction}\n")
+            return
+        bpmn_type = element_type(element)
+        opening, closing = _MERMAID_SHAPES.get(bpmn_type.object_type if bpmn_type else "task", ("[", "]"))
+        self.stream.write(f"{indent}{self._node_id(element.id)}{opening}{self._label(element.name)}{closing}\n")
+
+    def leave_subprocess(self, subprocess: BPMNSubProcess, depth: int):
+        self.stream.write("\t" * depth + "end\n")
+
+    def visit_flow(self, flow: BPMNSequenceFlow, container: BPMNProcess | BPMNSubProcess, depth: int):
+        label = _flow_label(flow)
+        arrow = f"-->|{self._label(label)}|" if label else "-->"
+        self.stream.write(f"{chr(9) * (depth + 1)}{self._node_id(flow.source_ref)} {arrow} "
+                          f"{self._node_id(flow.target_ref)}\n")
+
+# --- Graphviz DOT
+
+# object type -> node attributes
+_DOT_NODE_ATTRIBUTES = {
+    "event": 'shape=circle, width=0.4, fixedsize=true, labelloc=b',
+    "gateway": 'shape=diamond',
+    "task": 'shape=box, style=rounded',
+}
+
+def _dot_string(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+class DotExporter(ModelVisitor):
+    """Writes a Graphviz digraph, subprocesses become clusters
+
+    A subprocess is represented by an invisible node within its cluster, the flows to and from it
+    end at the border of the cluster (compound=true with lhead and ltail).
+    """
+    def __init__(self, stream, direction: str = "LR"):
+        self.stream = stream
+        self.direction = direction
+
+    def begin_process(self, bpmn_process: BPMNProcess):
+        self.stream.write(f"digraph {_dot_string(bpmn_process.id)} {{\n"
+                          f"\tlabel={_dot_string(bpmn_process.name)};\n"
+                          f"\tcompound=true;\n\trankdir={self.direction};\n"
+                          "\tnode [fontname=\"Helvetica\", fontsize=10];\n"
+                          "\tedge [fontname=\"Helvetica\", fontsize=9];\n")
+
+    def end_process(self, bpmn_process: BPMNProcess):
+        self.stream.write("}\n")
+
+    def enter_element(self, element: BPMNFlowElement, depth: int):
+        indent = "\t" * (depth + 1)
+        if isinstance(element, BPMNSubProcess):
+            self.stream.write(f"{indent}subgraph {_dot_string('cluster_' + element.id)} {{\n"
+                              f"{indent}\tlabel={_dot_string(element.name)};\n{indent}\tstyle=rounded;\n"
+                              f"{indent}\t{_dot_string(element.id)} [shape=point, style=invis];\n")
+            return
+        bpmn_type = element_type(element)
+        attributes = _DOT_NODE_ATTRIBUTES.get(bpmn_type.object_type if bpmn_type else "task", _DOT_NODE_ATTRIBUTES["task"])
+        if isinstance(element, BPMNEndEvent):
+            attributes = attributes.replace("circle", "doublecircle")
+        self.stream.write(f"{indent}{_dot_string(element.id)} [label={_dot_string(element.name)}, {attributes}];\n")
+
+    def leave_subprocess(self, subprocess: BPMNSubProcess, depth: int):
+        self.stream.write("\t" * depth + "}\n")
+
+    def visit_flow(self, flow: BPMNSequenceFlow, container: BPMNProcess | BPMNSubProcess, depth: int):
+        attributes = []
+        label = _flow_label(flow)
+        if label:
+            attributes.append(f"label={_dot_string(label)}")
+        if isinstance(container.get_element(flow.source_ref), BPMNSubProcess):
+            attributes.append(f"ltail={_dot_string('cluster_' + flow.source_ref)}")
+        if isinstance(container.get_element(flow.target_ref), BPMNSubProcess):
+            attributes.append(f"lhead={_dot_string('cluster_' + flow.target_ref)}")
+        suffix = f" [{', '.join(attributes)}]" if attributes else ""
+        self.stream.write(f"{chr(9) * (depth + 1)}{_dot_string(flow.source_ref)} -> "
+                          f"{_dot_string(flow.target_ref)}{suffix};\n")
+
+# --- Export Formats
+
+def _bpmn_exporter(stream, layout=None) -> ModelVisitor:
+    from .xml_generator import BpmnXmlExporter
+    return BpmnXmlExporter(stream, layout=layout)
+
+def _mermaid_exporter(stream, layout=None) -> ModelVisitor:
+    return MermaidExporter(stream)
+
+def _dot_exporter(stream, layout=None) -> ModelVisitor:
+    return DotExporter(stream)
+
+# format name -> (file extension, factory(stream, layout) creating the exporter)
+EXPORT_FORMATS = {
+    "bpmn": (".bpmn", _bpmn_exporter),
+    "mermaid": (".mmd", _mermaid_exporter),
+    "dot": (".dot", _dot_exporter),
+}
+
+def register_export_format(name: str, extension: str, factory):
+    '''
+    Adds an export format
+
+    :param factory: function(stream, layout) returning the ModelVisitor which writes the format into the stream
+    '''
+    EXPORT_FORMATS[name] = (extension, factory)
+
+def create_exporter(export_format: str, stream, layout=None) -> ModelVisitor:
+    '''
+    :param export_format: one of EXPORT_FORMATS
+    :param layout: diagram of the process, only used by the BPMN format
+    :raises ValueError: if the format is unknown
+    '''
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format \"{export_format}\"")
+    return EXPORT_FORMATS[export_format][1](stream, layout)
+
+def export_process(bpmn_process: BPMNProcess, streams: dict, layout=None):
+    '''
+    Writes the process in several formats with one walk over the model
+
+    :param streams: format name -> text stream
+    :param layout: diagram of the process, only used by the BPMN format
+    '''
+    walk_process(bpmn_process, [create_exporter(export_format, stream, layout)
+                                for export_format, stream in streams.items()])
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m yaml2bpmn_converter.exporters", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("bpmn_files", nargs="+", metavar="BPMN_FILE")
+    parser.add_argument("--format", dest="formats", nargs="+", choices=list(EXPORT_FORMATS),
+                        default=["mermaid", "dot"], help="formats to write (default: mermaid dot)")
+    parser.add_argument("-o", "--output", default=".", metavar="DIRECTORY",
+                        help="output directory (default: current directory)")
+    arguments = parser.parse_args(argv)
+    from xml.etree.ElementTree import ParseError
+    from .bpmn_importer import read_bpmn_processes
+
+    failed = 0
+    for bpmn_file in arguments.bpmn_files:
+        try:
+            processes = read_bpmn_processes(bpmn_file)
+        except (OSError, ParseError) as exc:
+            print(f"failed to read {bpmn_file}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        os.makedirs(arguments.output, exist_ok=True)
+        for bpmn_process in processes:
+            layout = None
+            if "bpmn" in arguments.formats:
+                from .layout import layout_process
+                layout = layout_process(bpmn_process)
+            output_files = {export_format: os.path.join(arguments.output, bpmn_process.id + EXPORT_FORMATS[export_format][0])
+                            for export_format in arguments.formats}
+            streams = {export_format: open(output_file, "w", encoding="utf-8")
+                       for export_format, output_file in output_files.items()}
+            try:
+                export_process(bpmn_process, streams, layout)
+            finally:
+                for stream in streams.values():
+                    stream.close()
+            for output_file in output_files.values():
+                print(f"created file: {output_file}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+
+# --- File Watchers
+
+WATCHED_EXTENSIONS = (".yml", ".yaml")
+
+def _scan_directories(roots: list[str]):
+    """Yields (directory, os.DirEntry) for all entries below the roots, without following symlinks"""
+    directories = list(roots)
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    yield directory, entry
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            pass  # the directory has been removed in the meantime
+
+class PollingWatcher:
+    """Detects changed files by comparing mtime and size of all watched files in regular intervals"""
+    kind = "polling"
+
+    def __init__(self, roots: list[str], interval: float = 0.2, extensions: tuple[str, ...] = WATCHED_EXTENSIONS):
+        self.roots = list(roots)
+        self.interval = interval
+        self.extensions = extensions
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for directory, entry in _scan_directories(self.roots):
+            if entry.name.endswith(self.extensions) and not entry.is_dir(follow_symlinks=False):
+                try:
+                    stat_result = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[entry.path] = (stat_result.st_mtime_ns, stat_result.st_size)
+        return snapshot
+
+    def poll(self, timeout: float = None) -> set[str]:
+        '''
+        Waits until files have been modified, created or deleted
+
+        :param timeout: maximum time to wait in seconds, None waits until a change happens
+        :return: paths of the changed files, empty if the timeout expired
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed:
+                return changed
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return changed
+            time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+# inotify constants, see inotify(7)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+               | _IN_DELETE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, length of the name
+_READ_SIZE = 64 * 1024
+
+_libc = None  # libc with the inotify functions, loaded on first use (see "_load_libc")
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith("linux"):
+            import ctypes
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)  # symbols of the running process, which include libc
+            except OSError:
+                libc = None
+            if libc is not None and hasattr(libc, "inotify_init1"):
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                _libc = libc
+    return _libc or None
+
+def _last_os_error(filename: str = None) -> OSError:
+    import ctypes
+    error = ctypes.get_errno()
+    return OSError(error, os.strerror(error), filename)
+
+def inotify_available() -> bool:
+    return _load_libc() is not None
+
+class InotifyWatcher:
+    """Watches all directories below the roots with inotify (linux only, uses libc through ctypes)
+
+    Directories created later are watched as soon as their creation is reported. If the kernel
+    queue overflows, all watched files are reported as changed.
+    """
+    kind = "inotify"
+
+    def __init__(self, roots: list[str], extensions: tuple[str, ...] = WATCHED_EXTENSIONS):
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.roots = list(roots)
+        self.extensions = extensions
+        self._directories: dict[int, str] = {}  # watch descriptor -> directory
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise _last_os_error()
+        for root in self.roots:
+            self._watch_tree(root)
+
+    def _watch_directory(self, directory: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            error = _last_os_error(directory)
+            if error.errno in (errno.ENOENT, errno.ENOTDIR):
+                return  # removed before it could be watched
+            raise error
+        self._directories[wd] = directory
+
+    def _watch_tree(self, root: str) -> set[str]:
+        '''
+        Watches a directory and all its subdirectories
+
+        :return: watched files which already exist in the tree
+        '''
+        self._watch_directory(root)
+        files = set()
+        for directory, entry in _scan_directories([root]):
+            if entry.is_dir(follow_symlinks=False):
+                self._watch_directory(entry.path)
+            elif entry.name.endswith(self.extensions):
+                files.add(entry.path)
+        return files
+
+    def _all_files(self) -> set[str]:
+        return {entry.path for directory, entry in _scan_directories(self.roots)
+                if entry.name.endswith(self.extensions) and not entry.is_dir(follow_symlinks=False)}
+
+    def poll(self, timeout: float = None) -> set[str]:
+        '''
+        Waits until files have been modified, created or deleted
+
+        :param timeout: maximum time to wait in seconds, None waits until a change happens
+        :return: paths of the changed files, empty if the timeout expired
+        '''
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & _IN_Q_OVERFLOW:
+                    changed.update(self._all_files())
+                    continue
+                directory = self._directories.get(wd)
+                if mask & _IN_IGNORED:
+                    self._directories.pop(wd, None)
+                    continue
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        changed.update(self._watch_tree(path))
+                elif name.endswith(self.extensions):
+                    changed.add(path)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+def create_watcher(roots: list[str], polling: bool = False, interval: float = 0.2):
+    '''
+    Creates an inotify watcher if available, otherwise a polling watcher
+
+    :param roots: directories to watch, including all subdirectories
+    :param polling: always use the polling watcher
+    :param interval: poll interval of the polling watcher in seconds
+    '''
+    if not polling and inotify_available():
+        try:
+            return InotifyWatcher(roots)
+        except OSError:
+            pass  # e.g. the inotify watch limit is reached
+    return PollingWatcher(roots, interval)
+
+def wait_for_changes(watcher, debounce: float = 0.05) -> set[str]:
+    '''
+    Waits for changes and collects all changes of a burst (e.g. a "save all" in an editor)
+
+    :param watcher: PollingWatcher or InotifyWatcher
+    :param debounce: the burst ends, when no further change happens for this time in seconds
+    :return: paths of all changed files
+    '''
+    changed = watcher.poll()
+    while True:
+        more = watcher.poll(debounce)
+        if not more:
+            return changed
+        changed |= more
@@ -0,0 +1,242 @@
+from .bpmn_object_models import *
+from .activity_types import element_type
+
+# --- Subprocess Fragments
+
+# Modules are inlined under many tasks, so a playbook contains many subprocesses with the same structure.
+# They only differ in the numbered activity names and in the ids generated from the counters of the
+# conversion context. The first subprocess of every structure is converted normally and becomes the
+# template (FragmentTemplate), later copies are instantiated from it by remapping the ids.
+
+_MISSING = object()  # marks a missing "name" key, which makes the name default to the activity id
+
+def _freeze(value):
+    '''Returns a hashable representation of a yaml value, which keeps values of different types apart'''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return (dict, tuple((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return (list, tuple(_freeze(item) for item in value))
+    return (type(value), value)
+
+def _goto_key(goto, positions: dict):
+    '''Goto value with the targets replaced by the position of the target in the block (-1: no flow is created)'''
+    if isinstance(goto, str):
+        return positions.get(goto, -1)
+    if isinstance(goto, list):
+        branches = []
+        for branch in goto:
+            if isinstance(branch, str):
+                branch = {"then": branch}  # branch of a parallel gateway, converted like a branch without "if"
+            elif not isinstance(branch, dict):
+                return None  # the parser can't convert this goto
+            target = branch.get("then")
+            branches.append((_freeze(branch.get("if")), positions.get(target, -1) if isinstance(target, str) else -1))
+        return tuple(branches)
+    return _freeze(goto)
+
+def fingerprint_fragments(activities: dict) -> dict[int, int]:
+    '''
+    Numbers the activities blocks of all subprocesses by their structure, in one pass without recursion
+    Two blocks get the same number if they are converted into identical subprocess contents, apart from the ids:
+    same types, explicit names, conditions and flows between the same positions, and inner blocks with the same numbers.
+    The names of the activities aren't part of the structure, they only end up in the ids.
+
+    :param activities: top level activities of the playbook
+    :return: id() of the activities block -> fragment number. Blocks the parser can't convert are missing
+    '''
+    numbers: dict = {}  # structure of a block -> fragment number
+    block_numbers: dict[int, int] = {}
+    # each entry: (activities block, its subprocess activities or None if they haven't been pushed yet)
+    stack = [(activities, None)]
+    while stack:
+        block, subprocesses = stack.pop()
+        if subprocesses is None:
+            subprocesses = [activity for activity in block.values()
+                            if isinstance(activity, dict) and activity.get("type") == "sub"]
+            stack.append((block, subprocesses))
+            stack.extend((activity["activities"], None) for activity in subprocesses
+                         if isinstance(activity.get("activities"), dict))
+            continue
+        if block is activities:
+            break  # the top level isn't a subprocess
+
+        positions = {name: position for position, name in enumerate(block)}
+        structure = []
+        for activity in block.values():
+            if not isinstance(activity, dict):
+                break
+            activity_type = activity.get("type")
+            inner = None
+            if activity_type == "sub":
+                inner_activities = activity.get("activities", {})
+                if not isinstance(inner_activities, dict):
+                    break
+                inner = block_numbers.get(id(inner_activities)) if inner_activities else ()
+                if inner is None:
+                    break  # the inner block couldn't be numbered
+            elif not isinstance(activity_type, str):
+                activity_type = _freeze(activity_type)
+            name = activity.get("name", _MISSING)
+            if name is not _MISSING and not isinstance(name, str):
+                name = _freeze(name)
+            goto = _goto_key(activity.get("goto"), positions)
+            if goto is None:
+                break
+            structure.append((activity_type, name, goto, inner))
+        else:
+            block_numbers[id(block)] = numbers.setdefault(tuple(structure), len(numbers))
+    return block_numbers
+
+class FragmentTemplate:
+    """Converted content of the first subprocess of a structure, with the counters before and after its conversion"""
+    __slots__ = ("subprocess", "activities", "counters_before", "counters_after", "_plan")
+
+    def __init__(self, subprocess: BPMNSubProcess, activities: dict, counters_before: tuple, counters_after: tuple):
+        self.subprocess = subprocess
+        self.activities = activities  # activities block the subprocess has been converted from
+        self.counters_before = counters_before  # see ConversionContext.counters
+        self.counters_after = counters_after
+        self._plan = None  # compiled on the first instantiation, see _compile_plan
+
+    def plan(self) -> list:
+        if self._plan is None:
+            self._plan = _compile_plan(self)
+        return self._plan
+
+    def explicit_names(self) -> set:
+        '''Names given in the yaml and flow conditions, as opposed to names defaulting to the id'''
+        names = set()
+        blocks = [self.activities]
+        while blocks:
+            for activity in blocks.pop().values():
+                if isinstance(activity.get("name"), str):
+                    names.add(activity["name"])
+                if isinstance(activity.get("goto"), list):
+                    names.update(branch["if"] for branch in activity["goto"]
+                                 if isinstance(branch, dict) and isinstance(branch.get("if"), str))
+                if activity.get("type") == "sub" and activity.get("activities"):
+                    blocks.append(activity["activities"])
+        return names
+
+def _number(generated_id: str, counter_before: int) -> int:
+    '''Number of an id generated from a counter, relative to the counter before the template'''
+    return int(generated_id.rsplit("_", 1)[1]) - counter_before
+
+def _compile_plan(template: FragmentTemplate) -> list:
+    '''
+    Translates the template content into a plan, which refers to the activities by their position in the
+    activities block and to the generated ids by their number relative to the counters before the template
+
+    :return: one (elements, flows) tuple per container, the subprocess first and the inner subprocesses
+        breadth first. elements: (kind, model class, position or number, event definition, incoming, outgoing),
+        flows: (number, position of the source element, position of the target element, name, condition)
+    '''
+    flow_before, start_before, end_before, definitions_before = template.counters_before
+    plan = []
+    containers = [(template.subprocess, template.activities)]
+    for container, block in containers:
+        positions = {name: position for position, name in enumerate(block)}
+        element_positions = {}
+        elements = []
+        for element in container.flow_elements:
+            element_positions[element.id] = len(elements)
+            definition = None
+            if isinstance(element, BPMNStartEvent):
+                # None: start event of an empty subprocess, named after the subprocess
+                kind, key = "start", None if element.id == container.id + "_start" else _number(element.id, start_before)
+            elif isinstance(element, BPMNEndEvent):
+                kind, key = "end", None if element.id == container.id + "_end" else _number(element.id, end_before)
+            else:
+                kind, key = "activity", positions[element.id]
+                if isinstance(element, BPMNIntermediateEvent):
+                    tag = element_type(element).definition_tag
+                    definition = (tag, _number(element.event_definition_id, definitions_before.get(tag, 0)))
+                elif isinstance(element, BPMNSubProcess):
+                    containers.append((element, block[element.id].get("activities", {})))
+            elements.append((kind, type(element), key, definition,
+                             tuple(_number(flow_id, flow_before) for flow_id in element.incoming_flows),
+                             tuple(_number(flow_id, flow_before) for flow_id in element.outgoing_flows)))
+        flows = []
+        for flow in container.sequence_flows:
+            flows.append((_number(flow.id, flow_before), element_positions[flow.source_ref],
+                          element_positions[flow.target_ref],
+                          None if flow.name == flow.id else flow.name,  # an unnamed element is named by its id
+                          flow.condition_expression))
+        plan.append((elements, flows))
+    return plan
+
+def _flow_refs(flow_ids: list[str], numbers: tuple) -> tuple | IndexedList:
+    flow_refs = tuple(flow_ids[number] for number in numbers)
+    return flow_refs if len(flow_refs) <= SMALL_FLOW_REFS_LIMIT else IndexedList(flow_refs)
+
+def instantiate_fragment(template: FragmentTemplate, subprocess: BPMNSubProcess, activities: dict, counters: tuple):
+    '''
+    Fills a subprocess with a copy of the template content, as if its activities had been converted
+    The context has to be advanced by the counters of the template afterwards (ConversionContext.advance_counters)
+
+    :param template: template with the same fragment number as the activities
+    :param subprocess: empty subprocess to fill
+    :param activities: activities block of the subprocess
+    :param counters: current counters of the conversion context (see ConversionContext.counters)
+    '''
+    flow_counter, start_counter, end_counter, definition_counters = counters
+    # ids of the flows by their relative number, which starts with 1
+    flow_ids = [None] + [f"sequenceFlow_{flow_counter + number}"
+                         for number in range(1, template.counters_after[0] - template.counters_before[0] + 1)]
+    containers = [(subprocess, activities)]
+    for (elements, flows), (container, block) in zip(template.plan(), containers):
+        names = list(block)
+        element_ids = []
+        for kind, element_class, key, definition, incoming, outgoing in elements:
+            if kind == "activity":
+                element_id = names[key]
+                name = block[element_id].get("name", element_id)
+                if definition is None:
+                    element = element_class(element_id, name)
+                else:
+                    tag, number = definition
+                    element = element_class(element_id, name, f"{tag}_{definition_counters.get(tag, 0) + number}")
+                if isinstance(element, BPMNSubProcess):
+                    containers.append((element, block[element_id].get("activities", {})))
+            elif kind == "start":
+                element_id = container.id + "_start" if key is None else f"startEvent_{start_counter + key}"
+                element = element_class(element_id)
+                container.set_start_event(element)
+            else:
+                element_id = container.id + "_end" if key is None else f"endEvent_{end_counter + key}"
+                element = element_class(element_id)
+                container.add_end_event(element)
+            element.incoming_flows = _flow_refs(flow_ids, incoming)
+            element.outgoing_flows = _flow_refs(flow_ids, outgoing)
+            element_ids.append(element_id)
+            container.add_flow_element(element)
+        for number, source, target, name, condition in flows:
+            container.add_sequence_flow(BPMNSequenceFlow(flow_ids[number], element_ids[source], element_ids[target],
+                                                         name, condition))
+
+def fragment_id_map(template: FragmentTemplate, subprocess: BPMNSubProcess) -> dict[str, str] | None:
+    '''
+    Maps the ids within the template content to the ids within the content of a copy
+
+    :return: template id -> id, or None if a template id maps to several ids. This happens if the activity
+        names aren't numbered, then the same name can occur in several blocks with different copies
+    '''
+    id_map = {}
+    containers = [(template.subprocess, subprocess)]
+    while containers:
+        template_container, container = containers.pop()
+        pairs = []
+        for template_element, element in zip(template_container.flow_elements, container.flow_elements):
+            pairs.append((template_element.id, element.id))
+            if isinstance(template_element, BPMNIntermediateEvent):
+                pairs.append((template_element.event_definition_id, element.event_definition_id))
+            elif isinstance(template_element, BPMNSubProcess):
+                containers.append((template_element, element))
+        pairs.extend((template_flow.id, flow.id)
+                     for template_flow, flow in zip(template_container.sequence_flows, container.sequence_flows))
+        for template_id, element_id in pairs:
+            if id_map.setdefault(template_id, element_id) != element_id:
+                return None
+    return id_map
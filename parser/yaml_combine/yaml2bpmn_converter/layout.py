@@ -0,0 +1,308 @@
+from .bpmn_object_models import *
+from .activity_types import element_type
+
+# --- Diagram Layout
+
+# Layered (Sugiyama style) layout of processes and subprocesses, flows go from left to right:
+#   1. cycle removal: flows closing a loop (back flows) are found by a depth first search from the start event
+#   2. layering: every element gets the length of the longest path from a source as its layer
+#   3. flows spanning several layers get a dummy node per crossed layer
+#   4. crossing reduction: the elements of every layer are sorted by the barycenter of their neighbours
+#   5. coordinate assignment: elements are aligned with their predecessors, keeping a minimum distance
+#   6. routing: orthogonal waypoints through the dummy nodes, back flows are routed below the content
+# Every step is linear in the number of elements and flows (the barycenter sort is O(n log n) per layer).
+# Subprocesses are laid out first, the parent container then treats them as elements of the resulting size.
+
+TASK_WIDTH = 100
+TASK_HEIGHT = 80
+EVENT_SIZE = 36
+GATEWAY_SIZE = 50
+LAYER_SPACING = 50  # horizontal distance between two layers
+NODE_SPACING = 30  # vertical distance between two elements of a layer
+DUMMY_HEIGHT = 10  # vertical space reserved for a flow crossing a layer
+CONTAINER_PADDING = 30  # distance between the border of an expanded subprocess and its content
+BACK_FLOW_SPACING = 15  # vertical distance between the routes of back flows
+CROSSING_REDUCTION_SWEEPS = 4
+
+class Bounds:
+    """Position and size of a shape"""
+    __slots__ = ("x", "y", "width", "height")
+
+    def __init__(self, x: float, y: float, width: float, height: float):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+class DiagramLayout:
+    """Absolute coordinates of a process diagram: bounds of the flow elements and waypoints of the sequence flows"""
+    __slots__ = ("shapes", "edges", "expanded")
+
+    def __init__(self):
+        self.shapes: dict[str, Bounds] = {}  # element id -> bounds, subprocesses before their elements
+        self.edges: dict[str, list[tuple[int, int]]] = {}  # sequence flow id -> waypoints
+        self.expanded: set[str] = set()  # ids of subprocesses drawn with their content
+
+def _element_size(element: BPMNFlowElement) -> tuple[float, float]:
+    bpmn_type = element_type(element)
+    object_type = bpmn_type.object_type if bpmn_type is not None else "task"
+    if object_type == "event":
+        return EVENT_SIZE, EVENT_SIZE
+    if object_type == "gateway":
+        return GATEWAY_SIZE, GATEWAY_SIZE
+    return TASK_WIDTH, TASK_HEIGHT
+
+def _find_back_flows(successors: list[list[tuple[int, int]]], roots: list[int]) -> set[int]:
+    '''
+    Depth first search without recursion
+
+    :param successors: node -> list of (target node, flow number)
+    :param roots: nodes to start the search from, in order of priority
+    :return: numbers of the flows pointing to a node on the current search path
+    '''
+    state = [0] * len(successors)  # 0: not visited, 1: on the search path, 2: finished
+    back_flows = set()
+    for root in roots:
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, remaining = stack[-1]
+            for target, flow_number in remaining:
+                if state[target] == 1:
+                    back_flows.add(flow_number)
+                elif state[target] == 0:
+                    state[target] = 1
+                    stack.append((target, iter(successors[target])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return back_flows
+
+def _orthogonal_route(anchors: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    """Connects the anchor points with horizontal and vertical segments, bending halfway between two anchors"""
+    route = [anchors[0]]
+    for x, y in anchors[1:]:
+        previous_x, previous_y = route[-1]
+        if y != previous_y:
+            middle_x = (previous_x + x) / 2
+            route.append((middle_x, previous_y))
+            route.append((middle_x, y))
+        route.append((x, y))
+    return route
+
+def _layout_container(container: BPMNProcess | BPMNSubProcess, layouts: dict) -> tuple[float, float]:
+    '''
+    Lays out the direct elements of a container, after laying out its subprocesses
+
+    :param container: process or subprocess
+    :param layouts: container id -> (element id -> Bounds, flow id -> waypoints), relative to the container
+    :return: (width, height) of the content including the padding
+    '''
+    elements = list(container.flow_elements)
+    element_count = len(elements)
+    index = {element.id: number for number, element in enumerate(elements)}
+    sizes = [_layout_container(element, layouts) if isinstance(element, BPMNSubProcess) else _element_size(element)
+             for element in elements]
+
+    flows = [(flow, index[flow.source_ref], index[flow.target_ref]) for flow in container.sequence_flows
+             if flow.source_ref in index and flow.target_ref in index]
+    successors = [[] for _ in range(element_count)]
+    for flow_number, (flow, source, target) in enumerate(flows):
+        successors[source].append((target, flow_number))
+
+    # Step 1: cycle removal, the search starts at the start event so loops are broken where they close
+    roots = list(range(element_count))
+    if container.start_event is not None and container.start_event.id in index:
+        roots.insert(0, index[container.start_event.id])
+    back_flows = _find_back_flows(successors, roots)
+
+    # Step 2: layering by longest path in the acyclic graph (back flows reversed, self loops ignored)
+    acyclic_successors = [[] for _ in range(element_count)]
+    in_degree = [0] * element_count
+    for flow_number, (flow, source, target) in enumerate(flows):
+        if source == target:
+            continue
+        if flow_number in back_flows:
+            source, target = target, source
+        acyclic_successors[source].append(target)
+        in_degree[target] += 1
+    layer = [0] * element_count
+    topological_order = [node for node in range(element_count) if in_degree[node] == 0]
+    for node in topological_order:  # the list grows while it's iterated
+        for target in acyclic_successors[node]:
+            if layer[node] + 1 > layer[target]:
+                layer[target] = layer[node] + 1
+            in_degree[target] -= 1
+            if in_degree[target] == 0:
+                topological_order.append(target)
+    layer_count = max(layer) + 1 if element_count else 0
+    # end events without outgoing flows are moved into the last layer
+    for node, element in enumerate(elements):
+        if isinstance(element, BPMNEndEvent) and not acyclic_successors[node]:
+            layer[node] = layer_count - 1
+
+    # Step 3: dummy nodes for flows spanning several layers (back flows are routed separately)
+    node_layer = list(layer)
+    node_height = [height for width, height in sizes]
+    upper = [[] for _ in range(element_count)]  # neighbours in the previous layer
+    lower = [[] for _ in range(element_count)]  # neighbours in the next layer
+    chains = {}  # flow number -> nodes from source to target, including dummy nodes
+    for flow_number, (flow, source, target) in enumerate(flows):
+        if source == target or flow_number in back_flows:
+            continue
+        chain = [source]
+        for dummy_layer in range(layer[source] + 1, layer[target]):
+            node_layer.append(dummy_layer)
+            node_height.append(DUMMY_HEIGHT)
+            upper.append([])
+            lower.append([])
+            chain.append(len(node_layer) - 1)
+        chain.append(target)
+        for node, next_node in zip(chain, chain[1:]):
+            lower[node].append(next_node)
+            upper[next_node].append(node)
+        chains[flow_number] = chain
+
+    # Step 4: crossing reduction, initial order is the topological order
+    # (reversing the back flows made the graph acyclic, so the topological order contains every element)
+    layers = [[] for _ in range(layer_count)]
+    for node in topological_order:
+        layers[layer[node]].append(node)
+    for node in range(element_count, len(node_layer)):
+        layers[node_layer[node]].append(node)
+    position = [0] * len(node_layer)
+    for layer_nodes in layers:
+        for number, node in enumerate(layer_nodes):
+            position[node] = number
+    for sweep in range(CROSSING_REDUCTION_SWEEPS):
+        downward = sweep % 2 == 0
+        neighbours = upper if downward else lower
+        for layer_number in (range(1, layer_count) if downward else range(layer_count - 2, -1, -1)):
+            layer_nodes = layers[layer_number]
+            barycenter = {}
+            for node in layer_nodes:
+                node_neighbours = neighbours[node]
+                if node_neighbours:
+                    barycenter[node] = sum(position[x] for x in node_neighbours) / len(node_neighbours)
+                else:
+                    barycenter[node] = position[node]
+            layer_nodes.sort(key=barycenter.__getitem__)
+            for number, node in enumerate(layer_nodes):
+                position[node] = number
+
+    # Step 5: coordinates. x by layer, y aligned with the predecessors but keeping the minimum distance
+    layer_width = [0] * layer_count
+    for node in range(element_count):
+        layer_width[layer[node]] = max(layer_width[layer[node]], sizes[node][0])
+    layer_x = []
+    x = CONTAINER_PADDING
+    for width in layer_width:
+        layer_x.append(x)
+        x += width + LAYER_SPACING
+    content_width = x - LAYER_SPACING if layer_count else CONTAINER_PADDING
+
+    center_y = [0.0] * len(node_layer)
+    for layer_nodes in layers:
+        previous_bottom = None
+        for node in layer_nodes:
+            height = node_height[node]
+            node_upper = upper[node]
+            if node_upper:
+                top = sum(center_y[x] for x in node_upper) / len(node_upper) - height / 2
+            else:
+                top = 0.0 if previous_bottom is None else previous_bottom + NODE_SPACING
+            if previous_bottom is not None and top < previous_bottom + NODE_SPACING:
+                top = previous_bottom + NODE_SPACING
+            center_y[node] = top + height / 2
+            previous_bottom = top + height
+    if center_y:
+        shift = CONTAINER_PADDING - min(center_y[node] - node_height[node] / 2 for node in range(len(node_layer)))
+        center_y = [y + shift for y in center_y]
+        content_bottom = max(center_y[node] + node_height[node] / 2 for node in range(len(node_layer)))
+    else:
+        content_bottom = CONTAINER_PADDING
+
+    shapes = {}
+    for node, element in enumerate(elements):
+        width, height = sizes[node]
+        node_layer_number = layer[node]
+        shapes[element.id] = Bounds(layer_x[node_layer_number] + (layer_width[node_layer_number] - width) / 2,
+                                    center_y[node] - height / 2, width, height)
+
+    # Step 6: routing
+    edges = {}
+    back_flow_y = content_bottom
+    for flow_number, (flow, source, target) in enumerate(flows):
+        source_bounds = shapes[elements[source].id]
+        target_bounds = shapes[elements[target].id]
+        if flow_number in chains:
+            anchors = [(source_bounds.x + source_bounds.width, center_y[source])]
+            for dummy in chains[flow_number][1:-1]:
+                dummy_layer = node_layer[dummy]
+                anchors.append((layer_x[dummy_layer] + layer_width[dummy_layer] / 2, center_y[dummy]))
+            anchors.append((target_bounds.x, center_y[target]))
+            edges[flow.id] = _orthogonal_route(anchors)
+            continue
+        # back flows and self loops leave and enter at the bottom and run below the content
+        back_flow_y += BACK_FLOW_SPACING
+        source_x = source_bounds.x + source_bounds.width / 2
+        target_x = target_bounds.x + target_bounds.width / 2
+        if source == target:
+            source_x = source_bounds.x + source_bounds.width * 3 / 4
+            target_x = source_bounds.x + source_bounds.width / 4
+        edges[flow.id] = [
+            (source_x, source_bounds.y + source_bounds.height),
+            (source_x, back_flow_y),
+            (target_x, back_flow_y),
+            (target_x, target_bounds.y + target_bounds.height)
+        ]
+
+    layouts[container.id] = (shapes, edges)
+    return content_width + CONTAINER_PADDING, back_flow_y + CONTAINER_PADDING
+
+def layout_process(bpmn_process: BPMNProcess) -> DiagramLayout:
+    '''
+    Computes the diagram of a process: bounds for every flow element, including the expanded subprocesses,
+    and waypoints for every sequence flow. Coordinates are rounded to integers.
+
+    :param bpmn_process: process to lay out
+    :return: DiagramLayout with absolute coordinates
+    '''
+    layouts = {}
+    _layout_container(bpmn_process, layouts)
+
+    diagram = DiagramLayout()
+    unrouted_flows = []
+    containers = [(bpmn_process, 0.0, 0.0)]
+    while containers:
+        container, offset_x, offset_y = containers.pop()
+        shapes, edges = layouts[container.id]
+        for element in container.flow_elements:
+            bounds = shapes[element.id]
+            x, y = bounds.x + offset_x, bounds.y + offset_y
+            diagram.shapes[element.id] = Bounds(round(x), round(y), round(bounds.width), round(bounds.height))
+            if isinstance(element, BPMNSubProcess):
+                diagram.expanded.add(element.id)
+                containers.append((element, x, y))
+        for flow in container.sequence_flows:
+            waypoints = edges.get(flow.id)
+            if waypoints is None:
+                unrouted_flows.append(flow)
+                continue
+            diagram.edges[flow.id] = [(round(x + offset_x), round(y + offset_y)) for x, y in waypoints]
+
+    # flows between elements of different containers are connected directly
+    for flow in unrouted_flows:
+        source_bounds = diagram.shapes.get(flow.source_ref)
+        target_bounds = diagram.shapes.get(flow.target_ref)
+        if source_bounds is None or target_bounds is None:
+            continue
+        route = _orthogonal_route([
+            (source_bounds.x + source_bounds.width, source_bounds.y + source_bounds.height / 2),
+            (target_bounds.x, target_bounds.y + target_bounds.height / 2)
+        ])
+        diagram.edges[flow.id] = [(round(x), round(y)) for x, y in route]
+    return diagram
@@ -0,0 +1,151 @@
+import logging
+
+from .module_index import ModuleIndex
+from .activity_types import get_activitie_object_type
+
+logger = logging.getLogger(__name__)
+
+# --- Module Expansion
+
+# A task is replaced by the module of the same name, which turns it into a subprocess. The inserted
+# activities can reference modules themselves, so they are expanded as well, up to a maximum nesting depth.
+# The expansion works through the activities blocks with an explicit stack: every block is visited once,
+# so the work is linear in the size of the expanded playbook and deep nesting can't hit the recursion limit.
+
+EXPANDED = "expanded"  # the module has been inserted
+CYCLE = "cycle"  # the module is already being expanded further up, the task is kept
+DEPTH_LIMIT = "depth_limit"  # the module would be nested deeper than allowed, the task is kept
+INVALID_MODULE = "invalid_module"  # the module file has no activities, the task is kept
+
+def _unlink(node: tuple) -> list:
+    '''Turns a linked list of (item, parent node) tuples into a list, starting with the item of the root'''
+    items = []
+    while node is not None:
+        item, node = node
+        items.append(item)
+    items.reverse()
+    return items
+
+class ModuleExpansion:
+    """One entry of the expansion trace of a playbook: a task which references a module
+
+    activity_path: activity names from the top level of the playbook to the task
+    chain: names of the modules the task is nested in, followed by the module of the task
+    Both are stored as links to the entries of their parents, so tracing a task costs the same at every depth.
+    """
+    __slots__ = ("_path_node", "_chain_node", "module_name", "module_file", "depth", "status", "parent_module_file")
+
+    def __init__(self, path_node: tuple, chain_node: tuple, module_file: str, depth: int, status: str,
+                 parent_module_file: str = None):
+        self._path_node = path_node  # (activity name, path node of the owning activity)
+        self._chain_node = chain_node  # (module name, chain node of the enclosing module)
+        self.module_name = chain_node[0]
+        self.module_file = module_file
+        self.depth = depth  # number of modules in the chain
+        self.status = status  # one of EXPANDED, CYCLE, DEPTH_LIMIT, INVALID_MODULE
+        self.parent_module_file = parent_module_file  # module file the task is part of, None for the playbook itself
+
+    @property
+    def activity_path(self) -> list[str]:
+        return _unlink(self._path_node)
+
+    @property
+    def chain(self) -> list[str]:
+        return _unlink(self._chain_node)
+
+    def __repr__(self) -> str:
+        return f"ModuleExpansion({'/'.join(self.activity_path)!r}, {' -> '.join(self.chain)!r}, {self.status!r})"
+
+def expand_modules(playbook_obj: dict, playbook_phase: str, module_index: ModuleIndex, module_lookups: dict = None,
+                   max_depth: int = None) -> list[ModuleExpansion]:
+    '''
+    Replaces all tasks, which reference a module, with a subprocess containing the activities of the module,
+    including the tasks within inserted modules. The playbook is modified in place.
+    A module referencing itself, directly or through other modules, isn't inserted again: the task is kept
+    and the cycle is recorded in the trace together with the full module chain.
+
+    :param playbook_obj: data structure of the playbook
+    :param playbook_phase: directory of the playbook phase, the modules are resolved relative to it
+    :param module_index: index used to resolve and load modules
+    :param module_lookups: optional dict, which is filled with the candidate module files of every
+        task name looked up (module name -> list of files)
+    :param max_depth: maximum number of nested modules, defaults to the maximum depth of the module index
+    :return: expansion trace, one entry per task referencing a module. The blocks are expanded depth first
+        in the order of the playbook, the tasks of a block are traced before the tasks of its inner blocks
+    '''
+    if max_depth is None:
+        max_depth = module_index.max_depth
+    # checked once per call, so the debug messages in the loop cost nothing if debug logging is disabled
+    debug = logger.isEnabledFor(logging.DEBUG)
+    trace = []
+    if not isinstance(playbook_obj, dict) or not isinstance(playbook_obj.get("activities"), dict):
+        return trace
+
+    # module name -> number of times it occurs in the chain of the block being expanded
+    active_modules: dict[str, int] = {}
+    # blocks still to expand: (activities block, path node of the owning activity, chain node, depth,
+    # module file of the block, module entered with the block or None).
+    # A module name on the stack marks the end of the blocks within that module
+    blocks = [(playbook_obj["activities"], None, None, 0, None, None)]
+    while blocks:
+        entry = blocks.pop()
+        if isinstance(entry, str):
+            active_modules[entry] -= 1
+            continue
+        activities, owner_node, chain_node, depth, parent_module_file, entered_module = entry
+        if entered_module is not None:
+            active_modules[entered_module] = active_modules.get(entered_module, 0) + 1
+        inner_blocks = []
+        for activity, activity_obj in activities.items():
+            object_type = get_activitie_object_type(activity_obj)
+            if object_type == "subprocess":
+                # subprocesses written in the playbook or module belong to the same module chain
+                if isinstance(activity_obj.get("activities"), dict):
+                    inner_blocks.append((activity_obj["activities"], (activity, owner_node), chain_node, depth,
+                                         parent_module_file, None))
+                continue
+            if object_type != "task":
+                continue
+
+            # Modules can be placed in the "modules" directory of the phase or in one of the shared locations
+            module_files = module_index.find_module_files(activity, playbook_phase)
+            if module_lookups is not None:
+                module_lookups[activity] = module_files
+            if not module_files:
+                continue
+            path_node = (activity, owner_node)
+            module_chain_node = (activity, chain_node)
+            # skipped modules are reported by the validator (see validator.validate_playbook)
+            if active_modules.get(activity):
+                trace.append(ModuleExpansion(path_node, module_chain_node, module_files[0], depth + 1, CYCLE,
+                                             parent_module_file))
+                continue
+            if depth + 1 > max_depth:
+                trace.append(ModuleExpansion(path_node, module_chain_node, module_files[0], depth + 1, DEPTH_LIMIT,
+                                             parent_module_file))
+                continue
+
+            for file_to_load in module_files:
+                if debug:
+                    logger.debug("[+] Module found at location %s ", file_to_load)
+                try:
+                    activity_obj["activities"] = module_index.load_activities(file_to_load)
+                except KeyError:
+                    logger.error("[-] Unable to convert file %s", file_to_load)
+                    trace.append(ModuleExpansion(path_node, module_chain_node, file_to_load, depth + 1, INVALID_MODULE,
+                                                 parent_module_file))
+                    continue
+                activity_obj["type"] = "sub"  # by inserting the module the task converts into a subprocess
+                trace.append(ModuleExpansion(path_node, module_chain_node, file_to_load, depth + 1, EXPANDED,
+                                             parent_module_file))
+                if isinstance(activity_obj["activities"], dict):
+                    inner_blocks.append((activity_obj["activities"], path_node, module_chain_node, depth + 1,
+                                         file_to_load, activity))
+                break  # Module found, no search for further modules needed
+
+        # the inner blocks are expanded in the order of the playbook, each module block above its end marker
+        for inner_block in reversed(inner_blocks):
+            if inner_block[5] is not None:
+                blocks.append(inner_block[5])
+            blocks.append(inner_block)
+    return trace
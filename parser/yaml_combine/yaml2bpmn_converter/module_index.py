@@ -0,0 +1,114 @@
+import os
+
+# --- Module Index
+
+MODULE_FILE_EXTENSION = ".yml"
+DEFAULT_MAX_MODULE_DEPTH = 8  # maximum number of nested modules, 1 only expands the modules referenced by the playbook
+
+def copy_yaml_data(data):
+    """Copies a structure of dicts and lists as produced by the yaml loader.
+    Scalars (str, int, bool, None, ...) are immutable and are shared."""
+    if isinstance(data, dict):
+        return {key: copy_yaml_data(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [copy_yaml_data(value) for value in data]
+    return data
+
+class ModuleIndex:
+    """Resolves module names to module files and memoizes the parsed module activities
+
+    Every module root is scanned only once (with os.scandir) and then looked up in a dict,
+    so resolving a module doesn't probe the filesystem for every referencing task.
+    Parsed activities are cached per file and invalidated if mtime or size of the file change.
+    Callers always get a copy of the cached activities, so they can modify it freely
+    (e.g. by add_counter_to_activities) without corrupting the cache.
+    """
+    def __init__(self, loader, shared_roots: list[str] = None, max_depth: int = DEFAULT_MAX_MODULE_DEPTH):
+        '''
+        :param loader: function which loads a yaml file and returns its data structure (e.g. load_yaml_file)
+        :param shared_roots: module directories, which are searched after the modules directory of the playbook phase
+        :param max_depth: maximum number of nested modules inserted into a playbook (see module_expansion)
+        '''
+        self.loader = loader
+        self.shared_roots: list[str] = list(shared_roots) if shared_roots else []
+        self.max_depth = max_depth
+        self.hits: int = 0
+        self.misses: int = 0
+        self._root_listings: dict[str, dict[str, str]] = {}  # root directory -> {module name -> file}
+        self._activities_cache: dict[str, tuple[int, int, dict]] = {}  # file -> (mtime_ns, size, activities)
+
+    def _listing(self, root: str) -> dict[str, str]:
+        listing = self._root_listings.get(root)
+        if listing is None:
+            listing = {}
+            try:
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(MODULE_FILE_EXTENSION) and entry.is_file():
+                            listing[entry.name[:-len(MODULE_FILE_EXTENSION)]] = entry.path
+            except (FileNotFoundError, NotADirectoryError):
+                pass  # a missing module root simply doesn't provide any modules
+            self._root_listings[root] = listing
+        return listing
+
+    def roots_for_phase(self, playbook_phase: str) -> list[str]:
+        return [os.path.join(playbook_phase, "modules")] + self.shared_roots
+
+    def find_module_files(self, module_name: str, playbook_phase: str) -> list[str]:
+        '''
+        Returns all files which provide the module, ordered by priority of their module root
+
+        :param module_name: name of the module (file name without extension)
+        :param playbook_phase: directory of the playbook phase the module is referenced in
+        :return: list of file paths, empty if the module doesn't exist
+        '''
+        files = []
+        for root in self.roots_for_phase(playbook_phase):
+            module_file = self._listing(root).get(module_name)
+            if module_file is not None:
+                files.append(module_file)
+        return files
+
+    def load_activities(self, module_file: str) -> dict:
+        '''
+        Returns a private copy of the activities of a module file
+
+        :param module_file: path of the module file
+        :return: activities of the module
+        :raises KeyError: if the module file doesn't contain an activities key
+        '''
+        stat_result = os.stat(module_file)
+        cached = self._activities_cache.get(module_file)
+        if cached is not None and cached[0] == stat_result.st_mtime_ns and cached[1] == stat_result.st_size:
+            self.hits += 1
+            return copy_yaml_data(cached[2])
+
+        self.misses += 1
+        activities = self.loader(module_file)["activities"]
+        self._activities_cache[module_file] = (stat_result.st_mtime_ns, stat_result.st_size, activities)
+        return copy_yaml_data(activities)
+
+    def prefetch(self, module_file: str):
+        '''
+        Loads a module file into the cache ahead of its conversion, used by the reader threads of the pipeline
+        Safe to call from other threads: the cache is only changed by replacing single entries, and the
+        counters aren't touched. At worst a module is loaded twice if two threads ask for it at the same time.
+
+        :param module_file: path of the module file
+        :return: the cached activities, they must not be modified
+        :raises KeyError: if the module file doesn't contain an activities key
+        '''
+        stat_result = os.stat(module_file)
+        cached = self._activities_cache.get(module_file)
+        if cached is not None and cached[0] == stat_result.st_mtime_ns and cached[1] == stat_result.st_size:
+            return cached[2]
+        activities = self.loader(module_file)["activities"]
+        self._activities_cache[module_file] = (stat_result.st_mtime_ns, stat_result.st_size, activities)
+        return activities
+
+    def invalidate(self):
+        """Forgets the scanned module roots, e.g. after modules have been added or removed"""
+        self._root_listings.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "cached_modules": len(self._activities_cache)}
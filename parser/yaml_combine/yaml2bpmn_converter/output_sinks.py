@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import json
+import time
+
+from .build_manifest import hash_file
+
+# --- Output Sinks
+
+# Every sink receives the BPMN files by name together with a function writing the xml into a text stream,
+# so the xml can be streamed into the target without holding it in memory where the target allows it.
+# tempfile, tarfile and zipfile are imported where they are needed, so importing this module stays cheap
+
+OUTPUT_FORMATS = ["directory", "tar", "zip", "ndjson"]
+
+class OutputSink:
+    """Base class of the output sinks, counts the written and skipped files"""
+    uses_stdout = False  # True if the files are written to stdout, so messages have to go to stderr
+
+    def __init__(self):
+        self.files_written = 0
+        self.files_skipped = 0
+        self.bytes_written = 0
+
+    def write(self, name: str, render, metadata: dict = None) -> bool:
+        '''
+        Writes one file
+
+        :param name: file name, e.g. "contain_malware.bpmn"
+        :param render: function writing the content into a text stream
+        :param metadata: additional information about the file (e.g. the playbook), used by sinks which can store it
+        :return: True if the file has been written, False if it has been skipped because it didn't change
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict[str, int]:
+        return {"files_written": self.files_written, "files_skipped": self.files_skipped,
+                "bytes_written": self.bytes_written}
+
+    def summary(self) -> str:
+        return (f"{self.files_written} file(s) written ({self.bytes_written} bytes), "
+                f"{self.files_skipped} unchanged file(s) skipped")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+_umask = None
+
+def _file_mode() -> int:
+    '''Mode of newly created files, temporary files are created with 0600 and get this mode before the rename'''
+    global _umask
+    if _umask is None:
+        _umask = os.umask(0)
+        os.umask(_umask)
+    return 0o666 & ~_umask
+
+def _render_to_string(render) -> str:
+    buffer = io.StringIO()
+    render(buffer)
+    return buffer.getvalue()
+
+class DirectorySink(OutputSink):
+    """Writes every file into a directory
+
+    Each file is written into a temporary file in the same directory, which replaces the target with a rename,
+    so an interrupted run never leaves a partial file behind. If the target already has the same content
+    (same size and hash), it is kept untouched, so its mtime doesn't change.
+    """
+    def __init__(self, directory: str, skip_identical: bool = True):
+        super().__init__()
+        self.directory = directory
+        self.skip_identical = skip_identical
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def write(self, name: str, render, metadata: dict = None) -> bool:
+        import tempfile
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name)
+        fd, temporary_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=self.directory)
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
+                render(f)
+            size = os.path.getsize(temporary_path)
+            if self.skip_identical and self._is_identical(path, temporary_path, size):
+                os.unlink(temporary_path)
+                self.files_skipped += 1
+                return False
+            os.chmod(temporary_path, _file_mode())
+            os.replace(temporary_path, path)
+        except BaseException:
+            try:
+                os.unlink(temporary_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.files_written += 1
+        self.bytes_written += size
+        return True
+
+    @staticmethod
+    def _is_identical(path: str, temporary_path: str, size: int) -> bool:
+        try:
+            if os.path.getsize(path) != size:
+                return False
+        except OSError:
+            return False  # the file doesn't exist yet
+        return hash_file(path) == hash_file(temporary_path)
+
+class ArchiveSink(OutputSink):
+    """Writes all files into one tar or zip bundle
+
+    The bundle is written into a temporary file, which replaces the bundle when the sink is closed.
+    Tar bundles are compressed with gzip if the path ends with ".tar.gz" or ".tgz".
+    """
+    def __init__(self, path: str, archive_format: str = None):
+        import tempfile
+        super().__init__()
+        self.path = path
+        self.archive_format = archive_format or ("zip" if path.endswith(".zip") else "tar")
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self._temporary_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+        os.close(fd)
+        if self.archive_format == "zip":
+            import zipfile
+            self._archive = zipfile.ZipFile(self._temporary_path, "w", zipfile.ZIP_DEFLATED)
+        else:
+            import tarfile
+            self._archive = tarfile.open(self._temporary_path, "w:gz" if path.endswith((".tar.gz", ".tgz")) else "w")
+
+    def write(self, name: str, render, metadata: dict = None) -> bool:
+        if self.archive_format == "zip":
+            import zipfile
+            member = zipfile.ZipInfo(name, time.localtime()[:6])
+            member.compress_type = zipfile.ZIP_DEFLATED
+            with self._archive.open(member, "w") as stream, io.TextIOWrapper(stream, encoding="utf-8") as f:
+                render(f)
+            size = member.file_size
+        else:
+            import tarfile
+            data = _render_to_string(render).encode("utf-8")
+            member = tarfile.TarInfo(name)
+            member.size = size = len(data)
+            member.mtime = int(time.time())
+            member.mode = 0o644
+            self._archive.addfile(member, io.BytesIO(data))
+        self.files_written += 1
+        self.bytes_written += size
+        return True
+
+    def close(self):
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._archive = None
+        os.chmod(self._temporary_path, _file_mode())
+        os.replace(self._temporary_path, self.path)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._archive is not None:
+            # keep the previous bundle if the run failed
+            self._archive.close()
+            self._archive = None
+            os.unlink(self._temporary_path)
+
+class NdjsonSink(OutputSink):
+    """Writes one json object per line and file ({"file": ..., "content": ..., <metadata>}) to a text stream,
+    stdout by default. Each line is flushed, so other tools can process the files while the run continues"""
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream if stream is not None else sys.stdout
+        self.uses_stdout = self.stream is sys.stdout
+
+    def write(self, name: str, render, metadata: dict = None) -> bool:
+        record = {"file": name, **(metadata or {}), "content": _render_to_string(render)}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self.stream.write(line)
+        self.stream.flush()
+        self.files_written += 1
+        self.bytes_written += len(line.encode("utf-8"))
+        return True
+
+def create_sink(output_format: str, path: str = None) -> OutputSink:
+    '''
+    Creates the sink for an output format
+
+    :param output_format: one of OUTPUT_FORMATS
+    :param path: output directory (directory) or bundle file (tar, zip). Not used by ndjson, which writes to stdout
+    '''
+    if output_format == "directory":
+        return DirectorySink(path)
+    if output_format in ("tar", "zip"):
+        return ArchiveSink(path, output_format)
+    if output_format == "ndjson":
+        return NdjsonSink()
+    raise ValueError(f"unknown output format \"{output_format}\"")
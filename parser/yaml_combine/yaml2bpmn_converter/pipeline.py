@@ -0,0 +1,322 @@
+import time
+import queue
+import logging
+import threading
+
+from .combiner import ConversionResult, convert_playbook, load_yaml_file, write_bpmn_file
+from .module_index import ModuleIndex
+from .yaml_loader import YamlLoader, YamlLoadError
+from .profiling import StageProfiler, NULL_PROFILER
+from .activity_types import get_activitie_object_type
+from .output_sinks import OutputSink
+
+logger = logging.getLogger(__name__)
+
+# --- Conversion Pipeline
+
+# The playbooks pass three stages, which run at the same time and are connected by bounded queues:
+#   read: a pool of threads loads the playbook files and the module files they reference (prefetch)
+#   convert: the calling thread combines and converts one playbook after the other (convert_playbook)
+#   write: a thread streams the BPMN files into the output sink (write_bpmn_file)
+# So reading files overlaps with converting and writing. A full queue blocks the stage in front of it,
+# which bounds the number of playbooks held in memory. Every stage records how long it waited for its
+# input and for room in its output queue, which shows the stage limiting the run.
+
+DEFAULT_PREFETCH_THREADS = 4
+DEFAULT_QUEUE_SIZE = 8
+_POLL_INTERVAL = 0.1  # seconds, blocked stages check this often whether another stage has failed
+_END = object()  # put into a queue after the last item
+
+class PipelineAborted(Exception):
+    """Raised in a stage waiting for a queue, if another stage has failed"""
+
+class StageQueue:
+    """Bounded queue between two stages, which records its depth and how long the stages waited for it"""
+    def __init__(self, name: str, capacity: int, abort: threading.Event):
+        self.name = name
+        self.capacity = capacity
+        self._queue = queue.Queue(capacity)
+        self._abort = abort
+        self.items = 0
+        self.max_depth = 0
+        self._depth_sum = 0  # depth after every put, for the mean depth
+
+    def put(self, item) -> float:
+        '''
+        Adds an item, waits while the queue is full
+
+        :return: seconds waited
+        :raises PipelineAborted: if another stage failed while waiting
+        '''
+        start = time.perf_counter()
+        while True:
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+                break
+            except queue.Full:
+                if self._abort.is_set():
+                    raise PipelineAborted() from None
+        waited = time.perf_counter() - start
+        if item is not _END:
+            depth = self._queue.qsize()
+            self.items += 1
+            self._depth_sum += depth
+            self.max_depth = max(self.max_depth, depth)
+        return waited
+
+    def get(self) -> tuple:
+        '''
+        Removes the next item, waits while the queue is empty
+
+        :return: (item, seconds waited)
+        :raises PipelineAborted: if another stage failed while waiting
+        '''
+        start = time.perf_counter()
+        while True:
+            try:
+                item = self._queue.get(timeout=_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                if self._abort.is_set():
+                    raise PipelineAborted() from None
+        return item, time.perf_counter() - start
+
+    def stats(self) -> dict:
+        return {"capacity": self.capacity, "items": self.items, "max_depth": self.max_depth,
+                "mean_depth": self._depth_sum / self.items if self.items else 0.0}
+
+class StageMetrics:
+    """Time one stage spent working and waiting. Times of several worker threads are added up"""
+    __slots__ = ("name", "workers", "items", "busy_seconds", "input_wait_seconds", "output_wait_seconds", "_lock")
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0  # waiting for the previous stage: the stage is starved
+        self.output_wait_seconds = 0.0  # waiting for room in the output queue: the next stage is behind
+        self._lock = threading.Lock()
+
+    def add_item(self, busy_seconds: float):
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += busy_seconds
+
+    def to_dict(self) -> dict:
+        return {"workers": self.workers, "items": self.items, "busy_seconds": self.busy_seconds,
+                "input_wait_seconds": self.input_wait_seconds, "output_wait_seconds": self.output_wait_seconds}
+
+class _Prefetched:
+    """Playbook loaded by a reader thread"""
+    __slots__ = ("playbook_yaml", "module_files")
+
+    def __init__(self, playbook_yaml: dict = None, module_files: int = 0):
+        self.playbook_yaml = playbook_yaml  # None if the file couldn't be loaded, the conversion reports the error
+        self.module_files = module_files  # number of module files loaded into the module index
+
+class ConversionPipeline:
+    """Converts playbooks with overlapping read, convert and write stages (see the comment above)
+
+    The stages share module index and yaml loader. Module files are loaded into the module index by the
+    reader threads, the conversion takes copies of them as usual. Converting many playbooks in worker
+    processes (convert_playbooks with jobs > 1) isn't combined with the pipeline.
+    """
+    def __init__(self, module_index: ModuleIndex, yaml_loader: YamlLoader, sink: OutputSink,
+                 profiler: StageProfiler = NULL_PROFILER, layout: bool = True,
+                 prefetch_threads: int = DEFAULT_PREFETCH_THREADS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 keep_combined: bool = False, export_formats: tuple[str, ...] = ()):
+        '''
+        :param sink: receives the BPMN files
+        :param profiler: collects the stages of the conversions, the writer stage is merged into it at the end
+        :param layout: add the diagram (BPMNDI shapes and edges) to the BPMN files
+        :param prefetch_threads: number of reader threads
+        :param queue_size: capacity of the queues between the stages
+        :param keep_combined: add the combined playbooks to the results, see convert_playbook
+        :param export_formats: formats written besides the BPMN files, rendered by the write stage
+        '''
+        self.module_index = module_index
+        self.yaml_loader = yaml_loader
+        self.sink = sink
+        self.profiler = profiler
+        self.layout = layout
+        self.prefetch_threads = max(1, prefetch_threads)
+        self.queue_size = max(1, queue_size)
+        self.keep_combined = keep_combined
+        self.export_formats = export_formats
+        self.stages: dict[str, StageMetrics] = {}
+        self.queues: dict[str, StageQueue] = {}
+        self.seconds = 0.0
+
+    # --- Read Stage
+
+    def _prefetch(self, playbook: tuple[str, str]) -> _Prefetched:
+        '''Loads a playbook file and all module files it references, also within modules, up to the maximum depth'''
+        start = time.perf_counter()
+        playbook_phase, playbook_file = playbook
+        try:
+            playbook_yaml = load_yaml_file(playbook_file, self.yaml_loader)
+        except YamlLoadError:
+            self.stages["read"].add_item(time.perf_counter() - start)
+            return _Prefetched()
+
+        loaded_files = set()
+        # activities blocks to search for module references: (activities, number of enclosing modules)
+        blocks = [(playbook_yaml.get("activities"), 0)] if isinstance(playbook_yaml, dict) else []
+        while blocks:
+            activities, depth = blocks.pop()
+            if not isinstance(activities, dict):
+                continue
+            for activity, activity_obj in activities.items():
+                object_type = get_activitie_object_type(activity_obj)
+                if object_type == "subprocess":
+                    blocks.append((activity_obj.get("activities"), depth))
+                elif object_type == "task" and depth < self.module_index.max_depth:
+                    for module_file in self.module_index.find_module_files(activity, playbook_phase):
+                        if module_file in loaded_files:
+                            break
+                        loaded_files.add(module_file)
+                        try:
+                            blocks.append((self.module_index.prefetch(module_file), depth + 1))
+                            break
+                        except (OSError, KeyError, TypeError, YamlLoadError):
+                            continue  # the conversion tries the next module file and reports the problem
+        self.stages["read"].add_item(time.perf_counter() - start)
+        return _Prefetched(playbook_yaml, len(loaded_files))
+
+    def _feed(self, playbooks: list[tuple[str, str]], executor, read_queue: StageQueue):
+        stage = self.stages["read"]
+        for playbook in playbooks:
+            # the queue holds the pending reads in the order of the playbooks, a full queue stops further reads
+            stage.output_wait_seconds += read_queue.put((playbook, executor.submit(self._prefetch, playbook)))
+        read_queue.put(_END)
+
+    # --- Convert Stage
+
+    def _convert(self, read_queue: StageQueue, write_queue: StageQueue):
+        stage = self.stages["convert"]
+        while True:
+            item, waited = read_queue.get()
+            if item is _END:
+                stage.input_wait_seconds += waited
+                break
+            (playbook_phase, playbook_file), future = item
+            wait_start = time.perf_counter()
+            prefetched = future.result()
+            stage.input_wait_seconds += waited + time.perf_counter() - wait_start
+            start = time.perf_counter()
+            result = convert_playbook(playbook_phase, playbook_file, self.module_index, self.yaml_loader,
+                                      render_xml=False, profiler=self.profiler, layout=self.layout,
+                                      playbook_yaml=prefetched.playbook_yaml, keep_combined=self.keep_combined,
+                                      export_formats=self.export_formats)
+            if self.profiler.enabled:
+                self.profiler.count(playbook_file, "prefetched_module_files", prefetched.module_files)
+            stage.add_item(time.perf_counter() - start)
+            stage.output_wait_seconds += write_queue.put(result)
+        write_queue.put(_END)
+
+    # --- Write Stage
+
+    def _write(self, write_queue: StageQueue, profiler: StageProfiler, on_result, failed_results: list):
+        stage = self.stages["write"]
+        while True:
+            result, waited = write_queue.get()
+            stage.input_wait_seconds += waited
+            if result is _END:
+                return
+            start = time.perf_counter()
+            if result.error:
+                failed_results.append(result)
+            else:
+                write_bpmn_file(result, self.sink, profiler)
+            if on_result is not None:
+                on_result(result)
+            stage.add_item(time.perf_counter() - start)
+
+    def run(self, playbooks: list[tuple[str, str]], on_result=None) -> list[ConversionResult]:
+        '''
+        Converts the playbooks and writes their BPMN files into the sink
+
+        :param playbooks: list of (playbook_phase, playbook_file) tuples
+        :param on_result: function called with every ConversionResult after its file has been written,
+            in the order of the playbooks. It is called in the writer thread
+        :return: results of the failed conversions
+        :raises: the first exception raised in one of the stages, the other stages are stopped
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        start = time.perf_counter()
+        abort = threading.Event()
+        self.stages = {"read": StageMetrics("read", self.prefetch_threads), "convert": StageMetrics("convert"),
+                       "write": StageMetrics("write")}
+        self.queues = {"read": StageQueue("read", self.queue_size, abort),
+                       "write": StageQueue("write", self.queue_size, abort)}
+        writer_profiler = StageProfiler() if self.profiler.enabled else NULL_PROFILER
+        failed_results = []
+        errors = []
+
+        def run_stage(function, *args):
+            try:
+                function(*args)
+            except PipelineAborted:
+                pass
+            except BaseException as exc:
+                errors.append(exc)
+                abort.set()
+
+        executor = ThreadPoolExecutor(max_workers=self.prefetch_threads, thread_name_prefix="pipeline-read")
+        threads = [
+            threading.Thread(target=run_stage, args=(self._feed, playbooks, executor, self.queues["read"]),
+                             name="pipeline-feed", daemon=True),
+            threading.Thread(target=run_stage, args=(self._write, self.queues["write"], writer_profiler, on_result,
+                                                     failed_results),
+                             name="pipeline-write", daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            run_stage(self._convert, self.queues["read"], self.queues["write"])
+            # the writer finishes the files already converted, unless a stage has failed
+            threads[1].join()
+        finally:
+            abort.set()  # stops the other stages, if this thread has been interrupted (e.g. by Ctrl+C)
+            executor.shutdown(wait=True, cancel_futures=True)
+            for thread in threads:
+                thread.join()
+            self.profiler.merge(writer_profiler.to_dict())
+            self.seconds = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+        logger.info("[+] Pipeline: %s", self.bottleneck())
+        return failed_results
+
+    # --- Metrics
+
+    def bottleneck(self) -> str:
+        '''Names the stage limiting the run, judged by how long the conversion waited for its neighbours'''
+        convert = self.stages.get("convert")
+        if convert is None or not convert.items:
+            return "nothing converted"
+        if max(convert.input_wait_seconds, convert.output_wait_seconds) < 0.1 * convert.busy_seconds:
+            return "CPU-bound (converting)"
+        if convert.input_wait_seconds >= convert.output_wait_seconds:
+            return "I/O-bound (reading playbooks and modules)"
+        return "I/O-bound (writing BPMN files)"
+
+    def stats(self) -> dict:
+        return {"seconds": self.seconds, "bottleneck": self.bottleneck(),
+                "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+                "queues": {name: stage_queue.stats() for name, stage_queue in self.queues.items()}}
+
+    def summary(self) -> str:
+        lines = [f"{'pipeline stage':<16} {'workers':>7} {'items':>6} {'busy s':>9} {'input wait s':>13} "
+                 f"{'output wait s':>14}"]
+        for name, stage in self.stages.items():
+            lines.append(f"{name:<16} {stage.workers:>7} {stage.items:>6} {stage.busy_seconds:>9.4f} "
+                         f"{stage.input_wait_seconds:>13.4f} {stage.output_wait_seconds:>14.4f}")
+        lines.append(f"{'queue':<16} {'capacity':>8} {'max depth':>10} {'mean depth':>11}")
+        for name, stage_queue in self.queues.items():
+            queue_stats = stage_queue.stats()
+            lines.append(f"{name:<16} {queue_stats['capacity']:>8} {queue_stats['max_depth']:>10} "
+                         f"{queue_stats['mean_depth']:>11.2f}")
+        lines.append(f"{self.seconds:.4f} s, {self.bottleneck()}")
+        return "\n".join(lines)
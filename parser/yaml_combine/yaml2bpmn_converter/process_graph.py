@@ -0,0 +1,396 @@
+"""Graph queries on processes and subprocesses, run from parser/yaml_combine:
+
+    python -m yaml2bpmn_converter.process_graph BPMN_FILE [BPMN_FILE ...] [--limit N]
+
+Every container (process or subprocess) gets an adjacency index of its direct elements, see
+BPMNProcessTemplateMixin.graph. Sequence flows never cross containers, so each container is a graph of its own.
+The index numbers the elements in model order and stores successors and predecessors as CSR arrays
+(compressed sparse rows: the neighbours of all nodes in one int array, plus one offset per node),
+so every query is a linear walk over integer arrays. All walks use explicit stacks, no recursion.
+"""
+import sys
+import argparse
+from array import array
+
+from .bpmn_object_models import *
+from .validator import ValidationIssue, WARNING
+
+# --- Process Graph
+
+_GATEWAY_CLASSES = (BPMNExclusiveGateway, BPMNParallelGateway, BPMNInclusiveGateway)
+
+def _csr(node_count: int, keys: array, values: array) -> tuple[array, array]:
+    '''
+    Groups the values by their key with a counting sort, the values of a key keep their order
+
+    :return: (offsets, values): the values of key k are values[offsets[k]:offsets[k + 1]]
+    '''
+    offsets = array("i", bytes(4 * (node_count + 1)))
+    for key in keys:
+        offsets[key + 1] += 1
+    for node in range(node_count):
+        offsets[node + 1] += offsets[node]
+    positions = offsets[:-1]
+    grouped = array("i", bytes(4 * len(values)))
+    for key, value in zip(keys, values):
+        grouped[positions[key]] = value
+        positions[key] += 1
+    return offsets, grouped
+
+class ProcessGraph:
+    """Adjacency index of the direct elements of a process or subprocess
+
+    Nodes are the positions of the elements in container.flow_elements. Flows whose source or target isn't
+    a direct element of the container are ignored. The start nodes are the start event of the container,
+    or the elements without incoming flows if it has none. The end nodes are the end events of the container,
+    or the elements without outgoing flows if it has none.
+    """
+    __slots__ = ("elements", "index", "successor_offsets", "successor_targets", "predecessor_offsets",
+                 "predecessor_sources", "start_nodes", "end_nodes", "_components")
+
+    def __init__(self, container: BPMNProcess | BPMNSubProcess):
+        self.elements: list[BPMNFlowElement] = list(container.flow_elements)
+        self.index: dict[str, int] = {element.id: node for node, element in enumerate(self.elements)}
+        sources, targets = array("i"), array("i")
+        for flow in container.sequence_flows:
+            source = self.index.get(flow.source_ref)
+            target = self.index.get(flow.target_ref)
+            if source is not None and target is not None:
+                sources.append(source)
+                targets.append(target)
+        node_count = len(self.elements)
+        self.successor_offsets, self.successor_targets = _csr(node_count, sources, targets)
+        self.predecessor_offsets, self.predecessor_sources = _csr(node_count, targets, sources)
+
+        start_node = self.index.get(container.start_event.id) if container.start_event is not None else None
+        self.start_nodes: list[int] = [start_node] if start_node is not None else self.sources()
+        self.end_nodes: list[int] = [node for node, element in enumerate(self.elements)
+                                     if isinstance(element, BPMNEndEvent)] or self.sinks()
+        self._components: list[list[int]] = None
+
+    def __len__(self):
+        return len(self.elements)
+
+    def successors(self, node: int) -> array:
+        return self.successor_targets[self.successor_offsets[node]:self.successor_offsets[node + 1]]
+
+    def predecessors(self, node: int) -> array:
+        return self.predecessor_sources[self.predecessor_offsets[node]:self.predecessor_offsets[node + 1]]
+
+    def sources(self) -> list[int]:
+        """Nodes without incoming flows"""
+        offsets = self.predecessor_offsets
+        return [node for node in range(len(self.elements)) if offsets[node] == offsets[node + 1]]
+
+    def sinks(self) -> list[int]:
+        """Nodes without outgoing flows"""
+        offsets = self.successor_offsets
+        return [node for node in range(len(self.elements)) if offsets[node] == offsets[node + 1]]
+
+    def reachable(self, roots: list[int] = None, reverse: bool = False) -> bytearray:
+        '''
+        :param roots: nodes to start from, defaults to the start nodes
+        :param reverse: follow the flows backwards, e.g. to find the nodes which can reach the roots
+        :return: one byte per node, 1 if it's reachable from the roots
+        '''
+        offsets, neighbours = ((self.predecessor_offsets, self.predecessor_sources) if reverse
+                               else (self.successor_offsets, self.successor_targets))
+        reached = bytearray(len(self.elements))
+        stack = list(self.start_nodes if roots is None else roots)
+        for node in stack:
+            reached[node] = 1
+        while stack:
+            node = stack.pop()
+            for position in range(offsets[node], offsets[node + 1]):
+                neighbour = neighbours[position]
+                if not reached[neighbour]:
+                    reached[neighbour] = 1
+                    stack.append(neighbour)
+        return reached
+
+    def unreachable_elements(self) -> list[BPMNFlowElement]:
+        """Elements which can't be reached from the start"""
+        reached = self.reachable()
+        return [element for node, element in enumerate(self.elements) if not reached[node]]
+
+    def sinks_without_end_event(self) -> list[BPMNFlowElement]:
+        """Elements without outgoing flows, which aren't end events"""
+        return [self.elements[node] for node in self.sinks() if not isinstance(self.elements[node], BPMNEndEvent)]
+
+    def dead_ends(self) -> list[BPMNFlowElement]:
+        """Elements from which no end node can be reached, e.g. loops without an exit"""
+        completes = self.reachable(self.end_nodes, reverse=True)
+        return [element for node, element in enumerate(self.elements) if not completes[node]]
+
+    def dead_end_entries(self) -> list[BPMNFlowElement]:
+        """Dead ends entered from an element which can still reach an end node (or from the start),
+        i.e. one element per way into a region without exit instead of all its elements"""
+        completes = self.reachable(self.end_nodes, reverse=True)
+        entries = []
+        for node in self.start_nodes:
+            if not completes[node]:
+                entries.append(node)
+        for node in range(len(self.elements)):
+            if completes[node]:
+                for successor in self.successors(node):
+                    if not completes[successor]:
+                        entries.append(successor)
+        return [self.elements[node] for node in sorted(set(entries))]
+
+    def strongly_connected_components(self) -> list[list[int]]:
+        '''
+        Tarjan's algorithm with an explicit stack, computed once per graph
+
+        :return: components as lists of nodes, in reverse topological order (a component comes before
+            the components it can be reached from)
+        '''
+        if self._components is not None:
+            return self._components
+        offsets, targets = self.successor_offsets, self.successor_targets
+        node_count = len(self.elements)
+        order = [-1] * node_count  # discovery number, -1: not visited
+        low = [0] * node_count
+        on_stack = bytearray(node_count)
+        component_stack = []
+        components = []
+        counter = 0
+        for root in range(node_count):
+            if order[root] != -1:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            component_stack.append(root)
+            on_stack[root] = 1
+            search = [(root, offsets[root])]  # (node, position of the next successor)
+            while search:
+                node, position = search[-1]
+                if position < offsets[node + 1]:
+                    search[-1] = (node, position + 1)
+                    target = targets[position]
+                    if order[target] == -1:
+                        order[target] = low[target] = counter
+                        counter += 1
+                        component_stack.append(target)
+                        on_stack[target] = 1
+                        search.append((target, offsets[target]))
+                    elif on_stack[target] and order[target] < low[node]:
+                        low[node] = order[target]
+                    continue
+                search.pop()
+                if search and low[node] < low[search[-1][0]]:
+                    low[search[-1][0]] = low[node]
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = component_stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+        self._components = components
+        return components
+
+    def cycles(self) -> list[list[BPMNFlowElement]]:
+        """Strongly connected components which contain a cycle (more than one element, or a flow to itself)"""
+        cycles = []
+        for component in self.strongly_connected_components():
+            node = component[0]
+            if len(component) > 1 or node in self.successors(node):
+                cycles.append([self.elements[member] for member in sorted(component)])
+        return cycles
+
+    def longest_path_depth(self) -> int:
+        '''
+        Number of flows on the longest path from the start, a cycle counts as a single step
+        (the path runs through the graph of the strongly connected components, which has no cycles)
+        '''
+        components = self.strongly_connected_components()
+        component_of = [0] * len(self.elements)
+        for number, component in enumerate(components):
+            for node in component:
+                component_of[node] = number
+        reached = self.reachable()
+        depth = [-1] * len(components)  # -1: not reachable
+        for node in self.start_nodes:
+            depth[component_of[node]] = 0
+        offsets, targets = self.successor_offsets, self.successor_targets
+        deepest = 0
+        # reverse topological order reversed: every component is finished before its successors
+        for number in range(len(components) - 1, -1, -1):
+            if depth[number] < 0:
+                continue
+            deepest = max(deepest, depth[number])
+            for node in components[number]:
+                for position in range(offsets[node], offsets[node + 1]):
+                    target_component = component_of[targets[position]]
+                    if target_component != number and reached[targets[position]]:
+                        depth[target_component] = max(depth[target_component], depth[number] + 1)
+        return deepest
+
+    def immediate_post_dominators(self) -> list[int | None]:
+        '''
+        Post-dominators with the iterative algorithm of Cooper, Harvey and Kennedy, on the reversed graph
+        with a virtual exit node behind all end nodes
+
+        :return: per node the nearest node every path to an end passes through, len(self) for the virtual exit,
+            None for nodes which can't reach an end
+        '''
+        node_count = len(self.elements)
+        exit_node = node_count
+        is_end = bytearray(node_count)
+        for node in self.end_nodes:
+            is_end[node] = 1
+        # postorder of a depth first search from the exit, following the flows backwards
+        postorder = []
+        visited = bytearray(node_count + 1)
+        visited[exit_node] = 1
+        search = [(exit_node, iter(self.end_nodes))]
+        while search:
+            node, remaining = search[-1]
+            for predecessor in remaining:
+                if not visited[predecessor]:
+                    visited[predecessor] = 1
+                    search.append((predecessor, iter(self.predecessors(predecessor))))
+                    break
+            else:
+                postorder.append(node)
+                search.pop()
+        number = [-1] * (node_count + 1)
+        for position, node in enumerate(postorder):
+            number[node] = position
+
+        dominator = [None] * (node_count + 1)
+        dominator[exit_node] = exit_node
+        changed = True
+        while changed:
+            changed = False
+            for node in reversed(postorder[:-1]):  # reverse postorder without the exit
+                new_dominator = exit_node if is_end[node] else None
+                for successor in self.successors(node):
+                    if dominator[successor] is None:
+                        continue
+                    if new_dominator is None:
+                        new_dominator = successor
+                        continue
+                    # intersect: walk both up the dominator tree until they meet
+                    first, second = successor, new_dominator
+                    while first != second:
+                        while number[first] < number[second]:
+                            first = dominator[first]
+                        while number[second] < number[first]:
+                            second = dominator[second]
+                    new_dominator = first
+                if dominator[node] != new_dominator:
+                    dominator[node] = new_dominator
+                    changed = True
+        return dominator[:node_count]
+
+    def unjoined_branches(self) -> list[BPMNFlowElement]:
+        """Gateways with several outgoing flows, whose branches don't meet again before the end of the container
+        (their nearest post-dominator is the virtual exit). Branches which loop back don't count."""
+        dominators = self.immediate_post_dominators()
+        exit_node = len(self.elements)
+        gateways = []
+        for node, element in enumerate(self.elements):
+            if (isinstance(element, _GATEWAY_CLASSES) and dominators[node] == exit_node
+                    and len(set(self.successors(node))) > 1):
+                gateways.append(element)
+        return gateways
+
+# --- Conversion Warnings
+
+UNREACHABLE = "unreachable"
+DEAD_END = "dead_end"
+MISSING_END_EVENT = "missing_end_event"
+UNJOINED_BRANCHES = "unjoined_branches"
+CYCLE = "cycle"
+
+GRAPH_ISSUE_KINDS = (UNREACHABLE, DEAD_END, MISSING_END_EVENT, UNJOINED_BRANCHES, CYCLE)
+
+def _containers(bpmn_process: BPMNProcess):
+    '''Yields (container, path of container ids) for the process and all subprocesses, breadth first'''
+    containers = [(bpmn_process, [])]
+    for container, path in containers:
+        yield container, path
+        for element in container.flow_elements:
+            if isinstance(element, BPMNSubProcess):
+                containers.append((element, path + [element.id]))
+
+def find_graph_issues(bpmn_process: BPMNProcess, playbook_file: str, original_names: dict = None,
+                      kinds=(UNREACHABLE, DEAD_END, MISSING_END_EVENT, UNJOINED_BRANCHES)) -> list[ValidationIssue]:
+    '''
+    Runs the graph queries on the process and all subprocesses and reports the findings as warnings
+
+    :param bpmn_process: converted process
+    :param playbook_file: playbook file, used in the issues
+    :param original_names: numbered activity name -> original name (see add_counter_to_activities),
+        used for the activity paths of the issues
+    :param kinds: kinds of issues to look for, see GRAPH_ISSUE_KINDS. Cycles are no problem as such
+        (e.g. retries), so they are only reported if requested
+    :return: list of ValidationIssue, the containers in breadth first order
+    '''
+    original_names = original_names or {}
+    issues = []
+
+    def report(path, element, kind, message):
+        activity_path = [original_names.get(name, name) for name in path + [element.id]]
+        issues.append(ValidationIssue(playbook_file, activity_path, kind, WARNING, message))
+
+    for container, path in _containers(bpmn_process):
+        if not container.flow_elements:
+            continue
+        graph = container.graph()
+        if UNREACHABLE in kinds:
+            for element in graph.unreachable_elements():
+                report(path, element, UNREACHABLE, "the element can't be reached from the start of its process")
+        if DEAD_END in kinds:
+            for element in graph.dead_end_entries():
+                report(path, element, DEAD_END, "no end event can be reached from the element "
+                                                "(or from the elements after it), e.g. a loop without exit")
+        if MISSING_END_EVENT in kinds:
+            for element in graph.sinks_without_end_event():
+                report(path, element, MISSING_END_EVENT, "the element has no outgoing flow and isn't an end event")
+        if UNJOINED_BRANCHES in kinds:
+            for element in graph.unjoined_branches():
+                report(path, element, UNJOINED_BRANCHES, "the branches of the gateway never join again")
+        if CYCLE in kinds:
+            for cycle in graph.cycles():
+                names = ", ".join(original_names.get(member.id, member.id) for member in cycle[:5])
+                more = f" and {len(cycle) - 5} more" if len(cycle) > 5 else ""
+                report(path, cycle[0], CYCLE, f"cycle of {len(cycle)} element(s): {names}{more}")
+    return issues
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m yaml2bpmn_converter.process_graph", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("bpmn_files", nargs="+", metavar="BPMN_FILE")
+    parser.add_argument("--limit", type=int, default=20, metavar="N",
+                        help="maximum number of findings printed per process (default: 20)")
+    arguments = parser.parse_args(argv)
+    from xml.etree.ElementTree import ParseError
+    from .bpmn_importer import read_bpmn_processes
+
+    failed = 0
+    for bpmn_file in arguments.bpmn_files:
+        try:
+            processes = read_bpmn_processes(bpmn_file)
+        except (OSError, ParseError) as exc:
+            print(f"failed to read {bpmn_file}: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+        for bpmn_process in processes:
+            containers = list(_containers(bpmn_process))
+            elements = sum(len(container.flow_elements) for container, path in containers)
+            depth = bpmn_process.graph().longest_path_depth() if bpmn_process.flow_elements else 0
+            print(f"{bpmn_file}: {bpmn_process.id}: {elements} elements in {len(containers)} container(s), "
+                  f"longest path {depth} flow(s)")
+            issues = find_graph_issues(bpmn_process, bpmn_file, kinds=GRAPH_ISSUE_KINDS)
+            for issue in issues[:arguments.limit]:
+                print(f"  {issue.kind}: {issue.location}: {issue.message}")
+            if len(issues) > arguments.limit:
+                print(f"  ... {len(issues) - arguments.limit} more")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import time
+import contextlib
+
+# --- Stage Profiling
+
+class StageProfiler:
+    """Collects wall time and call counts per conversion stage, in total and per playbook,
+    together with element counts of every playbook"""
+    enabled = True
+
+    def __init__(self):
+        self.stages: dict[str, dict] = {}  # stage -> {"seconds": float, "calls": int}
+        self.playbooks: dict[str, dict] = {}  # playbook -> {"stages": {...}, "counts": {...}}
+
+    def _playbook(self, playbook: str) -> dict:
+        entry = self.playbooks.get(playbook)
+        if entry is None:
+            entry = self.playbooks[playbook] = {"stages": {}, "counts": {}}
+        return entry
+
+    @staticmethod
+    def _add_time(stages: dict, stage: str, seconds: float, calls: int = 1):
+        entry = stages.get(stage)
+        if entry is None:
+            stages[stage] = {"seconds": seconds, "calls": calls}
+        else:
+            entry["seconds"] += seconds
+            entry["calls"] += calls
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, playbook: str = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._add_time(self.stages, stage, seconds)
+            if playbook is not None:
+                self._add_time(self._playbook(playbook)["stages"], stage, seconds)
+
+    def count(self, playbook: str, name: str, value: int):
+        counts = self._playbook(playbook)["counts"]
+        counts[name] = counts.get(name, 0) + value
+
+    def merge(self, metrics: dict):
+        """Adds the metrics of another profiler (e.g. of a worker process, see to_dict)"""
+        for stage, entry in metrics["stages"].items():
+            self._add_time(self.stages, stage, entry["seconds"], entry["calls"])
+        for playbook, playbook_metrics in metrics["playbooks"].items():
+            target = self._playbook(playbook)
+            for stage, entry in playbook_metrics["stages"].items():
+                self._add_time(target["stages"], stage, entry["seconds"], entry["calls"])
+            for name, value in playbook_metrics["counts"].items():
+                target["counts"][name] = target["counts"].get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        return {"stages": self.stages, "playbooks": self.playbooks}
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<40} {'calls':>7} {'seconds':>10}"]
+        for stage, entry in sorted(self.stages.items(), key=lambda x: -x[1]["seconds"]):
+            lines.append(f"{stage:<40} {entry['calls']:>7} {entry['seconds']:>10.4f}")
+        return "\n".join(lines)
+
+class NullProfiler:
+    """Profiler used if profiling is disabled, its methods do nothing"""
+    enabled = False
+    _null_context = contextlib.nullcontext()
+
+    def stage(self, stage: str, playbook: str = None):
+        return self._null_context
+
+    def count(self, playbook: str, name: str, value: int):
+        pass
+
+    def merge(self, metrics: dict):
+        pass
+
+    def to_dict(self) -> dict:
+        return {"stages": {}, "playbooks": {}}
+
+NULL_PROFILER = NullProfiler()
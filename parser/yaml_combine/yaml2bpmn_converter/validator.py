@@ -0,0 +1,172 @@
+from .activity_types import ACTIVITY_TYPES
+from .module_expansion import CYCLE, DEPTH_LIMIT, INVALID_MODULE
+
+# --- Playbook Validation
+
+ERROR = "error"  # the playbook can't be converted
+WARNING = "warning"  # the playbook can be converted, but the diagram probably isn't what the author meant
+
+class ValidationIssue:
+    """Problem found in a combined playbook, located by the path of activity names from the top level"""
+    def __init__(self, playbook_file: str, activity_path: list[str], kind: str, severity: str, message: str,
+                 module_file: str = None):
+        self.playbook_file = playbook_file
+        self.activity_path = activity_path
+        self.kind = kind  # e.g. "dangling_target", see validate_playbook
+        self.severity = severity
+        self.message = message
+        self.module_file = module_file  # module file the activity has been inserted from, None for the playbook itself
+
+    @property
+    def location(self) -> str:
+        return "/".join(self.activity_path) or "<process>"
+
+    def __str__(self):
+        source = f" (module {self.module_file})" if self.module_file else ""
+        return f"{self.playbook_file}: {self.severity}: {self.location}{source}: {self.message}"
+
+def _goto_targets(activity: dict) -> tuple[list[str], list[str]]:
+    '''
+    Returns the targets of an activity the parser creates sequence flows for, and problems of its goto value
+
+    :return: (targets, messages of ignored goto parts)
+    '''
+    goto = activity.get("goto")
+    if goto is None:
+        return [], []
+    if isinstance(goto, str):
+        return [goto], []
+    if not isinstance(goto, list):
+        return [], [f"goto must be an activity name or a list of branches, not {type(goto).__name__}"]
+    activity_type = activity.get("type")
+    bpmn_type = ACTIVITY_TYPES.get(activity_type) if isinstance(activity_type, str) else None
+    if bpmn_type is None or bpmn_type.object_type != "gateway":
+        return [], ["goto list is only supported on gateways (xgw, pgw, igw), the branches are ignored"]
+    # branches of parallel gateways don't need a condition, they can also be plain activity names
+    conditional = activity_type != "pgw"
+    targets, problems = [], []
+    for number, branch in enumerate(goto, 1):
+        if isinstance(branch, str) and not conditional:
+            targets.append(branch)
+        elif not isinstance(branch, dict):
+            problems.append(f"branch {number} has no \"if\" and \"then\", it is ignored")
+        elif not branch.get("then"):
+            problems.append(f"branch {number} has no \"then\" target, it is ignored")
+        elif conditional and not branch.get("if"):
+            problems.append(f"branch {number} to \"{branch['then']}\" has no \"if\" condition, it is ignored")
+        else:
+            targets.append(branch["then"])
+    return targets, problems
+
+def _unreachable(activities: dict, successors: dict[str, list[str]]) -> list[str]:
+    '''
+    Returns the activities of a block, which can't be reached from its start event
+    The start event is connected like in yaml_parser: to all activities without incoming flows,
+    or to the first activity if every activity has incoming flows
+    '''
+    has_incoming = {target for targets in successors.values() for target in targets}
+    reached = [name for name in activities if name not in has_incoming] or [next(iter(activities))]
+    seen = set(reached)
+    while reached:
+        for target in successors.get(reached.pop(), ()):
+            if target not in seen:
+                seen.add(target)
+                reached.append(target)
+    return [name for name in activities if name not in seen]
+
+# status of a skipped module expansion -> (issue kind, message)
+_EXPANSION_ISSUES = {
+    CYCLE: ("module_cycle", "module cycle {chain}, the task is not expanded"),
+    DEPTH_LIMIT: ("module_depth", "module chain {chain} is nested deeper than allowed, the task is not expanded"),
+    INVALID_MODULE: ("invalid_module", "module file {module_file} has no activities, it is not inserted"),
+}
+
+def validate_playbook(playbook_yaml: dict, playbook_file: str, module_lookups: dict = None,
+                      module_expansions: list = None) -> list[ValidationIssue]:
+    '''
+    Validates a combined playbook (after process_playbook, before the activities are numbered) in one pass
+    Every activities block is the symbol table of its scope: goto/then targets are resolved only in the
+    block of the activity, like the parser does. All problems are collected instead of stopping at the first one.
+
+    Errors: missing process name, activities which aren't mappings, goto/then targets which don't exist in the block
+    Warnings: missing or unknown types, ignored goto parts, unreachable activities, empty subprocesses,
+    modules which haven't been inserted (cycles, nesting too deep, module files without activities)
+
+    :param playbook_yaml: combined playbook data structure
+    :param playbook_file: playbook file, used in the issues
+    :param module_lookups: module name -> candidate module files, as filled by process_playbook.
+        Used to report the module file an issue comes from
+    :param module_expansions: expansion trace returned by process_playbook
+    :return: list of ValidationIssue, the skipped modules first and then in the order of the activities
+    '''
+    issues = []
+    module_lookups = module_lookups or {}
+
+    def report(path, kind, severity, message, module_file):
+        issues.append(ValidationIssue(playbook_file, path, kind, severity, message, module_file))
+
+    for expansion in module_expansions or ():
+        if expansion.status in _EXPANSION_ISSUES:
+            kind, message = _EXPANSION_ISSUES[expansion.status]
+            report(expansion.activity_path, kind, WARNING,
+                   message.format(chain=" -> ".join(expansion.chain), module_file=expansion.module_file),
+                   expansion.parent_module_file)
+
+    if not isinstance(playbook_yaml, dict):
+        report([], "invalid_playbook", ERROR, "the playbook is not a mapping", None)
+        return issues
+    if not isinstance(playbook_yaml.get("process"), str):
+        report([], "invalid_playbook", ERROR, "the playbook has no process name", None)
+    if not isinstance(playbook_yaml.get("activities"), dict):
+        report([], "invalid_playbook", ERROR, "the playbook has no activities", None)
+        return issues
+
+    # blocks still to check: (activities block, path of the owning activity, module file of the block)
+    blocks = [(playbook_yaml["activities"], [], None)]
+    while blocks:
+        activities, owner_path, module_file = blocks.pop()
+        successors = {}
+        inner_blocks = []
+        for name, activity in activities.items():
+            path = owner_path + [name]
+            if not isinstance(activity, dict):
+                report(path, "invalid_activity", ERROR, "the activity is not a mapping", module_file)
+                continue
+
+            activity_type = activity.get("type")
+            if activity_type is None:
+                report(path, "unknown_type", WARNING, "the activity has no type, it is converted into a task", module_file)
+            elif not isinstance(activity_type, str) or activity_type not in ACTIVITY_TYPES:
+                report(path, "unknown_type", WARNING, f"unknown type \"{activity_type}\", it is converted into a task",
+                       module_file)
+
+            targets, problems = _goto_targets(activity)
+            for problem in problems:
+                report(path, "ignored_goto", WARNING, problem, module_file)
+            successors[name] = []
+            for target in targets:
+                if isinstance(target, str) and target in activities:
+                    successors[name].append(target)
+                else:
+                    report(path, "dangling_target", ERROR, f"goto target \"{target}\" doesn't exist on this level",
+                           module_file)
+
+            if activity_type == "sub":
+                inner_activities = activity.get("activities")
+                # modules are inserted into tasks, the first candidate file of the task name is the inserted one
+                inner_module_file = module_lookups[name][0] if module_lookups.get(name) else module_file
+                if not inner_activities:
+                    report(path, "empty_subprocess", WARNING, "the subprocess has no activities", module_file)
+                elif not isinstance(inner_activities, dict):
+                    report(path, "invalid_activity", ERROR, "the activities of the subprocess are not a mapping",
+                           module_file)
+                else:
+                    inner_blocks.append((inner_activities, path, inner_module_file))
+
+        if successors:
+            for name in _unreachable(activities, successors):
+                report(owner_path + [name], "unreachable", WARNING,
+                       "the activity can't be reached from the start of its process", module_file)
+        blocks.extend(reversed(inner_blocks))  # the inner blocks are checked in the order of the playbook
+
+    return issues
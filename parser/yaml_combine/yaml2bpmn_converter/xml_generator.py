@@ -1,5 +1,30 @@
+import io
+import re
 import xml.etree.ElementTree as ET
+# escaping functions of ElementTree, used by the streaming writer to produce identical output
+from xml.etree.ElementTree import _escape_attrib, _escape_cdata
 from .bpmn_object_models import *
+from .layout import DiagramLayout
+from .activity_types import element_type
+from .fragments import fragment_id_map
+from .exporters import ModelVisitor, walk_container, walk_process
+
+# bpmn
+BPMN_NAMESPACE = "http://www.omg.org/spec/BPMN/20100524/MODEL"
+# bpmn diagram interchange
+BPMN_DI_NAMESPACE = "http://www.omg.org/spec/BPMN/20100524/DI"
+# diagram common types
+DC_NAMESPACE = "http://www.omg.org/spec/DD/20100524/DC"
+# diagram interchange
+DI_NAMESPACE = "http://www.omg.org/spec/DD/20100524/DI"
+# xml schema instance
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+# target namespace (bpmn)
+TARGET_NAMESPACE = "http://bpmn.io/schema/bpmn"
+
+STREAM_CHUNK_SIZE = 64 * 1024  # number of characters collected before they are written to the stream
+DIAGRAM_ID = "BPMNDiagram_1"
+PLANE_ID = "BPMNPlane_1"
 
 def _indent_xml(elem, level=0):
     indent = "\n" + level*"  "
@@ -25,37 +50,19 @@ def _build_xml_for_container(
             "id": task_or_event.id,
             "name": task_or_event.name
         }
-        task_or_event_xml_element: ET.Element = None
-        element_tag: str = ""
-
-        # handle different task/event types
-        if isinstance(task_or_event, BPMNStartEvent): element_tag = "startEvent"
-        elif isinstance(task_or_event, BPMNEndEvent): element_tag = "endEvent"
-        elif isinstance(task_or_event, BPMNUserTask): element_tag = "userTask"
-        elif isinstance(task_or_event, BPMNSendTask): element_tag = "sendTask"
-        elif isinstance(task_or_event, BPMNManualTask): element_tag = "manualTask"
-        elif isinstance(task_or_event, BPMNExclusiveGateway): element_tag = "exclusiveGateway"
-        elif isinstance(task_or_event, BPMNIntimerEvent):
-            element_tag = "intermediateCatchEvent"
-            # intimer: needs additional timerEventDefinition child item
-            task_or_event_xml_element = ET.SubElement(parent_xml_element, f"{{{definition_attributes['xmlns:bpmn']}}}bpmn:{element_tag}", attributes)
-            timer_event_definition_attributes = {
-                "id": task_or_event.timer_event_definition_id
-            }
-            ET.SubElement(task_or_event_xml_element, f"{{{definition_attributes['xmlns:bpmn']}}}bpmn:timerEventDefinition", timer_event_definition_attributes)
-        elif isinstance(task_or_event, BPMNSubProcess):
-            element_tag = "subProcess"
-            # subprocess: create element, then recurse
-            task_or_event_xml_element = ET.SubElement(parent_xml_element, f"{{{definition_attributes['xmlns:bpmn']}}}bpmn:{element_tag}", attributes)
+        bpmn_type = element_type(task_or_event)
+        if bpmn_type is None:
+            continue
+        bpmn_namespace = definition_attributes['xmlns:bpmn']
+        task_or_event_xml_element = ET.SubElement(parent_xml_element, f"{{{bpmn_namespace}}}bpmn:{bpmn_type.bpmn_tag}", attributes)
+        # e.g. the timerEventDefinition of an intimer event
+        for child_tag, child_attributes in bpmn_type.child_elements(task_or_event):
+            ET.SubElement(task_or_event_xml_element, f"{{{bpmn_namespace}}}bpmn:{child_tag}", child_attributes)
+        if isinstance(task_or_event, BPMNSubProcess):
             _build_xml_for_container(task_or_event, task_or_event_xml_element, definition_attributes)
-        elif isinstance(task_or_event, BPMNTask): element_tag = "task"
-
-        # create XML element for task/event
-        if element_tag and not (isinstance(task_or_event, BPMNSubProcess) or isinstance(task_or_event, BPMNIntimerEvent)):
-            task_or_event_xml_element = ET.SubElement(parent_xml_element, f"{{{definition_attributes['xmlns:bpmn']}}}bpmn:{element_tag}", attributes)
 
         # add incoming/outgoing flow references to task/event
-        if task_or_event_xml_element is not None and isinstance(task_or_event, BPMNFlowElement):
+        if isinstance(task_or_event, BPMNFlowElement):
             for flow_id in task_or_event.incoming_flows:
                 ET.SubElement(task_or_event_xml_element, f"{{{definition_attributes['xmlns:bpmn']}}}bpmn:incoming").text = flow_id
             for flow_id in task_or_event.outgoing_flows:
@@ -78,19 +85,44 @@ def _build_xml_for_container(
             condition_expression_xml_element = ET.SubElement(sequence_flow_xml_element, f"{{{definition_attributes['xmlns:bpmn']}}}bpmn:conditionExpression", condition_expression_attributes)
             condition_expression_xml_element.text = sequence_flow.condition_expression
 
-def generate_bpmn_xml(bpmn_process: BPMNProcess):
-    # bpmn
-    bpmn_namespace = "http://www.omg.org/spec/BPMN/20100524/MODEL"
-    # bpmn diagram interchange
-    bpmn_di_namespace = "http://www.omg.org/spec/BPMN/20100524/DI"
-    # diagram common types
-    dc_namespace = "http://www.omg.org/spec/DD/20100524/DC"
-    # diagram interchange
-    di_namespace = "http://www.omg.org/spec/DD/20100524/DI"
-    # xml schema instance
-    xsi_namespace = "http://www.w3.org/2001/XMLSchema-instance"
-    # target namespace (bpmn)
-    target_namespace = "http://bpmn.io/schema/bpmn"
+def _diagram_attributes(layout: DiagramLayout):
+    """Yields ("shape" | "edge", element attributes, list of child attributes) for the BPMNDI part of the xml"""
+    for element_id, bounds in layout.shapes.items():
+        attributes = {"id": element_id + "_di", "bpmnElement": element_id}
+        if element_id in layout.expanded:
+            attributes["isExpanded"] = "true"
+        yield "shape", attributes, [{"x": str(bounds.x), "y": str(bounds.y),
+                                     "width": str(bounds.width), "height": str(bounds.height)}]
+    for flow_id, waypoints in layout.edges.items():
+        yield "edge", {"id": flow_id + "_di", "bpmnElement": flow_id}, [{"x": str(x), "y": str(y)} for x, y in waypoints]
+
+def _build_xml_for_diagram(bpmn_process: BPMNProcess, layout: DiagramLayout, parent_xml_element: ET.Element,
+                           definition_attributes: dict):
+    bpmn_namespace = definition_attributes['xmlns:bpmn']
+    diagram_xml_element = ET.SubElement(parent_xml_element, f"{{{bpmn_namespace}}}bpmndi:BPMNDiagram", {"id": DIAGRAM_ID})
+    plane_xml_element = ET.SubElement(diagram_xml_element, f"{{{bpmn_namespace}}}bpmndi:BPMNPlane",
+                                      {"id": PLANE_ID, "bpmnElement": bpmn_process.id})
+    for kind, attributes, children in _diagram_attributes(layout):
+        if kind == "shape":
+            shape_xml_element = ET.SubElement(plane_xml_element, f"{{{bpmn_namespace}}}bpmndi:BPMNShape", attributes)
+            ET.SubElement(shape_xml_element, f"{{{bpmn_namespace}}}dc:Bounds", children[0])
+        else:
+            edge_xml_element = ET.SubElement(plane_xml_element, f"{{{bpmn_namespace}}}bpmndi:BPMNEdge", attributes)
+            for waypoint in children:
+                ET.SubElement(edge_xml_element, f"{{{bpmn_namespace}}}di:waypoint", waypoint)
+
+def generate_bpmn_xml(bpmn_process: BPMNProcess, layout: DiagramLayout = None):
+    '''
+    :param bpmn_process: process to convert
+    :param layout: diagram of the process (see layout.layout_process). If None, no BPMNDI elements are written
+    :return: BPMN xml as string
+    '''
+    bpmn_namespace = BPMN_NAMESPACE
+    bpmn_di_namespace = BPMN_DI_NAMESPACE
+    dc_namespace = DC_NAMESPACE
+    di_namespace = DI_NAMESPACE
+    xsi_namespace = XSI_NAMESPACE
+    target_namespace = TARGET_NAMESPACE
 
     ET.register_namespace("", bpmn_namespace)
     ET.register_namespace("xsi", xsi_namespace)
@@ -119,6 +151,8 @@ def generate_bpmn_xml(bpmn_process: BPMNProcess):
     process_xml_element = ET.SubElement(definitions_xml_element, f"{{{bpmn_namespace}}}bpmn:process", process_attributes)
 
     _build_xml_for_container(bpmn_process, process_xml_element, definition_attributes)
+    if layout is not None:
+        _build_xml_for_diagram(bpmn_process, layout, definitions_xml_element, definition_attributes)
 
     # pretty print the xml
     try:
@@ -126,4 +160,258 @@ def generate_bpmn_xml(bpmn_process: BPMNProcess):
     except AttributeError:
         _indent_xml(definitions_xml_element) # Fallback for older python versions
 
-    return ET.tostring(definitions_xml_element, encoding="unicode", xml_declaration=True)
\ No newline at end of file
+    return ET.tostring(definitions_xml_element, encoding="unicode", xml_declaration=True)
+
+# --- Streaming Writer
+
+def _attributes(attributes: dict) -> str:
+    return "".join(f' {key}="{_escape_attrib(value)}"' for key, value in attributes.items())
+
+class _ChunkedWriter:
+    """Collects small strings and writes them to the stream in chunks"""
+    def __init__(self, stream, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.parts: list[str] = []
+        self.size = 0
+
+    def write(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.stream.write("".join(self.parts))
+            self.parts = []
+            self.size = 0
+
+def _has_condition_expression(container_object: BPMNProcess | BPMNSubProcess) -> bool:
+    containers = [container_object]
+    while containers:
+        container = containers.pop()
+        if any(sequence_flow.condition_expression for sequence_flow in container.sequence_flows):
+            return True
+        containers.extend(x for x in container.flow_elements if isinstance(x, BPMNSubProcess))
+    return False
+
+# values which are ids in the xml of a subprocess content. conditionExpression elements are matched first,
+# so their text is never taken for an id (attribute values can't contain '"', text can't contain '<')
+_FRAGMENT_ID_PATTERN = re.compile(
+    r'(<bpmn:conditionExpression[^>]*>[^<]*)'
+    r'|\b(id|name|sourceRef|targetRef)="([^"]*)"'
+    r'|<bpmn:(?:incoming|outgoing)>([^<]*)<'
+)
+
+def _fragment_parts(template, template_ids, level: int) -> tuple[list[str], list[tuple[int, bool]]] | None:
+    '''
+    Renders the content of a template subprocess and splits it at the ids
+
+    :param template_ids: all ids within the template content
+    :return: (parts with the unescaped template id at the id positions, (position, is attribute value) of the ids)
+        or None, if a name given in the yaml can't be told apart from an id
+    '''
+    buffer = io.StringIO()
+    exporter = BpmnXmlExporter(buffer, level=level)
+    walk_container(template.subprocess, [exporter])
+    exporter.writer.flush()
+    content = buffer.getvalue()
+
+    attribute_ids = {_escape_attrib(template_id): template_id for template_id in template_ids}
+    text_ids = {_escape_cdata(template_id): template_id for template_id in template_ids}
+    if any(_escape_attrib(name) in attribute_ids for name in template.explicit_names()):
+        return None
+
+    parts, slots = [], []
+    last_id = None
+    position = 0
+    for match in _FRAGMENT_ID_PATTERN.finditer(content):
+        condition, attribute, value, flow_id = match.groups()
+        if condition is not None:
+            continue
+        if attribute is None:
+            group, template_id, is_attribute = 4, text_ids.get(flow_id), False
+        else:
+            if attribute == "id":
+                last_id = value
+            elif attribute == "name" and value != last_id:
+                continue  # name given in the yaml or condition, kept as it is
+            group, template_id, is_attribute = 3, attribute_ids.get(value), True
+        if template_id is None:
+            continue
+        start, end = match.span(group)
+        parts.append(content[position:start])
+        slots.append((len(parts), is_attribute))
+        parts.append(template_id)
+        position = end
+    parts.append(content[position:])
+    return parts, slots
+
+def _stream_fragment(sub_process: BPMNSubProcess, writer: _ChunkedWriter, level: int, fragments: dict) -> bool:
+    '''
+    Writes the content of a subprocess instantiated from a fragment template (see fragments.py)
+    The template content is rendered once per level, every copy only replaces the ids in it
+
+    :param fragments: (id() of the template, level) -> result of _fragment_parts, filled while writing
+    :return: False if the content has to be written element by element
+    '''
+    template = sub_process.fragment
+    id_map = fragment_id_map(template, sub_process)
+    if id_map is None:
+        return False
+    key = (id(template), level)
+    if key not in fragments:
+        fragments[key] = _fragment_parts(template, id_map, level)
+    if fragments[key] is None:
+        return False
+    parts, slots = fragments[key]
+    parts = list(parts)
+    for slot, is_attribute in slots:
+        element_id = id_map[parts[slot]]
+        parts[slot] = _escape_attrib(element_id) if is_attribute else _escape_cdata(element_id)
+    writer.write("".join(parts))
+    return True
+
+class BpmnXmlExporter(ModelVisitor):
+    """Writes the BPMN xml of a process while it is walked (see exporters.walk_process), with the layout
+    as BPMNDI diagram if one is given. Subprocesses instantiated from a fragment template are written
+    from the rendered template, their content isn't walked."""
+    def __init__(self, stream, chunk_size: int = STREAM_CHUNK_SIZE, layout: DiagramLayout = None, level: int = 2):
+        self.writer = stream if isinstance(stream, _ChunkedWriter) else _ChunkedWriter(stream, chunk_size)
+        self.layout = layout
+        self.level = level  # indentation level of the direct elements of the walked container
+        self.fragments = {}  # see _stream_fragment
+        self._open_tags: list[str | None] = []  # tag of each entered element, None if it is closed already
+        self._process_open = False
+
+    def begin_process(self, bpmn_process: BPMNProcess):
+        writer = self.writer
+        # ElementTree declares the namespaces it uses in front of the attributes
+        namespace_declarations = {"xmlns": BPMN_NAMESPACE}
+        if _has_condition_expression(bpmn_process):
+            namespace_declarations["xmlns:xsi"] = XSI_NAMESPACE
+        definition_attributes = {
+            "xmlns:bpmn": BPMN_NAMESPACE,
+            "xmlns:bpmndi": BPMN_DI_NAMESPACE,
+            "xmlns:dc": DC_NAMESPACE,
+            "xmlns:di": DI_NAMESPACE,
+            "xmlns:xsi": XSI_NAMESPACE,
+            "targetNamespace": TARGET_NAMESPACE
+        }
+        process_attributes = {
+            "id": bpmn_process.id,
+            "name": bpmn_process.name,
+            "isExecutable": str(bpmn_process.is_executable).lower()
+        }
+
+        writer.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        writer.write(f"<bpmn:definitions{_attributes(namespace_declarations)}{_attributes(definition_attributes)}>")
+        writer.write(f"\n\t<bpmn:process{_attributes(process_attributes)}")
+        self._process_open = bool(bpmn_process.flow_elements or bpmn_process.sequence_flows)
+        writer.write(">" if self._process_open else " />")
+
+    def end_process(self, bpmn_process: BPMNProcess):
+        writer = self.writer
+        if self._process_open:
+            writer.write("\n\t</bpmn:process>")
+        if self.layout is not None:
+            _stream_diagram(bpmn_process, self.layout, writer)
+        writer.write("\n</bpmn:definitions>")
+        writer.flush()
+
+    def enter_element(self, element: BPMNFlowElement, depth: int):
+        bpmn_type = element_type(element)
+        if bpmn_type is None:
+            self._open_tags.append(None)
+            return
+        writer = self.writer
+        indent = "\n" + (self.level + depth) * "\t"
+        element_tag = bpmn_type.bpmn_tag
+        writer.write(f'{indent}<bpmn:{element_tag}{_attributes({"id": element.id, "name": element.name})}')
+
+        child_elements = bpmn_type.child_elements(element)
+        has_children = bool(child_elements or element.incoming_flows or element.outgoing_flows)
+        if isinstance(element, BPMNSubProcess):
+            has_children = has_children or bool(element.flow_elements or element.sequence_flows)
+        if not has_children:
+            writer.write(" />")
+            self._open_tags.append(None)
+            return
+        writer.write(">")
+        self._open_tags.append(element_tag)
+
+        # e.g. the timerEventDefinition of an intimer event
+        for child_tag, child_attributes in child_elements:
+            writer.write(f'{indent}\t<bpmn:{child_tag}{_attributes(child_attributes)} />')
+
+    def enter_subprocess(self, subprocess: BPMNSubProcess, depth: int) -> bool:
+        if self._open_tags[-1] is None:
+            return False  # closed already, or of an unknown type
+        if subprocess.fragment is not None and _stream_fragment(subprocess, self.writer, self.level + depth,
+                                                                 self.fragments):
+            return False
+        return True
+
+    def leave_element(self, element: BPMNFlowElement, depth: int):
+        element_tag = self._open_tags.pop()
+        if element_tag is None:
+            return
+        writer = self.writer
+        indent = "\n" + (self.level + depth) * "\t"
+        for flow_id in element.incoming_flows:
+            writer.write(f"{indent}\t<bpmn:incoming>{_escape_cdata(flow_id)}</bpmn:incoming>")
+        for flow_id in element.outgoing_flows:
+            writer.write(f"{indent}\t<bpmn:outgoing>{_escape_cdata(flow_id)}</bpmn:outgoing>")
+        writer.write(f"{indent}</bpmn:{element_tag}>")
+
+    def visit_flow(self, flow: BPMNSequenceFlow, container: BPMNProcess | BPMNSubProcess, depth: int):
+        indent = "\n" + (self.level + depth) * "\t"
+        attributes = _attributes({
+            "id": flow.id,
+            "name": flow.name,
+            "sourceRef": flow.source_ref,
+            "targetRef": flow.target_ref
+        })
+        if not flow.condition_expression:
+            self.writer.write(f"{indent}<bpmn:sequenceFlow{attributes} />")
+            return
+        self.writer.write(
+            f"{indent}<bpmn:sequenceFlow{attributes}>"
+            f'{indent}\t<bpmn:conditionExpression xsi:type="tFormalExpression">'
+            f"{_escape_cdata(flow.condition_expression)}</bpmn:conditionExpression>"
+            f"{indent}</bpmn:sequenceFlow>"
+        )
+
+def _stream_diagram(bpmn_process: BPMNProcess, layout: DiagramLayout, writer: _ChunkedWriter):
+    writer.write(f"\n\t<bpmndi:BPMNDiagram{_attributes({'id': DIAGRAM_ID})}>")
+    plane_attributes = _attributes({"id": PLANE_ID, "bpmnElement": bpmn_process.id})
+    if not layout.shapes and not layout.edges:
+        writer.write(f"\n\t\t<bpmndi:BPMNPlane{plane_attributes} />\n\t</bpmndi:BPMNDiagram>")
+        return
+    writer.write(f"\n\t\t<bpmndi:BPMNPlane{plane_attributes}>")
+    for kind, attributes, children in _diagram_attributes(layout):
+        if kind == "shape":
+            writer.write(f"\n\t\t\t<bpmndi:BPMNShape{_attributes(attributes)}>"
+                         f"\n\t\t\t\t<dc:Bounds{_attributes(children[0])} />"
+                         "\n\t\t\t</bpmndi:BPMNShape>")
+        elif children:
+            writer.write(f"\n\t\t\t<bpmndi:BPMNEdge{_attributes(attributes)}>")
+            for waypoint in children:
+                writer.write(f"\n\t\t\t\t<di:waypoint{_attributes(waypoint)} />")
+            writer.write("\n\t\t\t</bpmndi:BPMNEdge>")
+        else:
+            writer.write(f"\n\t\t\t<bpmndi:BPMNEdge{_attributes(attributes)} />")
+    writer.write("\n\t\t</bpmndi:BPMNPlane>\n\t</bpmndi:BPMNDiagram>")
+
+def write_bpmn_xml(bpmn_process: BPMNProcess, stream, chunk_size: int = STREAM_CHUNK_SIZE, layout: DiagramLayout = None):
+    '''
+    Writes the BPMN xml of a process to a text stream, without building an ElementTree first.
+    The output is identical to generate_bpmn_xml, but only chunk_size characters are held in memory.
+
+    :param bpmn_process: process to write
+    :param stream: file-like object opened in text mode
+    :param chunk_size: number of characters collected before they are written to the stream
+    :param layout: diagram of the process (see layout.layout_process). If None, no BPMNDI elements are written
+    '''
+    walk_process(bpmn_process, [BpmnXmlExporter(stream, chunk_size, layout)])
@@ -0,0 +1,158 @@
+import io
+import os
+import sys
+import pickle
+import marshal
+import hashlib
+import threading
+
+# --- YAML Loading
+
+# yaml is imported on first use, runs which don't parse any file (e.g. --help, all outputs up to date)
+# don't pay for the import
+_safe_loader = None
+
+def _get_safe_loader():
+    global _safe_loader
+    if _safe_loader is None:
+        # use the libyaml based loader if pyyaml has been built with libyaml, it's several times faster
+        try:
+            from yaml import CSafeLoader as SafeLoader
+        except ImportError:
+            from yaml import SafeLoader
+        _safe_loader = SafeLoader
+    return _safe_loader
+
+def libyaml_available() -> bool:
+    import yaml
+    return _get_safe_loader() is not yaml.SafeLoader
+
+CACHE_VERSION = 1
+
+class YamlLoadError(Exception):
+    """Raised if a yaml file can't be read or parsed"""
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+        self.message = message
+
+def parse_yaml(content: bytes, name: str = None):
+    stream = io.BytesIO(content)
+    stream.name = name  # used by the parser in error messages
+    import yaml
+    return yaml.load(stream, Loader=_get_safe_loader())
+
+def _serialize(data) -> bytes:
+    # marshal is the fastest format for plain dicts, lists and scalars. Documents containing
+    # other types (e.g. dates) are stored with pickle
+    try:
+        return b"M" + marshal.dumps(data)
+    except ValueError:
+        return b"P" + pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _deserialize(content: bytes):
+    if content[:1] == b"M":
+        return marshal.loads(content[1:])
+    return pickle.loads(content[1:])
+
+class ParsedYamlCache:
+    """Persistent cache of parsed yaml documents
+
+    Every yaml file gets one cache file, named after the hash of its path. The cache file stores
+    mtime, size and content hash of the yaml file next to the parsed document. If mtime and size
+    still match, the document is used without reading the yaml file. Otherwise the content hash
+    is compared, so files which have only been touched (e.g. by a fresh checkout) don't need to be parsed again.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        # marshal data is only compatible between identical python versions
+        self._key_prefix = f"{CACHE_VERSION}-{sys.version_info[0]}.{sys.version_info[1]}-"
+
+    def _cache_file(self, path: str) -> str:
+        key = hashlib.sha256((self._key_prefix + os.path.abspath(path)).encode()).hexdigest()
+        return os.path.join(self.directory, key + ".cache")
+
+    def get(self, path: str, stat_result: os.stat_result, read_content):
+        '''
+        :param path: path of the yaml file
+        :param stat_result: current stat result of the yaml file
+        :param read_content: function returning the content of the yaml file, only called if mtime or size changed
+        :return: (found, data, content hash). found is False if the file has to be parsed
+        '''
+        try:
+            with open(self._cache_file(path), "rb") as f:
+                mtime_ns, size, content_hash, serialized = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return False, None, None
+        if mtime_ns != stat_result.st_mtime_ns or size != stat_result.st_size:
+            current_hash = hashlib.sha256(read_content()).hexdigest()
+            if current_hash != content_hash:
+                return False, None, current_hash
+            self.put(path, stat_result, current_hash, serialized=serialized)
+        try:
+            return True, _deserialize(serialized), content_hash
+        except (ValueError, EOFError, TypeError, pickle.UnpicklingError):
+            return False, None, None
+
+    def put(self, path: str, stat_result: os.stat_result, content_hash: str, data=None, serialized: bytes = None):
+        if serialized is None:
+            serialized = _serialize(data)
+        cache_file = self._cache_file(path)
+        # write into a temporary file first, so concurrent readers never see partial cache files.
+        # The name is unique per thread, the prefetching readers of the pipeline may store the same file
+        temporary_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary_file, "wb") as f:
+                marshal.dump((stat_result.st_mtime_ns, stat_result.st_size, content_hash, serialized), f)
+            os.replace(temporary_file, cache_file)
+        except OSError:
+            pass  # the cache is only an optimization, a failed write means the file is parsed again next time
+
+class YamlLoader:
+    """Loads yaml files with libyaml (if available) and an optional persistent cache of parsed documents"""
+    def __init__(self, cache_directory: str = None):
+        self.cache = ParsedYamlCache(cache_directory) if cache_directory else None
+        self.parsed: int = 0
+        self.cache_hits: int = 0
+
+    def load(self, path: str):
+        '''
+        :param path: a yaml file
+        :return: data structure of dicts and lists representing the yaml content
+        :raises YamlLoadError: if the file can't be read or isn't valid yaml
+        '''
+        content = None
+        def read_content():
+            nonlocal content
+            if content is None:
+                with open(path, "rb") as f:
+                    content = f.read()
+            return content
+
+        try:
+            if self.cache is None:
+                return self._parse(path, read_content())
+            stat_result = os.stat(path)
+            found, data, content_hash = self.cache.get(path, stat_result, read_content)
+            if found:
+                self.cache_hits += 1
+                return data
+            data = self._parse(path, read_content())
+            if content_hash is None:
+                content_hash = hashlib.sha256(content).hexdigest()
+            self.cache.put(path, stat_result, content_hash, data)
+            return data
+        except OSError as exc:
+            raise YamlLoadError(path, exc.strerror or str(exc)) from exc
+
+    def _parse(self, path: str, content: bytes):
+        import yaml
+        self.parsed += 1
+        try:
+            return parse_yaml(content, path)
+        except yaml.YAMLError as exc:
+            raise YamlLoadError(path, str(exc)) from exc
+
+    def stats(self) -> dict[str, int]:
+        return {"parsed": self.parsed, "cache_hits": self.cache_hits}
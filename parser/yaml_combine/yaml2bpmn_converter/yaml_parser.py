@@ -1,32 +1,67 @@
-from .bpmn_object_models import *
+import logging
 
-# global counter for flow ids per playbook
-_flow_id_counter = 0
-_start_event_id_counter = 0
-_end_event_id_counter = 0
-_timer_event_definition_id_counter = 0
-
-def _generate_sequence_flow_id() -> str:
-    global _flow_id_counter
-    _flow_id_counter += 1
-    return f"sequenceFlow_{_flow_id_counter}"
-
-def _generate_start_event_id() -> str:
-    global _start_event_id_counter
-    _start_event_id_counter += 1
-    return f"startEvent_{_start_event_id_counter}"
-
-def _generate_end_event_id() -> str:
-    global _end_event_id_counter
-    _end_event_id_counter += 1
-    return f"endEvent_{_end_event_id_counter}"
-
-def _generate_timer_event_definition_id() -> str:
-    global _timer_event_definition_id_counter
-    _timer_event_definition_id_counter += 1
-    return f"timerEventDefinition_{_timer_event_definition_id_counter}"
-
-def _add_implicit_start_end_events(bpmn_process_object: BPMNProcess | BPMNSubProcess):
+from .bpmn_object_models import *
+from .activity_types import ACTIVITY_TYPES, DEFAULT_ACTIVITY_TYPE, element_type
+from .fragments import FragmentTemplate, fingerprint_fragments, instantiate_fragment
+
+logger = logging.getLogger(__name__)
+
+class ConversionContext:
+    """Holds the id counters of one playbook conversion
+
+    Every playbook gets its own context, so the generated ids only depend on the playbook itself
+    and playbooks can be converted independently (e.g. in parallel worker processes).
+    It also holds the converted subprocess fragments of the playbook (see fragments.py).
+    """
+    def __init__(self, memoize_fragments: bool = True):
+        self.activity_counter = 0
+        self.flow_id_counter = 0
+        self.start_event_id_counter = 0
+        self.end_event_id_counter = 0
+        self.event_definition_id_counters: dict[str, int] = {}  # definition tag -> number of generated ids
+        self.memoize_fragments = memoize_fragments
+        self.fragment_numbers: dict[int, int] = {}  # id() of an activities block -> fragment number
+        self.fragments: dict[int, FragmentTemplate] = {}  # fragment number -> template
+        self.fragment_copies = 0  # number of subprocesses instantiated from a template
+
+    def counters(self) -> tuple:
+        return (self.flow_id_counter, self.start_event_id_counter, self.end_event_id_counter,
+                dict(self.event_definition_id_counters))
+
+    def advance_counters(self, counters_before: tuple, counters_after: tuple):
+        '''Advances the counters as if the ids between the two counter states had been generated again'''
+        self.flow_id_counter += counters_after[0] - counters_before[0]
+        self.start_event_id_counter += counters_after[1] - counters_before[1]
+        self.end_event_id_counter += counters_after[2] - counters_before[2]
+        for tag, counter in counters_after[3].items():
+            self.event_definition_id_counters[tag] = (self.event_definition_id_counters.get(tag, 0)
+                                                      + counter - counters_before[3].get(tag, 0))
+
+    def next_activity_number(self) -> int:
+        self.activity_counter += 1
+        return self.activity_counter
+
+    def generate_sequence_flow_id(self) -> str:
+        self.flow_id_counter += 1
+        return f"sequenceFlow_{self.flow_id_counter}"
+
+    def generate_start_event_id(self) -> str:
+        self.start_event_id_counter += 1
+        return f"startEvent_{self.start_event_id_counter}"
+
+    def generate_end_event_id(self) -> str:
+        self.end_event_id_counter += 1
+        return f"endEvent_{self.end_event_id_counter}"
+
+    def generate_event_definition_id(self, definition_tag: str) -> str:
+        counter = self.event_definition_id_counters.get(definition_tag, 0) + 1
+        self.event_definition_id_counters[definition_tag] = counter
+        return f"{definition_tag}_{counter}"
+
+    def generate_timer_event_definition_id(self) -> str:
+        return self.generate_event_definition_id("timerEventDefinition")
+
+def _add_implicit_start_end_events(bpmn_process_object: BPMNProcess | BPMNSubProcess, context: ConversionContext):
     # remove any pre-existing start and end events
     bpmn_process_object.clean_start_end_events()
 
@@ -37,7 +72,7 @@ def _add_implicit_start_end_events(bpmn_process_object: BPMNProcess | BPMNSubPro
             start_event = BPMNStartEvent(id=f"{bpmn_process_object.id}_start")
             end_event = BPMNEndEvent(id=f"{bpmn_process_object.id}_end")
             start_end_flow = BPMNSequenceFlow(
-                id=_generate_sequence_flow_id(),
+                id=context.generate_sequence_flow_id(),
                 source_ref=start_event.id,
                 target_ref=end_event.id
             )
@@ -59,7 +94,7 @@ def _add_implicit_start_end_events(bpmn_process_object: BPMNProcess | BPMNSubPro
     ]
 
     # add start event and all necessary sequence flows
-    start_event_id = _generate_start_event_id()
+    start_event_id = context.generate_start_event_id()
     start_event = BPMNStartEvent(id=start_event_id)
 
     if not tasks_with_no_incoming: # all nodes have incoming -> connect to the first one
@@ -68,7 +103,7 @@ def _add_implicit_start_end_events(bpmn_process_object: BPMNProcess | BPMNSubPro
         tasks_to_connect_start = tasks_with_no_incoming
 
     for task in tasks_to_connect_start:
-        flow_id = _generate_sequence_flow_id()
+        flow_id = context.generate_sequence_flow_id()
         sequence_flow = BPMNSequenceFlow(
             id=flow_id,
             source_ref=start_event.id,
@@ -88,9 +123,9 @@ def _add_implicit_start_end_events(bpmn_process_object: BPMNProcess | BPMNSubPro
         tasks_to_connect_end = tasks_with_no_outgoing
 
     for task in tasks_to_connect_end:
-        end_event_id = _generate_end_event_id()
+        end_event_id = context.generate_end_event_id()
         end_event = BPMNEndEvent(id=end_event_id)
-        flow_id = _generate_sequence_flow_id()
+        flow_id = context.generate_sequence_flow_id()
         sequence_flow = BPMNSequenceFlow(
             id=flow_id,
             source_ref=task.id,
@@ -102,11 +137,10 @@ def _add_implicit_start_end_events(bpmn_process_object: BPMNProcess | BPMNSubPro
         bpmn_process_object.add_end_event(end_event)
         bpmn_process_object.add_flow_element(end_event)
 
-def _parse_activities_recursive(activities: dict) -> tuple[list[BPMNFlowElement], list[BPMNSequenceFlow]]:
-    flow_elements: list[BPMNFlowElement] = []
+def _parse_activities_recursive(activities: dict, context: ConversionContext) -> tuple[IndexedList, list[BPMNSequenceFlow]]:
+    # flow elements indexed by id, for getting the flow element of a goto target
+    flow_elements: IndexedList = IndexedList.by_id()
     sequence_flows: list[BPMNSequenceFlow] = []
-    # map for getting the flow element by its id
-    task_map: dict[str, BPMNFlowElement] = {}
 
     ## looping twice over the activities
     ### first loop: getting tasks
@@ -114,64 +148,85 @@ def _parse_activities_recursive(activities: dict) -> tuple[list[BPMNFlowElement]
         name = activity_data.get("name", activity_id)
         activity_type = activity_data.get("type")
 
-        bpmn_task: BPMNTask = None
-
-        if activity_type == "human":
-            bpmn_task = BPMNUserTask(id=activity_id, name=name)
-        elif activity_type == "send":
-            bpmn_task = BPMNSendTask(id=activity_id, name=name)
-        elif activity_type == "manual":
-            bpmn_task = BPMNManualTask(id=activity_id, name=name)
-        elif activity_type == "intimer":
-            timer_event_definition_id = _generate_timer_event_definition_id()
-            bpmn_task = BPMNIntimerEvent(id=activity_id, name=name, timer_event_definition_id=timer_event_definition_id)
-        elif activity_type == "xgw":
-            bpmn_task = BPMNExclusiveGateway(id=activity_id, name=name)
-        elif activity_type == "sub":
+        # one dictionary lookup instead of comparing the type code with every known type
+        bpmn_type = ACTIVITY_TYPES.get(activity_type) if isinstance(activity_type, str) else None
+        if bpmn_type is None:
+            # fallback to generic task and log state of an unknown activity type
+            logger.warning("Unknown activity type: %s for id %s", activity_type, activity_id)
+            bpmn_type = DEFAULT_ACTIVITY_TYPE
+
+        if bpmn_type.model_class is BPMNSubProcess:
             sub_process = BPMNSubProcess(id=activity_id, name=name)
             inner_activities = activity_data.get("activities", {})
-            inner_flow_elements, inner_sequence_flows = _parse_activities_recursive(
-                inner_activities
-            )
-            sub_process.flow_elements = inner_flow_elements
-            sub_process.sequence_flows = inner_sequence_flows
-
-            _add_implicit_start_end_events(sub_process)
+            fragment_number = context.fragment_numbers.get(id(inner_activities))
+            template = context.fragments.get(fragment_number)
+            if template is not None:
+                # same structure as an already converted subprocess: copy it instead of converting it again
+                instantiate_fragment(template, sub_process, inner_activities, context.counters())
+                context.advance_counters(template.counters_before, template.counters_after)
+                context.fragment_copies += 1
+                sub_process.fragment = template
+            else:
+                counters_before = context.counters()
+                inner_flow_elements, inner_sequence_flows = _parse_activities_recursive(
+                    inner_activities, context
+                )
+                sub_process.flow_elements = inner_flow_elements
+                sub_process.sequence_flows = inner_sequence_flows
+
+                _add_implicit_start_end_events(sub_process, context)
+                if fragment_number is not None:
+                    context.fragments[fragment_number] = FragmentTemplate(sub_process, inner_activities,
+                                                                          counters_before, context.counters())
             bpmn_task = sub_process
+        elif bpmn_type.definition_tag:
+            event_definition_id = context.generate_event_definition_id(bpmn_type.definition_tag)
+            bpmn_task = bpmn_type.model_class(activity_id, name, event_definition_id)
         else:
-            # fallback to generic task and log state of an unknown activity type
-            print(f"Unknown activity type: {activity_type} for id {activity_id}")
-            bpmn_task = BPMNTask(id=activity_id, name=name)
+            bpmn_task = bpmn_type.model_class(id=activity_id, name=name)
 
         if bpmn_task:
-            flow_elements.append(bpmn_task)
-            task_map[activity_id] = bpmn_task
+            flow_elements.add(bpmn_task)
 
     ### second loop: getting sequence_flows
     for activity_id, activity_data in activities.items():
-        source_task = task_map.get(activity_id)
+        source_task = flow_elements.get(activity_id)
 
         if not source_task:
             # this shouldn't happen, but just in case
-            print(f"Source task for flow {activity_id} not found")
+            logger.warning("Source task for flow %s not found", activity_id)
             continue
 
         goto_data = activity_data.get("goto")
-        target_tasks: list[tuple[BPMNFlowElement, str | None]] = []  # >1 if conditional, only 1 if not
+        target_tasks: list[tuple[BPMNFlowElement, str | None]] = []  # >1 if branching, only 1 if not
+        conditional = True  # whether conditions become condition expressions of the flows
         if isinstance(goto_data, str):  # direct flow
-            target_tasks.append((task_map.get(goto_data), None))
-        elif isinstance(goto_data, list):  # conditional flow
-            if not isinstance(source_task, BPMNExclusiveGateway):
-                print(f"Warning: found 'goto' list for non-exclusive gateway {source_task.id}")
+            target_tasks.append((flow_elements.get(goto_data), None))
+        elif isinstance(goto_data, list):  # branches of a gateway
+            source_type = element_type(source_task)
+            if source_type is None or source_type.object_type != "gateway":
+                logger.warning("found 'goto' list for non-gateway %s", source_task.id)
                 continue
+            # branches of exclusive and inclusive gateways need a condition,
+            # the branches of parallel gateways are always taken ("if" is only used as name)
+            conditional = not isinstance(source_task, BPMNParallelGateway)
             for condition_item in goto_data:
-                condition_if = condition_item.get("if")
-                condition_target = condition_item.get("then")
-                if condition_if and condition_target:
-                    target_tasks.append((task_map.get(condition_target), condition_if))
+                if isinstance(condition_item, str) and not conditional:
+                    condition_if, condition_target = None, condition_item
+                elif isinstance(condition_item, dict):
+                    condition_if = condition_item.get("if")
+                    condition_target = condition_item.get("then")
+                else:
+                    continue
+                if condition_target and (condition_if or not conditional):
+                    target_tasks.append((flow_elements.get(condition_target), condition_if))
 
         for target_task, condition in target_tasks:
-            flow_id = _generate_sequence_flow_id()
+            if target_task is None:
+                # dangling goto target, reported by the validator before the conversion
+                logger.warning("goto target of %s not found, the flow is skipped", source_task.id)
+                continue
+            flow_id = context.generate_sequence_flow_id()
             flow_name = None
             if condition and len(condition) < 50:  # use condition as name if short enough
                 flow_name = condition
@@ -180,7 +235,7 @@ def _parse_activities_recursive(activities: dict) -> tuple[list[BPMNFlowElement]
                 source_ref=source_task.id,
                 target_ref=target_task.id,
                 name=flow_name,
-                condition_expression=condition
+                condition_expression=condition if conditional else None
             )
             sequence_flows.append(sequence_flow)
             source_task.add_outgoing_flow(flow_id)
@@ -188,29 +243,28 @@ def _parse_activities_recursive(activities: dict) -> tuple[list[BPMNFlowElement]
 
     return flow_elements, sequence_flows
 
-def parse_playbook_to_bpmn_representation(playbook_yaml: dict) -> BPMNProcess:
+def parse_playbook_to_bpmn_representation(playbook_yaml: dict, context: ConversionContext = None) -> BPMNProcess:
     process_id_from_yaml = playbook_yaml.get("process", "DefaultPlaybookProcess")
 
     bpmn_process = BPMNProcess(id=process_id_from_yaml, name=process_id_from_yaml)
 
-    # reset counter to 0 for each processed playbook
-    global _flow_id_counter, _start_event_id_counter, _end_event_id_counter, _timer_event_definition_id_counter
-    _flow_id_counter = 0
-    _start_event_id_counter = 0
-    _end_event_id_counter = 0
-    _timer_event_definition_id_counter = 0
+    # counters start at 0 for each processed playbook
+    if context is None:
+        context = ConversionContext()
 
     top_level_activities = playbook_yaml.get("activities", {})
+    if context.memoize_fragments:
+        context.fragment_numbers = fingerprint_fragments(top_level_activities)
     flow_elements, sequence_flows = _parse_activities_recursive(
-        activities=top_level_activities
+        activities=top_level_activities, context=context
     )
 
     for flow_element in flow_elements:
         bpmn_process.add_flow_element(element=flow_element)
 
     for sequence_flow in sequence_flows:
-        bpmn_process.add_sequence_flow(element=sequence_flow)
+        bpmn_process.add_sequence_flow(flow=sequence_flow)
 
-    _add_implicit_start_end_events(bpmn_process_object=bpmn_process)
+    _add_implicit_start_end_events(bpmn_process_object=bpmn_process, context=context)
 
     return bpmn_process